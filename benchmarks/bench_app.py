@@ -0,0 +1,104 @@
+from pathlib import Path
+from datetime import datetime
+import json
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+
+from escore.io import load_survey_ds
+from escore.registry import ROIRegistry, add_new_roi
+from escore.apps.echotypes.app import create_app
+
+from .common import SIZES, SURVEY, write_survey, load_config, make_shapes
+
+
+def get_callback(app, output_id):
+    """Undecorated function of the Dash callback with a given first output."""
+    for key, callback in app.callback_map.items():
+        if key.strip(".").startswith(output_id):
+            return callback["callback"].__wrapped__
+    raise KeyError(output_id)
+
+
+def set_triggered(*prop_ids):
+    """Callback context of a call triggered by changes of prop_ids (none: initial call)."""
+    context_value.set(AttributeDict(triggered_inputs=[{"prop_id": prop_id, "value": None} for prop_id in prop_ids]))
+
+
+RGB_CONTEXT = dict(db_range=[-90, -50], mask_alpha_in=0., mask_alpha_out=0.5, type="ROI mask in context", win_esdu=400, win_depth=300)
+RGB_DATA_ONLY = dict(RGB_CONTEXT, mask_alpha_in=0.3, mask_alpha_out=1., type="ROI data only")
+CLUSTERING = dict(n_clusters=3, frequencies=[38., 70., 120., 200.], method="KMeans", features="Delta Sv", dropout_depths=[None] * 4)
+
+
+class Callbacks:
+    """Dash callbacks of the echotypes app, called directly (no server round-trip)."""
+    params = SIZES
+    param_names = ["n_time"]
+    timeout = 600
+
+    def setup_cache(self):
+        root = Path("surveys").resolve()
+        for n_time in SIZES:
+            data_dir = root / str(n_time)
+            write_survey(data_dir, n_time)
+
+            now = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+            with ROIRegistry(data_dir / "registry.db", data_dir) as registry:
+                with registry.conn:
+                    for shape in make_shapes(n_time, n_shapes=5):
+                        add_new_roi(registry.conn, dict(shape, shape_type="polygon"), "bench.png", 0, now)
+        return str(root)
+
+    def setup(self, root, n_time):
+        data_dir = Path(root) / str(n_time)
+        sv = load_survey_ds(SURVEY, load_config(data_dir))["Sv"]
+        self.roi_id = make_shapes(n_time, n_shapes=5)[0]["id"]
+
+        self.app = create_app(sv, data_dir / "registry.db", data_dir, [self.roi_id], app_config={"fit_sample_size": 50_000})
+        self.update_roi_views = get_callback(self.app, "rgb-plot-fig")
+
+        set_triggered()
+        self.summary_payload = self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, None)["summary"]
+
+    def time_roi_selection(self, root, n_time):
+        set_triggered("dropdown-roi-selection.value")
+        self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, self.summary_payload)
+
+    def time_rgb_fig_context(self, root, n_time):
+        set_triggered("dd-visual-type.value")
+        self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, self.summary_payload)
+
+    def time_rgb_contrast_patch(self, root, n_time):
+        set_triggered("db-slider.value")
+        self.update_roi_views(self.roi_id, dict(RGB_CONTEXT, db_range=[-85, -55]), CLUSTERING, 1, self.summary_payload)
+
+    def time_rgb_alpha_patch(self, root, n_time):
+        set_triggered("input-alpha-out.value")
+        self.update_roi_views(self.roi_id, dict(RGB_CONTEXT, mask_alpha_out=0.2), CLUSTERING, 1, self.summary_payload)
+
+    def time_rgb_fig_data_only(self, root, n_time):
+        set_triggered("dd-visual-type.value")
+        self.update_roi_views(self.roi_id, RGB_DATA_ONLY, CLUSTERING, 1, self.summary_payload)
+
+    def time_clustering_fig(self, root, n_time):
+        set_triggered("input-k.value")
+        self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, self.summary_payload)
+
+    def time_valid_fig(self, root, n_time):
+        set_triggered("dropdown-cluster-id.value")
+        self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, self.summary_payload)
+
+    def track_rgb_fig_json_size(self, root, n_time):
+        set_triggered("dd-visual-type.value")
+        fig = self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, self.summary_payload)["rgb_fig"]
+        return len(fig.to_json())
+
+    track_rgb_fig_json_size.unit = "bytes"
+
+    def track_rgb_patch_json_size(self, root, n_time):
+        set_triggered("db-slider.value")
+        patch = self.update_roi_views(self.roi_id, RGB_CONTEXT, CLUSTERING, 1, self.summary_payload)["rgb_fig"]
+        return len(json.dumps(patch.to_plotly_json(), cls=PlotlyJSONEncoder))
+
+    track_rgb_patch_json_size.unit = "bytes"
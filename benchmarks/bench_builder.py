@@ -0,0 +1,61 @@
+from pathlib import Path
+import time
+
+from escore.io import load_survey_ds
+from escore import synthetic
+from escore.builder import plot_survey_RGB, encode_frame, image_save_kwargs
+from escore.execution import ExecutionConfig
+
+from .common import SIZES, SURVEY, N_DEPTH, write_survey, load_config
+
+
+class PlotSurveyRGB:
+    """Builder throughput, reported per frame of 1000 ESDUs."""
+    params = (SIZES, ["RGB", "Greys_r"], ["batched", "pipelined"])
+    param_names = ["n_time", "echogram_cmap", "mode"]
+    timeout = 1200
+    frame_size = 1000
+
+    def setup_cache(self):
+        root = Path("surveys").resolve()
+        for n_time in SIZES:
+            write_survey(root / str(n_time), n_time)
+        return str(root)
+
+    def setup(self, root, n_time, echogram_cmap, mode):
+        self.sv = load_survey_ds(SURVEY, load_config(Path(root) / str(n_time)))["Sv"]
+        self.out_dir = Path(root) / "images" / f"{n_time}_{echogram_cmap}"
+        self.channels = (38., 70., 120.) if echogram_cmap == "RGB" else 38
+        self.execution_config = ExecutionConfig(prefetch_frames=4 if mode == "pipelined" else 0)
+
+    def track_time_per_frame(self, root, n_time, echogram_cmap, mode):
+        t0 = time.perf_counter()
+        plot_survey_RGB(self.sv, self.frame_size, 0, -1, -90., -50., self.channels, echogram_cmap, self.out_dir, SURVEY,
+                        execution_config=self.execution_config)
+        return (time.perf_counter() - t0) / -(-n_time // self.frame_size)
+
+    track_time_per_frame.unit = "seconds"
+
+
+
+class EncodeFrame:
+    """Encoding of one RGB frame of 10000 ESDUs: time and encoded size per format and compression setting."""
+    params = [["png", "png_fast", "png_9", "webp", "webp_fast", "raw"]]
+    param_names = ["encoding"]
+
+    def setup(self, encoding):
+        cfg = synthetic.SyntheticSurveyConfig(n_time=10_000, n_depth=N_DEPTH)
+        self.sv_array = synthetic.synthetic_sv_block(cfg, 0, 10_000)[:3]
+        image_format, _, option = encoding.partition("_")
+        self.image_format = image_format
+        self.save_kwargs = None if image_format == "raw" else image_save_kwargs(
+            image_format, compress_level=int(option) if option.isdigit() else None, fast_encode=(option == "fast"))
+
+    def time_encode_frame(self, encoding):
+        encode_frame(self.sv_array, -90., -50., "RGB", self.image_format, self.save_kwargs)
+
+    def track_encoded_size(self, encoding):
+        frame = encode_frame(self.sv_array, -90., -50., "RGB", self.image_format, self.save_kwargs)
+        return len(frame) if isinstance(frame, bytes) else frame.nbytes
+
+    track_encoded_size.unit = "bytes"
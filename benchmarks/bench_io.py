@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import numpy as np
+
+from escore.io import load_survey_ds, get_time_index
+
+from .common import SIZES, SURVEY, write_survey, load_config
+
+
+class LoadSurvey:
+    params = SIZES
+    param_names = ["n_time"]
+    timeout = 600
+
+    def setup_cache(self):
+        root = Path("surveys").resolve()
+        for n_time in SIZES:
+            write_survey(root / str(n_time), n_time)
+        return str(root)
+
+    def setup(self, root, n_time):
+        self.config = load_config(Path(root) / str(n_time))
+        self.sv = load_survey_ds(SURVEY, self.config)["Sv"]
+        self.times = self.sv["time"].values[::max(n_time // 1000, 1)]
+        self.time_index = get_time_index(SURVEY, self.config)
+
+    def time_load_survey_ds(self, root, n_time):
+        load_survey_ds(SURVEY, self.config)
+
+    def time_read_window(self, root, n_time):
+        self.sv.isel(time=slice(n_time // 2, n_time // 2 + 1000)).values
+
+    def time_time_index_lookup(self, root, n_time):
+        self.time_index.get_idx(self.times)
+
+    def peakmem_load_survey_ds(self, root, n_time):
+        load_survey_ds(SURVEY, self.config)
@@ -0,0 +1,122 @@
+from pathlib import Path
+import numpy as np
+import xarray as xr
+
+from escore.io import load_survey_ds
+from escore.apps.echotypes.processing import (
+    get_window, get_windows, get_mask, get_roi_Sv, compute_delta_sv, stack_pixels, cluster_roi, extract_patches
+)
+
+from .common import SIZES, SURVEY, N_DEPTH, write_survey, load_config, make_shapes
+
+
+class WindowAndMask:
+    params = [10, 100, 1000]
+    param_names = ["n_shapes"]
+
+    def setup(self, n_shapes):
+        self.shapes = make_shapes(100_000, n_shapes=n_shapes)
+
+    def time_get_window_padding(self, n_shapes):
+        for s in self.shapes:
+            get_window((s["it_min"], s["it_max"], s["iz_min"], s["iz_max"]), (100_000, N_DEPTH), padding=10)
+
+    def time_get_window_shape(self, n_shapes):
+        for s in self.shapes:
+            get_window((s["it_min"], s["it_max"], s["iz_min"], s["iz_max"]), (100_000, N_DEPTH), window_shape=(400, 300))
+
+    def time_get_windows_shape(self, n_shapes):
+        bboxes = [(s["it_min"], s["it_max"], s["iz_min"], s["iz_max"]) for s in self.shapes]
+        get_windows(bboxes, (100_000, N_DEPTH), window_shape=(400, 300))
+
+    def time_get_mask(self, n_shapes):
+        for s in self.shapes:
+            get_mask((s["it_min"], s["it_max"], s["iz_min"], s["iz_max"]), s["points"])
+
+
+class RoiSv:
+    params = SIZES
+    param_names = ["n_time"]
+    timeout = 600
+
+    def setup_cache(self):
+        root = Path("surveys").resolve()
+        for n_time in SIZES:
+            write_survey(root / str(n_time), n_time)
+        return str(root)
+
+    def setup(self, root, n_time):
+        self.sv = load_survey_ds(SURVEY, load_config(Path(root) / str(n_time)))["Sv"]
+        self.shape = make_shapes(n_time, n_shapes=1)[0]
+
+    def time_get_roi_Sv(self, root, n_time):
+        get_roi_Sv(self.sv, self.shape).values
+
+
+class Patches:
+    """Fixed-size patches of 100 ROIs, read in grouped slices or one window at a time."""
+    params = SIZES
+    param_names = ["n_time"]
+    timeout = 600
+
+    def setup_cache(self):
+        root = Path("surveys").resolve()
+        for n_time in SIZES:
+            write_survey(root / str(n_time), n_time)
+        return str(root)
+
+    def setup(self, root, n_time):
+        self.sv = load_survey_ds(SURVEY, load_config(Path(root) / str(n_time)))["Sv"]
+        shapes = make_shapes(n_time, n_shapes=100)
+        bboxes = [(s["it_min"], s["it_max"], s["iz_min"], s["iz_max"]) for s in shapes]
+        self.windows = get_windows(bboxes, (n_time, N_DEPTH), window_shape=(256, 128))
+
+    def time_extract_patches(self, root, n_time):
+        extract_patches(self.sv, self.windows)
+
+    def time_extract_patches_loop(self, root, n_time):
+        for w in self.windows:
+            extract_patches(self.sv, w[None, :])
+
+
+ROI_SHAPES = [(400, 150), (2000, 300), (10000, 500)]
+
+
+class Features:
+    params = [ROI_SHAPES]
+    param_names = ["roi_shape"]
+
+    def setup(self, roi_shape):
+        rng = np.random.default_rng(0)
+        n_time, n_depth = roi_shape
+        self.roi_sv = xr.DataArray(
+            rng.normal(-75., 6., size=(4, n_time, n_depth)),
+            dims=("channel", "time", "depth"),
+            coords={"channel": [38., 70., 120., 200.], "time": np.arange(n_time), "depth": np.arange(n_depth) + 0.5},
+        )
+        self.roi_sv = self.roi_sv.where(rng.random((n_time, n_depth)) > 0.2)
+        self.delta_sv = compute_delta_sv(self.roi_sv, 38.).squeeze("reference_frequency", drop=True)
+
+    def time_compute_delta_sv(self, roi_shape):
+        compute_delta_sv(self.roi_sv, 38.)
+
+    def time_stack_pixels(self, roi_shape):
+        stack_pixels(self.delta_sv).values
+
+
+class ClusterRoi:
+    params = (ROI_SHAPES, ["KMeans", "GMM"], [None, 50_000])
+    param_names = ["roi_shape", "method", "fit_sample_size"]
+    timeout = 600
+
+    def setup(self, roi_shape, method, fit_sample_size):
+        Features.setup(self, roi_shape)
+
+    def time_cluster_roi(self, roi_shape, method, fit_sample_size):
+        cluster_roi(self.roi_sv, "Delta Sv", method, 3, 38., fit_sample_size=fit_sample_size)
+
+    def time_cluster_roi_summary(self, roi_shape, method, fit_sample_size):
+        cluster_roi(self.roi_sv, "Delta Sv", method, 3, 38., fit_sample_size=fit_sample_size, summary=True)
+
+    def peakmem_cluster_roi(self, roi_shape, method, fit_sample_size):
+        cluster_roi(self.roi_sv, "Delta Sv", method, 3, 38., fit_sample_size=fit_sample_size)
@@ -0,0 +1,50 @@
+from pathlib import Path
+import json
+import shutil
+import tempfile
+
+from escore.registry import ROIRegistry
+
+from .common import make_shapes
+
+
+class RegistrySync:
+    """Registry update from labelme JSON files, one file per frame of 1000 ESDUs."""
+    params = [100, 1000]
+    param_names = ["n_shapes"]
+
+    def setup(self, n_shapes):
+        self.root = Path(tempfile.mkdtemp())
+        self.json_dir = self.root / "ROI_bench"
+        self.json_dir.mkdir()
+
+        frames = {}
+        for i, shape in enumerate(make_shapes(100_000, n_shapes=n_shapes, width=100)):
+            t_offset = shape["it_min"] // 1000 * 1000
+            points = [[p[0] - t_offset, p[1]] for p in shape["points"]]
+            frames.setdefault(t_offset, []).append({"id": shape["id"], "points": points, "shape_type": "polygon"})
+
+        for t_offset, shapes in frames.items():
+            image = f"bench_T{t_offset}-{t_offset + 1000}.png"
+            with open(self.json_dir / image.replace(".png", ".json"), "w") as f:
+                json.dump({"imagePath": f"../{image}", "shapes": shapes}, f)
+
+        # Registry in steady state (all shapes already registered)
+        with ROIRegistry(self.root / "registry.db", self.root) as registry:
+            registry.update(self.json_dir)
+
+    def teardown(self, n_shapes):
+        shutil.rmtree(self.root)
+
+    def time_update_new(self, n_shapes):
+        db_path = Path(tempfile.mkdtemp(dir=self.root)) / "registry.db"
+        with ROIRegistry(db_path, self.root) as registry:
+            registry.update(self.json_dir)
+
+    def time_update_unchanged(self, n_shapes):
+        with ROIRegistry(self.root / "registry.db", self.root) as registry:
+            registry.update(self.json_dir)
+
+    def time_list_ids(self, n_shapes):
+        with ROIRegistry(self.root / "registry.db", self.root) as registry:
+            registry.list_ids()
@@ -0,0 +1,45 @@
+"""Startup time of the entry points of the scripts and the echo-types app (import in a fresh interpreter).
+
+Heavy dependencies (scikit-learn, scikit-image, matplotlib, tqdm) are imported at first use, so importing
+an entry point must stay within its budget. Check all budgets without asv with:
+
+    python -m benchmarks.bench_startup
+"""
+import subprocess
+import sys
+
+# Import time budget of each entry point, in seconds
+STARTUP_BUDGETS_S = {
+    "escore.registry": 0.1,
+    "escore.catalog": 0.2,
+    "escore.io": 0.6,
+    "escore.builder": 0.8,
+    "escore.visualize": 0.8,
+    "escore.patches": 0.8,
+    "escore.apps.echotypes.app": 1.5,
+}
+
+
+class Startup:
+    params = list(STARTUP_BUDGETS_S)
+    param_names = ["module"]
+
+    def timeraw_import(self, module):
+        return f"import {module}"
+
+
+def import_time(module: str, repeat: int = 3) -> float:
+    """Best import time of module in a fresh interpreter, in seconds."""
+    code = f"import time; t0 = time.perf_counter(); import {module}; print(time.perf_counter() - t0)"
+    return min(float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout)
+               for _ in range(repeat))
+
+
+if __name__ == "__main__":
+    over_budget = []
+    for module, budget in STARTUP_BUDGETS_S.items():
+        t = import_time(module)
+        print(f"{module:<30} {t:6.2f} s  (budget {budget:.2f} s){'  OVER BUDGET' if t > budget else ''}")
+        if t > budget:
+            over_budget.append(module)
+    sys.exit(1 if over_budget else 0)
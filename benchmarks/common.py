@@ -0,0 +1,63 @@
+"""Synthetic surveys and helpers shared by the benchmarks.
+
+Survey sizes (number of ESDUs) are set with the ESCORE_BENCH_SIZES environment variable,
+e.g. ESCORE_BENCH_SIZES=10000,100000 (default: 10000,40000).
+"""
+import os
+import json
+from pathlib import Path
+import numpy as np
+
+from escore import synthetic
+
+
+SIZES = [int(n) for n in os.environ.get("ESCORE_BENCH_SIZES", "10000,40000").split(",")]
+N_DEPTH = 500
+CHANNELS = [38., 70., 120., 200.]
+SURVEY = "bench_survey"
+
+
+def write_survey(data_dir: Path, n_time: int, n_depth: int = N_DEPTH, n_legs: int = 2, seed: int = 0) -> dict:
+    """Write a multi-leg synthetic Sv survey as netCDF files and return the matching global config.
+    """
+    data_dir = Path(data_dir)
+    input_dir = data_dir / "input"
+
+    cfg = synthetic.SyntheticSurveyConfig(n_time=n_time, n_depth=n_depth, n_legs=n_legs, channels=tuple(CHANNELS),
+                                          title="Synthetic benchmark survey", seed=seed)
+    config = {
+        "paths": {
+            "input_dir": str(input_dir),
+            "echogram_images_dir": str(data_dir / "echogram_images"),
+            "interim_dir": str(data_dir / "interim"),
+        },
+        **synthetic.write_synthetic_survey(cfg, input_dir, SURVEY),
+    }
+
+    with open(data_dir / "config.json", "w") as f:
+        json.dump(config, f)
+
+    return config
+
+
+def load_config(data_dir: Path) -> dict:
+    with open(Path(data_dir) / "config.json", "r") as f:
+        return json.load(f)
+
+
+def make_shapes(n_time: int, n_depth: int = N_DEPTH, n_shapes: int = 20, width: int = 400, seed: int = 0) -> list[dict]:
+    """Polygon ROI shapes, in the format returned by `escore.registry.get_shape`.
+    """
+    rng = np.random.default_rng(seed)
+    shapes = []
+    for i in range(n_shapes):
+        t0 = int(rng.integers(0, n_time - width))
+        z0 = int(rng.integers(0, n_depth // 2))
+        points = [[t0, z0], [t0 + width, z0 + 20], [t0 + width - 50, z0 + 150], [t0 + 30, z0 + 120]]
+        shapes.append({
+            "id": f"bench_{i:04d}",
+            "points": points,
+            "it_min": min(p[0] for p in points), "it_max": max(p[0] for p in points),
+            "iz_min": min(p[1] for p in points), "iz_max": max(p[1] for p in points),
+        })
+    return shapes
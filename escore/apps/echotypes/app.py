@@ -1,12 +1,17 @@
 from pathlib import Path
+import os
 from dash import Dash
+from flask import Response, jsonify
 import dash_bootstrap_components as dbc
 
 from .layout_main import make_layout
 from .callbacks import register_callbacks
+from .tiles import register_tile_routes
+from escore.tiles import TileRenderer
+from escore.instrument import is_enabled, metrics_text
 
 
-def create_app(sv, registry_path, root_path, roi_ids):
+def create_app(sv, registry_path, root_path, roi_ids, app_config=None, pyramid=None, tile_cache_dir=None, display_cubes=None):
 
     here = Path(__file__).parent
 
@@ -22,7 +27,23 @@ def create_app(sv, registry_path, root_path, roi_ids):
 
     app.layout = make_layout(roi_ids, intro_text)
 
-    register_callbacks(app, sv, registry_path, root_path)
+    register_callbacks(app, sv, registry_path, root_path, app_config, pyramid, display_cubes)
+
+    # Echogram tiles for pan/zoom browsing of the whole survey (/tiles/viewer)
+    if pyramid is not None:
+        renderer = TileRenderer(pyramid, cache_dir=tile_cache_dir)
+        register_tile_routes(app.server, renderer, registry_path, root_path)
+
+    # Liveness of the worker, for load balancers and process managers
+    @app.server.route("/health")
+    def get_health():
+        return jsonify({"status": "ok", "pid": os.getpid(), "n_rois": len(roi_ids), "n_esdu": sv.sizes["time"]})
+
+    # Per stage timings of the callbacks and hot paths of this worker, in Prometheus text format (see escore.instrument)
+    if is_enabled():
+        @app.server.route("/metrics")
+        def get_metrics():
+            return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
 
     return app
 
@@ -0,0 +1,50 @@
+// Pure UI callbacks of the echo-types app, run in the browser (see register_callbacks)
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    echotypes: {
+        // Set active channels using checklist - sorted frequencies (important for plots)
+        active_channels: function(freqs) {
+            return {values: [...freqs].sort((a, b) => a - b)};
+        },
+
+        // Force the checklist to contain all freqs in ascending order up to a limit (at least 2 channels)
+        enforce_prefix_rule: function(selected, options, previous_dict) {
+            const ordered_values = options.map(opt => (typeof opt === 'object' && opt !== null) ? opt.value : opt);
+            const previous = previous_dict.values;
+
+            // Find what box changed
+            const diff_plus = selected.filter(v => !previous.includes(v));
+            const diff_minus = previous.filter(v => !selected.includes(v));
+
+            if (diff_plus.length === 0 && diff_minus.length > 0) {         // A new element has been unclicked
+                const removed_min_idx = Math.min(...diff_minus.map(v => ordered_values.indexOf(v)));
+                return ordered_values.slice(0, Math.max(removed_min_idx, 2));
+            }
+            if (diff_plus.length > 0 && diff_minus.length === 0) {         // A new element has been clicked
+                const added_max_idx = Math.max(...diff_plus.map(v => ordered_values.indexOf(v)));
+                return ordered_values.slice(0, Math.max(added_max_idx, 2) + 1);
+            }
+            return selected;    // On app start, no change
+        },
+
+        // Mask transparency and context window inputs of each visual type
+        visual_params: function(type) {
+            if (type === "ROI mask in context") {
+                return [0., 0.5, 400, false, 300, false];
+            }
+            if (type === "ROI data only") {
+                return [0., 1, 400, true, 300, true];
+            }
+            throw window.dash_clientside.PreventUpdate;
+        },
+
+        // Limit the options for cluster selection to [0, K-1] where K is the number of clusters
+        cluster_options: function(k) {
+            return Array.from({length: k}, (_, i) => i);
+        },
+
+        // Update the cluster id based on click on the cluster image
+        cluster_id_on_click: function(clickData) {
+            return clickData.points[0].z;
+        },
+    }
+});
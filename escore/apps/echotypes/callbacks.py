@@ -1,100 +1,69 @@
-from dash import Input, Output, State
+from pathlib import Path
+from collections import OrderedDict
+from threading import Lock
+from dash import Input, Output, State, ClientsideFunction, Patch, ctx, no_update
 
-import numpy as np
 import xarray as xr
 
 from escore.registry import ROIRegistry, get_shape
-from .processing import get_roi_Sv, cluster_roi
-from .figures import get_RGB_fig, get_clustering_labels_fig, get_echotype_valid_fig
+from escore.instrument import instrumented, stage
+from escore.display import find_display_cube
+from .processing import get_roi_Sv, get_pooling_factor, cluster_roi, predict_roi_labels
+from .propagation import LabelPropagator, get_labels_key
+from .figures import RGBWindow, get_clustering_labels_fig, get_echotype_valid_fig
 from .layout_main import GRAPH_ASPECT
 
+# Channels of the dropout depth inputs (see `generate_frequencies_pannel`)
+DROPOUT_CHANNELS = [38., 70., 120., 200.]
 
-def register_callbacks(app, sv, registry_path, root_path):
+# Components whose changes require recomputing the RGB figure or the clustering (ROI selection requires both)
+RGB_INPUT_IDS = {'db-slider', 'input-alpha-in', 'input-alpha-out', 'dd-visual-type', 'input-win-esdu', 'input-win-depth-samples'}
+# Inputs that only change the pixels of the RGB image: the image of a cached window is patched in the figure
+RGB_IMAGE_INPUT_IDS = {'db-slider', 'input-alpha-in', 'input-alpha-out'}
+CLUSTERING_INPUT_IDS = {'input-k', 'checklist-freqs', 'dropdown-method', 'dropdown-features'} | \
+    {f'input-dropout-depth-{c}' for c in range(len(DROPOUT_CHANNELS))}
 
-    # --- Session level callbacks --- #
+
+def register_callbacks(app, sv, registry_path, root_path, app_config=None, pyramid=None, display_cubes=None):
+    app_config = app_config or {}
+
+    # Max number of pixels used to fit clustering models (None: all pixels)
+    fit_sample_size = app_config.get("fit_sample_size", 50_000)
+    # Also fit subsampled clusterings on all pixels, to report the agreement of both labellings (slower)
+    report_stability = app_config.get("report_stability", False)
+
+    # Minimum number of (time, depth) pixels of the RGB figure when read from a pyramid level
+    display_shape = tuple(app_config.get("display_shape", (1200, 600)))
+
+    # Max number of (time, depth) pixels of an ROI read at once (None: no limit). Above, the RGB view is pooled
+    # and the clustering is fitted on a pooled preview, whose labels are propagated to full resolution in the background
+    roi_pixel_budget = app_config.get("roi_pixel_budget", 2_000_000)
+    propagator = LabelPropagator(Path(registry_path).parent / "labels")
+
+    # Number of RGB windows (Sv values, image and mask) cached per worker, to re-render contrast and mask opacity changes
+    rgb_cache_size = app_config.get("rgb_cache_size", 8)
+    rgb_windows = OrderedDict()
+    rgb_windows_lock = Lock()
+
+    # --- Pure UI callbacks, run in the browser (assets/clientside.js) --- #
     # Set active channels using checklist - this avoids channel order permutations when clicking / unclicking
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='echotypes', function_name='active_channels'),
         Output('active-channels-store', 'data'),
         Input('checklist-freqs', 'value')
     )
-    def update_active_channels(freqs):
-        # Sort frequencies (important for plots)
-        l = freqs.copy()
-        l.sort()
-        payload =  {'values': l}
-        return payload
-    
-    
+
     # Force the checklist to contains all freqs in ascending order up to a limit
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='echotypes', function_name='enforce_prefix_rule'),
         Output('checklist-freqs', 'value'),
         Input('checklist-freqs', 'value'),
         State('checklist-freqs', 'options'),
         State('active-channels-store', 'data')
     )
-    def enforce_prefix_rule(selected, options, previous_dict):
-
-        ordered_values = [opt['value'] if isinstance(opt, dict) else opt for opt in options]
-
-        previous = previous_dict['values']
-
-        # Find what box changed
-        diff_plus = list(set(selected) - set(previous))
-        diff_minus = list(set(previous) - set(selected))
-
-        n_added, n_removed = len(diff_plus), len(diff_minus)
-
-        # Update the selected values
-        if (n_added == 0) and (n_removed > 0):     # A new element has been unclicked
-            removed_min_idx = min(ordered_values.index(v) for v in diff_minus)  # Find the uncliked elements location in options
-            selected_new = ordered_values[: max(removed_min_idx, 2)]                            # Select only the elements before (excluding the newly unclicked)
-        elif (n_added > 0) and (n_removed == 0):   # A new element has been clicked
-            added_max_idx = max(ordered_values.index(v) for v in diff_plus)     # Idem uncliked
-            selected_new = ordered_values[: max(added_max_idx, 2) + 1]                          # Select elements after (including the newly clicked)
-        else:
-            selected_new = selected  # On app start, no change, do nothing
-
-        return selected_new
-
-        
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
-
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='echotypes', function_name='visual_params'),
         Output(component_id='input-alpha-in', component_property='value'),
         Output(component_id='input-alpha-out', component_property='value'),
         Output(component_id='input-win-esdu', component_property='value'),
@@ -102,61 +71,87 @@ def register_callbacks(app, sv, registry_path, root_path):
         Output(component_id='input-win-depth-samples', component_property='value'),
         Output(component_id='input-win-depth-samples', component_property='disabled'),
         Input(component_id='dd-visual-type', component_property='value'),
-        #Input(component_id='input-win-esdu', component_property='value'),
-        #Input(component_id='input-win-depth-samples', component_property='value'),
     )
-    def update_visual_params(type):
-        if type == "ROI mask in context":
-            return 0., 0.5, 400, False, 300, False
-        if type == "ROI data only":
-            return 0., 1,  400, True, 300, True
-        
 
-    @app.callback(
-        Output(component_id='rgb-plot-fig', component_property='figure'),
-        Input(component_id='dropdown-roi-selection', component_property='value'),
-        Input(component_id='db-slider', component_property='value'),
-        Input(component_id='input-alpha-in', component_property='value'),
-        Input(component_id='input-alpha-out', component_property='value'),
-        Input(component_id='dd-visual-type', component_property='value'),
-        Input(component_id='input-win-esdu', component_property='value'),
-        Input(component_id='input-win-depth-samples', component_property='value'),
+    # Limit the options for cluster selection to [0, K-1] where K is the number of clusters
+    app.clientside_callback(
+        ClientsideFunction(namespace='echotypes', function_name='cluster_options'),
+        Output('dropdown-cluster-id', 'options'),
+        Input('input-k', 'value')
     )
-    def update_fig(roi_id, db_range, mask_alpha_in, mask_alpha_out, type, win_esdu, win_depth):
-        with ROIRegistry(db_path=registry_path, root_path=root_path) as registry:
-            roi_shape = get_shape(registry, id=roi_id)
-        
-        vmin, vmax = db_range
+
+    # Update the cluster id base on click on the cluster image
+    app.clientside_callback(
+        ClientsideFunction(namespace='echotypes', function_name='cluster_id_on_click'),
+        Output('dropdown-cluster-id', 'value'),
+        Input('clustering-plot-fig', 'clickData'),
+        prevent_initial_call=True,
+    )
+
+
+    # --- Data callbacks --- #
+    def get_rgb_window(roi_id, roi_shape, type, win_esdu, win_depth, **_):
+        """Cached RGBWindow of an ROI for a visual type (roi_shape=None: cached windows only, else None)."""
+        key = roi_id, type, win_esdu, win_depth
+        with rgb_windows_lock:
+            if key in rgb_windows:
+                rgb_windows.move_to_end(key)
+                return rgb_windows[key]
+        if roi_shape is None:
+            return None
 
         if type == "ROI mask in context":
             window_size = win_esdu, win_depth
             padding = None
-            show_dots = True
         if type == "ROI data only":
             window_size = None
             padding = 0
-            show_dots = False
-        
-        fig, (w, h) = get_RGB_fig(
-            sv, 
-            roi_shape, 
-            vmin=vmin, 
-            vmax=vmax, 
+
+        window = RGBWindow(
+            sv,
+            roi_shape,
             window_size=window_size,
-            padding=padding, 
+            padding=padding,
             frequencies=[38, 70, 120],
-            show_dots=show_dots,
+            pyramid=pyramid,
+            display_shape=display_shape,
+            max_pixels=roi_pixel_budget,
+        )
+
+        with rgb_windows_lock:
+            rgb_windows[key] = window
+            while len(rgb_windows) > rgb_cache_size:
+                rgb_windows.popitem(last=False)
+        return window
+
+
+    def get_image_source(window, db_range, mask_alpha_in, mask_alpha_out, **_):
+        vmin, vmax = db_range
+        return window.image_source(
+            vmin=vmin,
+            vmax=vmax,
             show_mask=True,
             mask_alpha_in=mask_alpha_in,
-            mask_alpha_out=mask_alpha_out
+            mask_alpha_out=mask_alpha_out,
+            display_cube=find_display_cube(display_cubes, vmin, vmax, [38, 70, 120])
         )
 
+
+    def make_rgb_fig(window, type, **rgb):
+        fig = window.figure(get_image_source(window, **rgb), show_dots=(type == "ROI mask in context"))
+        w, h = window.window_shape
+
         # Update figure layout
         fig.update_layout({
                 'paper_bgcolor': 'white',
                 'plot_bgcolor': 'pink'
          })
 
+        if window.pooling > 1:
+            fig.add_annotation(text=f"Preview: pooled ×{window.pooling} (window above the pixel budget)",
+                               xref="paper", yref="paper", x=0, y=1, xanchor="left", yanchor="top",
+                               showarrow=False, bgcolor="white")
+
         # Make sur the image is properly stretched to the dcc.Graph aspect ratio
         if type == "ROI mask in context":
             fig.update_layout({
@@ -186,90 +181,175 @@ def register_callbacks(app, sv, registry_path, root_path):
             })
 
         return fig
-    
 
 
-    # Update the clustering figure based on current ROI and clusterings parameters
-    @app.callback(
-        Output('clustering-plot-fig', 'figure'),
-        Output('labels-da-store', 'data'),
-        Input('dropdown-roi-selection', 'value'),
-        Input('input-k', 'value'),
-        Input('checklist-freqs', 'value'),
-        Input('dropdown-method', 'value'),
-        Input('dropdown-features', 'value'),
-    )
-    def update_fig(roi_id, n_clusters, frequencies, method, features):
-        with ROIRegistry(db_path=registry_path, root_path=root_path) as registry:
-            roi_shape = get_shape(registry, id=roi_id)
-
-        # Get ROI Sv data from bbox sv and shape
-        roi_sv = get_roi_Sv(sv, roi_shape, frequencies)
-
-        # Perform clustering and fetch labels as DataArray
-        labels_da, model = cluster_roi(
-            roi_sv, 
-            features, 
-            method, 
-            n_clusters,
-            ref_frequency=38, 
-            random_state=42
-        )
-        
+    # Contrast and mask opacity changes: only the image source of the displayed figure is sent
+    def patch_rgb_fig(window, **rgb):
+        patched = Patch()
+        patched["data"][0]["source"] = get_image_source(window, **rgb)
+        return patched
+
+
+    def make_clustering(roi_id, roi_shape, n_clusters, frequencies, method, features, dropout_depths):
+        # Get ROI Sv data from bbox sv and shape, without reading Sv beyond the channels dropout depths.
+        # ROIs above the pixel budget are pooled: the clustering is a lower resolution preview.
+        dropout_depths = {c: d for c, d in zip(DROPOUT_CHANNELS, dropout_depths) if d is not None}
+        factor = get_pooling_factor(roi_shape["it_max"] - roi_shape["it_min"] + 1,
+                                    roi_shape["iz_max"] - roi_shape["iz_min"] + 1, roi_pixel_budget)
+        roi_sv = get_roi_Sv(sv, roi_shape, frequencies, dropout_depths=dropout_depths, factor=factor)
+
+        # Perform clustering and fetch labels as DataArray. Nothing to cluster (e.g. no valid Sv on the reference
+        # channel): the previous clustering views are kept and the reason is shown
+        try:
+            labels_da, model, cluster_summary = cluster_roi(
+                roi_sv,
+                features,
+                method,
+                n_clusters,
+                ref_frequency=38,
+                random_state=42,
+                fit_sample_size=fit_sample_size,
+                report_stability=report_stability,
+                summary=True
+            )
+        except ValueError as e:
+            return no_update, no_update, None, f"Clustering not updated: {e}"
+
+        # Channels without valid Sv in the ROI are left out of the clustering
+        dropped = [c for c in frequencies if float(c) not in labels_da.attrs["channels"]]
+        frequencies = labels_da.attrs["channels"]
+        status = "" if not dropped else f"No valid Sv in the ROI on {', '.join(f'{c:g}' for c in dropped)} kHz: channel(s) left out."
+        if "label_stability" in labels_da.attrs:
+            status += (f" Fitted on {labels_da.attrs['n_fit_pixels']} of {labels_da.attrs['n_pixels']} pixels, "
+                       f"agreement with a fit on all pixels (adjusted Rand index): {labels_da.attrs['label_stability']:.2f}.")
+        status = status.strip()
+
         # Create figure
         fig = get_clustering_labels_fig(labels_da)
 
         # Serialize labels to store in memory
         payload = {
             "values": labels_da.values.tolist(),
-            "shape": labels_da.shape
+            "shape": labels_da.shape,
+            "pooling": factor,
         }
-        #labels_da_dict = labels_da.to_dict()
 
-        return fig, payload
-    
+        # Label all the pixels of a preview with its model, in the background (see `LabelPropagator`)
+        if factor > 1:
+            key = get_labels_key(roi_id=roi_id, n_clusters=n_clusters, frequencies=frequencies, method=method,
+                                 features=features, dropout_depths=dropout_depths, factor=factor,
+                                 fit_sample_size=fit_sample_size)
+            propagator.submit(key, predict_roi_labels, sv, roi_shape, model, features, frequencies,
+                              ref_frequency=38, dropout_depths=dropout_depths, block_pixels=roi_pixel_budget)
+            payload["full_resolution"] = key
+            fig.update_layout(title=f"Preview: pixels pooled ×{factor}")
 
-    # Create an histogram of Sv38 values for the selected cluster, given an ROI and clustering parameters.
-    @app.callback(
-        Output('echo-type-valid-fig', 'figure'),
-        Input('dropdown-roi-selection', 'value'),
-        Input('labels-da-store', 'data'),
-        Input('dropdown-cluster-id', 'value'),
-        Input('checklist-freqs', 'value'),
-    )
-    def update_fig(roi_id, labels_payload, cluster_id, frequencies):
-        with ROIRegistry(db_path=registry_path, root_path=root_path) as registry:
-            roi_shape = get_shape(registry, id=roi_id)
+        return fig, payload, cluster_summary, status
 
-        # Get ROI Sv data from bbox sv and shape
-        roi_sv = get_roi_Sv(sv, roi_shape, frequencies)
 
-        # Load labels as DataArray from dcc.Store()
-        values = np.array(labels_payload["values"]).reshape(labels_payload["shape"])
-        labels_da = xr.DataArray(values, dims=['time', 'depth'])
+    # Create the ΔSv histograms and frequency responses of the selected cluster, from the summary of the current clustering.
+    def make_valid_fig(cluster_summary, cluster_id):
+        if cluster_summary is None or cluster_id is None or int(cluster_id) >= cluster_summary.sizes["cluster"]:
+            return no_update
+        return get_echotype_valid_fig(cluster_summary, int(cluster_id))
 
-        fig = get_echotype_valid_fig(roi_sv, labels_da, cluster_id)
 
-        return fig
-    
-
-    # Limit the options for cluster selection to [0, K-1] where K is the number of clusters
+    # All the views of the selected ROI, in a single round-trip: the ROI shape is fetched once and only the
+    # views depending on the changed inputs are recomputed (all of them on ROI selection and initial load).
     @app.callback(
-        Output('dropdown-cluster-id', 'options'),
-        Input('input-k', 'value')
+        output=dict(
+            rgb_fig=Output('rgb-plot-fig', 'figure'),
+            clustering_fig=Output('clustering-plot-fig', 'figure'),
+            labels=Output('labels-da-store', 'data'),
+            summary=Output('cluster-summary-store', 'data'),
+            valid_fig=Output('echo-type-valid-fig', 'figure'),
+            clustering_status=Output('clustering-status', 'children'),
+        ),
+        inputs=dict(
+            roi_id=Input('dropdown-roi-selection', 'value'),
+            rgb=dict(
+                db_range=Input('db-slider', 'value'),
+                mask_alpha_in=Input('input-alpha-in', 'value'),
+                mask_alpha_out=Input('input-alpha-out', 'value'),
+                type=Input('dd-visual-type', 'value'),
+                win_esdu=Input('input-win-esdu', 'value'),
+                win_depth=Input('input-win-depth-samples', 'value'),
+            ),
+            clustering=dict(
+                n_clusters=Input('input-k', 'value'),
+                frequencies=Input('checklist-freqs', 'value'),
+                method=Input('dropdown-method', 'value'),
+                features=Input('dropdown-features', 'value'),
+                dropout_depths=[Input(f'input-dropout-depth-{c}', 'value') for c in range(len(DROPOUT_CHANNELS))],
+            ),
+            cluster_id=Input('dropdown-cluster-id', 'value'),
+        ),
+        state=dict(summary_payload=State('cluster-summary-store', 'data')),
     )
-    def update_cluster_options(k):
-        return [_ for _ in range(k)]
-    
+    @instrumented("echotypes.callback.roi_views", profile=True)
+    def update_roi_views(roi_id, rgb, clustering, cluster_id, summary_payload):
+        triggered = {prop_id.split('.')[0] for prop_id in ctx.triggered_prop_ids}
+        all_views = (not triggered) or ('dropdown-roi-selection' in triggered)
+        update_rgb = all_views or bool(triggered & RGB_INPUT_IDS)
+        update_clustering = all_views or bool(triggered & CLUSTERING_INPUT_IDS)
+
+        outputs = dict(rgb_fig=no_update, clustering_fig=no_update, labels=no_update, summary=no_update, valid_fig=no_update,
+                       clustering_status=no_update)
+
+        # The window may not be cached by this worker (or evicted): the full figure is sent then
+        if update_rgb and not all_views and triggered <= RGB_IMAGE_INPUT_IDS:
+            window = get_rgb_window(roi_id, None, **rgb)
+            if window is not None:
+                with stage("echotypes.rgb_patch"):
+                    outputs["rgb_fig"] = patch_rgb_fig(window, **rgb)
+                update_rgb = False
+
+        if update_rgb or update_clustering:
+            with ROIRegistry(db_path=registry_path, root_path=root_path) as registry:
+                roi_shape = get_shape(registry, id=roi_id)
+
+        if update_rgb:
+            with stage("echotypes.rgb_fig"):
+                outputs["rgb_fig"] = make_rgb_fig(get_rgb_window(roi_id, roi_shape, **rgb), **rgb)
+
+        if update_clustering:
+            # A failed clustering doesn't discard the other views: its error is shown in the clustering status
+            try:
+                with stage("echotypes.clustering"):
+                    fig, payload, cluster_summary, status = make_clustering(roi_id, roi_shape, **clustering)
+            except Exception as e:
+                fig, payload, cluster_summary, status = no_update, no_update, None, f"Clustering failed: {e}"
+            outputs.update(clustering_fig=fig, labels=payload, clustering_status=status)
+            # Per-cluster summary, for instant cluster selection in the validation figure
+            if cluster_summary is not None:
+                outputs["summary"] = cluster_summary.to_dict(data="list")
+        else:
+            cluster_summary = None if summary_payload is None else xr.Dataset.from_dict(summary_payload)
 
-    # Update the cluster id base on click on the cluster image
+        if update_clustering or ('dropdown-cluster-id' in triggered):
+            with stage("echotypes.echotype_valid_fig"):
+                outputs["valid_fig"] = make_valid_fig(cluster_summary, cluster_id)
+
+        return outputs
+
+
+    # Status of the clustering preview of ROIs above the pixel budget, polled until full resolution labels are ready
     @app.callback(
-        Output('dropdown-cluster-id', 'value'),
-        Input('clustering-plot-fig', 'clickData'),
-        prevent_initial_call=True,
+        Output('labels-status', 'children'),
+        Output('labels-progress-interval', 'disabled'),
+        Input('labels-da-store', 'data'),
+        Input('labels-progress-interval', 'n_intervals'),
     )
-    def cluster_id_on_click(clickData):
-        point= clickData["points"][0]
-        cluster_id = point["z"]
-
-        return cluster_id
\ No newline at end of file
+    def update_labels_status(labels_payload, n_intervals):
+        if labels_payload is None or labels_payload.get("pooling", 1) == 1:
+            return "", True
+
+        preview = (f"Clustering preview on pixels pooled ×{labels_payload['pooling']} (ROI above the pixel budget, "
+                   f"ΔSv statistics of the preview).")
+        status, value = propagator.status(labels_payload["full_resolution"])
+        if status == "ready":
+            return f"{preview} Full resolution labels ready.", True
+        if status == "failed":
+            return f"{preview} Full resolution labels failed: {value}", True
+        progress = f" {value:.0%}" if status == "running" else ""
+        return f"{preview} Full resolution labels in progress{progress}...", False
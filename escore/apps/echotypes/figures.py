@@ -1,15 +1,19 @@
+import io
+import base64
 import numpy as np
+import xarray as xr
 import pandas as pd
+from PIL import Image
 
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-from skimage.draw import polygon
-
 from escore.visualize import normalize_sv_array
+from escore.instrument import instrumented
+from escore.pyramid import pool_sv
 
-from .processing import *
+from .processing import get_window, get_mask, get_pooling_factor
 
 
 
@@ -23,6 +27,169 @@ def overlay_mask(mask, alpha_in, alpha_out):
 
 
 
+def blend_mask(rgb, mask, alpha_in, alpha_out):
+    """Composite the mask overlay of `overlay_mask` on a uint8 RGB image, in integer arithmetic.
+
+    Args:
+        rgb (numpy.ndarray): uint8 image of shape (H, W, 3).
+        mask (numpy.ndarray): boolean mask of shape (H, W).
+        alpha_in (float): opacity of the red overlay on selected pixels.
+        alpha_out (float): opacity of the black overlay on other pixels.
+
+    Returns:
+        numpy.ndarray: uint8 image of shape (H, W, 3).
+    """
+    alpha = np.where(mask, round(alpha_in * 255), round(alpha_out * 255)).astype(np.uint16)[..., None]
+    color = np.zeros(rgb.shape, dtype=np.uint16)
+    color[mask, 0] = 255
+
+    blended = (rgb.astype(np.uint16) * (255 - alpha) + color * alpha + 127) // 255
+    return blended.astype(np.uint8)
+
+
+
+@instrumented("echotypes.encode_image")
+def encode_image_source(rgb, image_format="png"):
+    """Encode a uint8 image as a data URI for `go.Image(source=...)`.
+
+    Args:
+        rgb (numpy.ndarray): uint8 image of shape (H, W, 3) or (H, W, 4).
+        image_format (str, optional): one of ['png', 'webp'] (WebP is lossless). Defaults to "png".
+    """
+    buffer = io.BytesIO()
+    if image_format == "png":
+        Image.fromarray(rgb).save(buffer, format="png", compress_level=1)
+    elif image_format == "webp":
+        Image.fromarray(rgb).save(buffer, format="webp", lossless=True, quality=0, method=0)
+    else:
+        raise ValueError(f"Image format must be one of ['png', 'webp']. Current input: '{image_format}'")
+
+    return f"data:image/{image_format};base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+
+class RGBWindow:
+    """Window of sv around an ROI, rendered as an RGB echogram with the ROI mask blended in.
+
+    The layers of the image are cached separately: the Sv values of the window (read once), the uint8 RGB image
+    of the last (vmin, vmax) and the mask sampled on the pixel grid of the image. A contrast change then only
+    normalizes the cached Sv values again, and a mask opacity change only blends the mask again.
+
+    When a `SvPyramid` of sv is given, the window is read from the coarsest pyramid level that still has
+    at least `display_shape` pixels. Windows of more than `max_pixels` pixels at this level are pooled further
+    on the fly (`pooling` > 1): a degraded preview with bounded memory. Axes are kept in full resolution window
+    indices in all cases.
+    """
+    def __init__(
+        self,
+        sv,
+        shape,
+        window_size:tuple[int, int]=None,
+        padding=10,
+        frequencies=[38, 70, 120],
+        pyramid=None,
+        display_shape:tuple[int, int]=(1200, 600),
+        max_pixels:int | None=None,
+    ):
+        # Fetch shape points
+        self.points = np.array(shape["points"])
+        bbox = shape["it_min"], shape["it_max"], shape["iz_min"], shape["iz_max"]
+
+        # Window
+        xmin, xmax, ymin, ymax = self.window = get_window(bbox,
+                                                          array_shape=(len(sv.time), len(sv.depth)),
+                                                          window_shape=window_size,
+                                                          padding=padding)
+        # Compute shape for aspect ratio rendering in app
+        self.window_shape = xmax - xmin + 1, ymax - ymin + 1
+
+        # Slice sv using bbox, at the pyramid level matching the display size
+        if pyramid is None:
+            self.roi_sv, (st, sz) = sv.isel(time=slice(xmin, xmax+1), depth=slice(ymin, ymax+1)), (1, 1)
+        else:
+            self.roi_sv, (st, sz) = pyramid.get_window((xmin, xmax, ymin, ymax), display_shape=display_shape)
+
+        # Position of the image pixels in full resolution window coordinates (pooled pixels are centered on their block)
+        self.x0 = (xmin // st) * st - xmin
+        self.y0 = (ymin // sz) * sz - ymin
+
+        # Pool windows above the pixel budget (e.g. very large ROIs without pyramid), from the same first pixel
+        self.pooling = get_pooling_factor(self.roi_sv.sizes["time"], self.roi_sv.sizes["depth"], max_pixels)
+        if self.pooling > 1:
+            self.roi_sv = pool_sv(self.roi_sv, self.pooling)
+            st, sz = st * self.pooling, sz * self.pooling
+        self.step = st, sz
+        self.frequencies = frequencies
+
+        self._sv_array = None
+        self._rgb = None, None      # ((vmin, vmax), uint8 image)
+        self._mask = None
+
+    @property
+    def image_shape(self) -> tuple[int, int]:
+        return self.roi_sv.sizes["depth"], self.roi_sv.sizes["time"]
+
+    def rgb(self, vmin=-90., vmax=-50., display_cube=None) -> np.ndarray:
+        """uint8 image of shape (H, W, 3), without mask. Full resolution windows are sliced from `display_cube`
+        when given: a `DisplayCube` of sv for the same frequencies and (vmin, vmax).
+        """
+        key, rgb = self._rgb
+        if key != (vmin, vmax):
+            if display_cube is not None and self.step == (1, 1):
+                rgb = np.ascontiguousarray(display_cube.window(*self.window))
+            else:
+                if self._sv_array is None:
+                    self._sv_array = self.roi_sv.sel(channel=self.frequencies).values
+                rgb = np.round(normalize_sv_array(self._sv_array, vmin=vmin, vmax=vmax) * 255).astype(np.uint8)
+            self._rgb = (vmin, vmax), rgb
+        return rgb
+
+    def mask(self) -> np.ndarray:
+        """Boolean mask of the ROI sampled on the pixel grid of the image, shape (H, W)."""
+        if self._mask is None:
+            (h, w), (st, sz) = self.image_shape, self.step
+            mask = get_mask(window=self.window, points=self.points)
+            ti = np.clip(self.x0 + np.arange(w) * st, 0, mask.shape[0] - 1)
+            zi = np.clip(self.y0 + np.arange(h) * sz, 0, mask.shape[1] - 1)
+            self._mask = mask[np.ix_(ti, zi)].T     # shape (W, H) -> (H, W)
+        return self._mask
+
+    def image_source(self, vmin=-90., vmax=-50., show_mask=True, mask_alpha_in=0.3, mask_alpha_out=0.,
+                     image_format="png", display_cube=None) -> str:
+        """Encoded image of the window (see `encode_image_source`), for `go.Image(source=...)`."""
+        rgb = self.rgb(vmin, vmax, display_cube)
+        if show_mask:
+            rgb = blend_mask(rgb, self.mask(), mask_alpha_in, mask_alpha_out)
+        return encode_image_source(rgb, image_format)
+
+    def figure(self, image_source, show_dots=True) -> go.Figure:
+        """Figure of an image of `image_source`. The image is its first trace."""
+        (st, sz), (xmin, _, ymin, _) = self.step, self.window
+
+        # RGB plot
+        fig = go.Figure(
+            go.Image(source=image_source,
+                     x0=self.x0 + (st - 1) / 2, dx=st, y0=self.y0 + (sz - 1) / 2, dy=sz)
+        )
+        fig.layout.xaxis.title.text = "ESDU"
+        fig.layout.yaxis.title.text = "Depth sample"
+
+        # Add points
+        if show_dots:
+            xs, ys = [p[0]-xmin for p in self.points], [p[1]-ymin for p in self.points]
+            fig.add_trace(
+                go.Scatter(x=xs, y=ys,
+                        mode='markers',
+                        marker=dict(color='red', size=5, symbol='circle'))
+            )
+
+        fig.update_xaxes(range=[0, self.window_shape[0]], autorange=False)
+        fig.update_yaxes(range=[self.window_shape[1], 0], autorange=False)
+
+        return fig
+
+
+
 def get_RGB_fig(
     sv, 
     shape,
@@ -34,57 +201,22 @@ def get_RGB_fig(
     show_dots=True,
     show_mask=True,
     mask_alpha_in=0.3,
-    mask_alpha_out=0.
+    mask_alpha_out=0.,
+    pyramid=None,
+    display_shape:tuple[int, int]=(1200, 600),
+    image_format="png",
+    display_cube=None,
+    max_pixels=None,
 ):
+    """RGB echogram of an ROI in a window of sv (see `RGBWindow`).
 
-    # Fetch shape points
-    points = np.array(shape["points"])
-    bbox = shape["it_min"], shape["it_max"], shape["iz_min"], shape["iz_max"]
-
-    # Window
-    xmin, xmax, ymin, ymax = get_window(bbox, 
-                                        array_shape=(len(sv.time), len(sv.depth)),
-                                        window_shape=window_size,
-                                        padding=padding)
-    # Compute shape for aspect ratio rendering in app
-    #print(f"Window: {xmin, xmax, ymin, ymax}")
-    window_shape = xmax - xmin + 1, ymax - ymin + 1
-
-    # Slice sv using bbox
-    roi_sv = sv.isel(time=slice(xmin, xmax+1), depth=slice(ymin, ymax+1)).sel(channel=frequencies)
-
-    # Turn into image format array
-    sv_array = roi_sv.values
-    sv_array = normalize_sv_array(sv_array, vmin=vmin, vmax=vmax)
-
-    # RGB plot
-    fig = px.imshow(sv_array, aspect="auto")
-    fig.layout.xaxis.title.text = "ESDU"
-    fig.layout.yaxis.title.text = "Depth sample"
-
-    # Add points
-    if show_dots:
-        xs, ys = [p[0]-xmin for p in points], [p[1]-ymin for p in points]
-        fig.add_trace(
-            go.Scatter(x=xs, y=ys,
-                    mode='markers',
-                    marker=dict(color='red', size=5, symbol='circle'))
-        )
-
-    # Add mask of selected pixels
-    if show_mask:
-        mask = get_mask(window=(xmin, xmax, ymin, ymax), points=points)
-        mask = mask.T           # shape (W, H) -> (H, W)
-        overlay = overlay_mask(mask, mask_alpha_in, mask_alpha_out)
-
-        fig.add_trace(
-            go.Image(z=overlay, colormodel="rgba")
-        )
-
-    fig.update_xaxes(range=[0, window_shape[0]], autorange=False)
-    fig.update_yaxes(range=[window_shape[1], 0], autorange=False)
+    The mask is blended in the uint8 RGB image on the server side and the result is sent as a single
+    encoded image (`go.Image(source=...)`), which keeps figure payloads small for large windows.
+    """
+    window = RGBWindow(sv, shape, window_size, padding, frequencies, pyramid, display_shape, max_pixels)
+    source = window.image_source(vmin, vmax, show_mask, mask_alpha_in, mask_alpha_out, image_format, display_cube)
 
-    return fig, window_shape
+    return window.figure(source, show_dots), window.window_shape
 
 
 
@@ -130,23 +262,17 @@ def mean_and_sd_lineplot(df, line_name, line_color="red"):
 
 
 def get_echotype_valid_fig(
-    roi_sv,
-    labels_da,
-    cluster_id,
-    ref_frequency=38.
+    cluster_summary,
+    cluster_id
 ):
-    
-    # Filter Sv based on clustering & select 38 kHz channel
-    mask_da = (labels_da == cluster_id)
-    echotype_sv = roi_sv.where(mask_da)
-
-    # Compute delta Sv
-    echotype_delta_sv = compute_delta_sv(echotype_sv, ref_frequency)
+    """Validation figure of one cluster: ΔSv histograms and frequency response curves.
 
-    # Stack spatial dimensions + to numpy
-    X = stack_pixels(
-        echotype_delta_sv.squeeze("reference_frequency", drop=True)
-    ).values # shape (n_pixels, n_channels)
+    Args:
+        cluster_summary (xr.Dataset): summary of all clusters, as returned by `summarize_clusters`.
+        cluster_id (int): selected cluster.
+    """
+    ref_frequency = cluster_summary.attrs["ref_frequency"]
+    summary = cluster_summary.sel(cluster=cluster_id)
 
     # Create fig with subplots
     fig = make_subplots(
@@ -157,16 +283,18 @@ def get_echotype_valid_fig(
     )
 
     # Add traces
-    # Histograms of delta Sv
-    for c in range(X.shape[1]):
+    # Histograms of delta Sv (pre-binned, normalized as probabilities)
+    for channel in summary.delta_channel.values:
+        hist = summary["delta_sv_hist"].sel(delta_channel=channel).values.astype(np.float64)
+        total = hist.sum()
 
         fig.add_trace(
-            go.Histogram(
-            x=X[:, c],
-            xbins=dict(start=-50., end=50., size=0.5),
-            histnorm="probability",
+            go.Bar(
+            x=summary.delta_sv_bin.values,
+            y=hist / total if total > 0 else hist,
+            width=cluster_summary.attrs["delta_sv_bin_width"],
             opacity=0.5,
-            name=f"ΔSv {echotype_delta_sv.channel.values[c]} kHz - {echotype_delta_sv.reference_frequency.values[0]} kHz"
+            name=f"ΔSv {channel} kHz - {ref_frequency} kHz"
             ),
             row=1,
             col="all"
@@ -174,9 +302,9 @@ def get_echotype_valid_fig(
 
     # Relative frequency response curve
     df = pd.DataFrame({
-        "channel": echotype_delta_sv.channel.values,
-        "mean": X.mean(axis=0),
-        "sd": X.std(axis=0)
+        "channel": summary.delta_channel.values,
+        "mean": summary["delta_sv_mean"].values,
+        "sd": summary["delta_sv_sd"].values
     })
     ref_freq_row = pd.DataFrame([[ref_frequency, 0, 0]], columns=df.columns)
     df = pd.concat([ref_freq_row, df], ignore_index=True)  
@@ -189,11 +317,10 @@ def get_echotype_valid_fig(
     )
 
     # Frequency response curve
-    X = stack_pixels(echotype_sv).values
     df = pd.DataFrame({
-        "channel": echotype_sv.channel.values,
-        "mean": X.mean(axis=0),
-        "sd": X.std(axis=0)
+        "channel": summary.channel.values,
+        "mean": summary["sv_mean"].values,
+        "sd": summary["sv_sd"].values
     })
 
     fig.add_traces(
@@ -207,6 +334,7 @@ def get_echotype_valid_fig(
     # Layout
     fig.update_layout(
         barmode="overlay",
+        bargap=0,
         #title = dict(text='Delta Sv distribution',
         #             x=0.5,
         #             xanchor='center'),
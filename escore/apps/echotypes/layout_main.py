@@ -1,7 +1,8 @@
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 
-from .layout_utils import *
+from .layout_utils import (generate_frequencies_pannel, generate_dB_slider, generate_ROI_visual_params_bar,
+                           generate_clustering_params_bar)
 
 GRAPH_ASPECT = 4/3
 
@@ -101,7 +102,13 @@ def make_right_pannel():
             ),
 
             html.Div(
-                "Save Buttons",
+                [
+                    # Channels left out of the clustering, or why it was not updated
+                    html.Div(id="clustering-status", style={"fontSize": "small"}),
+                    # Clustering preview of ROIs above the pixel budget, and progress of their full resolution labels
+                    html.Div(id="labels-status", style={"fontSize": "small"}),
+                    "Save Buttons",
+                ],
                 style={
                     "gridColumn": "1 / -1",
                     "gridRow": "21 / -1",
@@ -127,6 +134,8 @@ def make_layout(roi_ids, intro_text):
             # Store data in memory
             dcc.Store(id='active-channels-store', storage_type='memory', data={'values': [38., 70., 120., 200.]}),
             dcc.Store(id='labels-da-store', storage_type='memory'),
+            dcc.Store(id='cluster-summary-store', storage_type='memory'),
+            dcc.Interval(id='labels-progress-interval', interval=1000, disabled=True),
 
 
             # Main layout
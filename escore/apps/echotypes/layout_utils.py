@@ -2,11 +2,13 @@ from dash import html, dcc
 
 import dash_bootstrap_components as dbc
 
+from escore.io import DEFAULT_DROPOUT_DEPTHS
+
 
 
 def generate_frequencies_pannel(
         freqs_kHz=[38., 70., 120., 200.],
-        dropout_depth_dict_m={38.:800, 70.:500, 120.:300, 200.:150}, 
+        dropout_depth_dict_m=DEFAULT_DROPOUT_DEPTHS, 
         min_depth_m=0, 
         max_depth_m=800, 
         ei_zstep_m=1
@@ -1,10 +1,9 @@
 import numpy as np
 import xarray as xr
 
-from sklearn.cluster import KMeans
-from sklearn.mixture import GaussianMixture
-
-from skimage.draw import polygon
+from escore.instrument import instrumented
+from escore.io import apply_dropout_depths
+from escore.pyramid import pool_sv
 
 
 # Selecting Sv values from ROI shape and sv xr.DataArray
@@ -101,18 +100,127 @@ def get_window(
 
 
 
+def get_windows(
+    bboxes: np.ndarray,
+    array_shape: tuple[int, int],
+    padding: int | None = None,
+    window_shape: tuple[int, int] | None = None,
+) -> np.ndarray:
+    """Vectorized `get_window` for a batch of bounding boxes, with identical semantics.
+
+    Args:
+        bboxes: array-like of shape (n, 4), rows are (xmin, xmax, ymin, ymax)
+        array_shape: (xlen, ylen)
+        padding: number of pixels around bboxes
+        window_shape: (width, height) of the rigid windows
+
+    Returns:
+        np.ndarray: int64 array of shape (n, 4), rows are (xmin, xmax, ymin, ymax)
+    """
+    if (padding is None) == (window_shape is None):
+        raise ValueError("Exactly one of `padding` or `window_shape` must be provided.")
+
+    bboxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    xlen, ylen = array_shape
+    windows = np.empty_like(bboxes)
+
+    for axis, (imin, imax), length in [(0, (0, 1), xlen), (1, (2, 3), ylen)]:
+        lo, hi = bboxes[:, imin], bboxes[:, imax]
+
+        if window_shape is not None:
+            size = window_shape[axis]
+            center = (lo + hi) // 2
+            lo = center - size // 2 + (1 - size % 2)
+            hi = center + (size - size // 2) - size % 2
+
+            # Shift windows to stay inside array (same order as get_window)
+            shift = np.minimum(lo, 0)
+            lo, hi = lo - shift, hi - shift
+            shift = np.maximum(hi - length, 0)
+            lo, hi = lo - shift, hi - shift
+        else:
+            lo, hi = np.maximum(lo - padding, 0), np.minimum(hi + padding, length)
+
+        windows[:, imin], windows[:, imax] = lo, hi
+
+    return windows
+
+
+
+def extract_patches(
+    sv: xr.DataArray,
+    windows: np.ndarray,
+    channels=[38, 70, 120, 200],
+    max_read_length: int = 20_000,
+) -> np.ndarray:
+    """Read fixed-size windows of sv as a stacked array of patches.
+
+    Windows are sorted by time and read in groups: windows of a group are cut from a single contiguous
+    slice of sv covering them all (at most `max_read_length` ESDUs long), instead of one read per window.
+    Parts of windows outside sv (see `get_window` at the array end) are NaN.
+
+    Args:
+        sv: Sv with 'channel', 'time' and 'depth' dimensions
+        windows: (n, 4) array of (xmin, xmax, ymin, ymax) windows of identical size, bounds included
+            (e.g. from `get_windows(..., window_shape=...)`)
+        channels: channels of the patches
+        max_read_length: maximum time length of a grouped read
+
+    Returns:
+        np.ndarray: float32 array of shape (n, C, W, H), in the order of `windows`
+    """
+    windows = np.asarray(windows, dtype=np.int64).reshape(-1, 4)
+    widths, heights = windows[:, 1] - windows[:, 0] + 1, windows[:, 3] - windows[:, 2] + 1
+    if len(windows) and ((widths != widths[0]).any() or (heights != heights[0]).any()):
+        raise ValueError("All windows must have the same shape.")
+
+    sv = sv.sel(channel=channels).transpose("channel", "time", "depth")
+    n_c, xlen, ylen = sv.shape
+    n = len(windows)
+    patches = np.full((n, n_c, widths[0] if n else 0, heights[0] if n else 0), np.nan, dtype=np.float32)
+
+    # Group consecutive windows (in time order) while the group span stays under max_read_length
+    order = np.argsort(windows[:, 0], kind="stable")
+    start = 0
+    while start < n:
+        stop = start + 1
+        t0 = windows[order[start], 0]
+        while stop < n and windows[order[stop], 1] - t0 < max_read_length:
+            stop += 1
+        group = order[start:stop]
+
+        # One read covering all windows of the group, cropped to sv
+        x0, x1 = max(windows[group, 0].min(), 0), min(windows[group, 1].max() + 1, xlen)
+        y0, y1 = max(windows[group, 2].min(), 0), min(windows[group, 3].max() + 1, ylen)
+        block = sv.isel(time=slice(x0, x1), depth=slice(y0, y1)).values
+
+        for i in group:
+            xmin, xmax, ymin, ymax = windows[i]
+            bx0, bx1 = max(xmin, 0), min(xmax + 1, xlen)
+            by0, by1 = max(ymin, 0), min(ymax + 1, ylen)
+            patches[i, :, bx0 - xmin:bx1 - xmin, by0 - ymin:by1 - ymin] = block[:, bx0 - x0:bx1 - x0, by0 - y0:by1 - y0]
+
+        start = stop
+
+    return patches
+
+
+
 
 def mask_from_rectangle(mask_shape, points):
     mask = np.zeros(mask_shape)
 
-    mask[points[:, 0].min():points[:, 0].max()+1, 
-         points[:, 1].min():points[:, 1].max()+1] = 1
+    # Rectangles may start before the mask (e.g. on a block of their bbox)
+    mask[max(points[:, 0].min(), 0):points[:, 0].max()+1, 
+         max(points[:, 1].min(), 0):points[:, 1].max()+1] = 1
     
     return (mask == 1)
 
 
 
 def mask_from_polygon(mask_shape, points):
+    from skimage.draw import polygon     # imported at first use (slow import)
+
     mask = np.zeros(mask_shape)
 
     rr, cc = polygon(
@@ -161,11 +269,36 @@ def get_mask(
 
 
 
+def get_pooling_factor(n_time: int, n_depth: int, max_pixels: int | None) -> int:
+    """Smallest factor such that a (n_time, n_depth) array pooled by this factor on both axes (see `pool_sv`)
+    has at most max_pixels pixels. 1 when the array fits already or max_pixels is None.
+    """
+    if (max_pixels is None) or (n_time * n_depth <= max_pixels):
+        return 1
+
+    factor = max(int(np.ceil(np.sqrt(n_time * n_depth / max_pixels))), 2)
+    while -(-n_time // factor) * -(-n_depth // factor) > max_pixels:
+        factor += 1
+    return factor
+
+
+
+@instrumented("echotypes.get_roi_Sv")
 def get_roi_Sv(
     sv: xr.DataArray,
     shape: dict, 
-    frequencies=[38, 70, 120, 200]
+    frequencies=[38, 70, 120, 200],
+    dropout_depths: dict | None = None,
+    factor: int = 1,
 ):
+    """Sv values of the pixels of an ROI shape (NaN outside the shape), over its bbox.
+
+    With dropout_depths ({channel: depth in m}), Sv beyond the dropout depth of each channel is NaN and is not read.
+
+    With factor > 1, the bbox is pooled by factor on time and depth (see `pool_sv`, blocks start on the bbox
+    corner) and the shape is drawn on the pooled grid: a lower resolution preview of large ROIs, computed
+    chunk by chunk without loading the full resolution values in memory.
+    """
     # Fetch shape points
     points = np.array(shape["points"])
     bbox = shape["it_min"], shape["it_max"], shape["iz_min"], shape["iz_max"]
@@ -173,9 +306,15 @@ def get_roi_Sv(
 
     # Slice sv using bbox (avoids hard loading all the sv values)
     bbox_sv = sv.isel(time=slice(xmin, xmax+1), depth=slice(ymin, ymax+1)).sel(channel=frequencies)
+    bbox_sv = apply_dropout_depths(bbox_sv, dropout_depths)
 
     # Get mask
-    mask = get_mask(window=bbox, points=points)
+    if factor > 1:
+        bbox_sv = pool_sv(bbox_sv, factor)
+        points = (points - [xmin, ymin]) // factor
+        mask = get_mask(window=(0, bbox_sv.sizes["time"]-1, 0, bbox_sv.sizes["depth"]-1), points=points)
+    else:
+        mask = get_mask(window=bbox, points=points)
 
     # Convert mask to DataArray
     mask_da = xr.DataArray(
@@ -244,6 +383,19 @@ def compute_delta_sv(
 
 
 
+def get_features(roi_sv: xr.DataArray, features: str, ref_frequency: float) -> xr.DataArray:
+    """Clustering features of ROI pixels, one of ['Sv', 'Delta Sv'], with a 'channel' dimension."""
+    if features == "Sv":
+        return roi_sv
+
+    if features == "Delta Sv":
+        data = compute_delta_sv(roi_sv, ref_frequency)
+        return data.squeeze("reference_frequency", drop=True) # remove reference frequency dim for use in stack_pixels
+
+    raise ValueError(f"Clustering features must be one of ['Sv', 'Delta Sv']. Current input: '{features}'")
+
+
+
 def stack_pixels(da: xr.DataArray):
 
     # Stack spatial dimensions
@@ -259,6 +411,68 @@ def stack_pixels(da: xr.DataArray):
 
 
 
+def stratified_sample(
+    X: xr.DataArray,
+    sample_size: int,
+    strata: tuple[int, int] = (10, 10),
+    random_state: int = 0,
+) -> np.ndarray:
+    """Draw a subsample of stacked pixels, stratified over time and depth.
+
+    The ROI is cut into a grid of `strata` (time x depth) blocks and each block contributes
+    pixels in proportion to its number of valid (non-NaN) pixels.
+
+    Args:
+        X (xr.DataArray): stacked pixels, as returned by `stack_pixels`.
+        sample_size (int): number of pixels to draw. All pixels are returned if X has fewer.
+        strata (tuple[int, int], optional): number of blocks along time and depth. Defaults to (10, 10).
+        random_state (int, optional): seed of the random generator. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: sorted positional indices of the sampled pixels along the 'pixel' dimension.
+    """
+    n_pixels = X.sizes["pixel"]
+    if sample_size >= n_pixels:
+        return np.arange(n_pixels)
+
+    # Positions of each pixel in the ROI window, from the stacked MultiIndex
+    pixel_index = X.indexes["pixel"]
+    t_codes = np.asarray(pixel_index.codes[0], dtype=np.int64)   # pandas stores codes as small ints
+    z_codes = np.asarray(pixel_index.codes[1], dtype=np.int64)
+    n_t, n_z = len(pixel_index.levels[0]), len(pixel_index.levels[1])
+
+    # Stratum of each pixel
+    st, sz = min(strata[0], n_t), min(strata[1], n_z)
+    stratum = (t_codes * st // n_t) * sz + (z_codes * sz // n_z)
+
+    # Proportional allocation, remainders going to the largest fractional parts
+    counts = np.bincount(stratum, minlength=st * sz)
+    quota_exact = sample_size * counts / n_pixels
+    quota = np.floor(quota_exact).astype(int)
+    remainder = sample_size - quota.sum()
+    quota[np.argsort(quota_exact - quota)[::-1][:remainder]] += 1
+
+    # Random rank of each pixel within its stratum
+    rng = np.random.default_rng(random_state)
+    order = rng.permutation(n_pixels)
+    order = order[np.argsort(stratum[order], kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n_pixels) - starts[stratum[order]]
+
+    return np.sort(order[rank < quota[stratum[order]]])
+
+
+
+def label_stability(labels_a: np.ndarray, labels_b: np.ndarray) -> float:
+    """Agreement between two clusterings of the same pixels (adjusted Rand index, 1 is identical up to label permutation).
+    """
+    from sklearn.metrics import adjusted_rand_score
+
+    return adjusted_rand_score(labels_a, labels_b)
+
+
+
+@instrumented("echotypes.cluster_roi")
 def cluster_roi(
     roi_sv: xr.DataArray,
     features: str,
@@ -266,9 +480,42 @@ def cluster_roi(
     n_clusters: int, 
     ref_frequency: float,
     random_state: int=0,
+    fit_sample_size: int | None=None,
+    report_stability: bool=False,
+    summary: bool=False,
+    dropout_depths: dict | None=None,
 ):
+    """Cluster the pixels of an ROI on their Sv or ΔSv values.
+
+    When `fit_sample_size` is set and the ROI holds more valid pixels, the model is fitted on a
+    stratified subsample (see `stratified_sample`) and every pixel is then labelled with `model.predict`.
+    This bounds the fit cost regardless of the ROI size.
+
+    Args:
+        roi_sv (xr.DataArray): ROI Sv values, as returned by `get_roi_Sv`.
+        features (str): one of ['Sv', 'Delta Sv'].
+        method (str): one of ['KMeans', 'GMM'].
+        n_clusters (int): number of clusters.
+        ref_frequency (float): reference channel for 'Delta Sv' features.
+        random_state (int, optional): Defaults to 0.
+        fit_sample_size (int | None, optional): maximum number of pixels used for fitting. Defaults to None (all pixels).
+        report_stability (bool, optional): when the fit is subsampled, also fit on all pixels and store the
+            adjusted Rand index between both labellings in `labels_da.attrs['label_stability']`. Defaults to False.
+        summary (bool, optional): also return the per-cluster summary of `summarize_clusters`. Defaults to False.
+        dropout_depths (dict | None, optional): {channel: depth in m} beyond which Sv is ignored (see
+            `apply_dropout_depths`), if not applied by `get_roi_Sv` already. Channels with no valid Sv in the
+            ROI are left out (the channels used are stored in `labels_da.attrs['channels']`). Defaults to None.
+
+    Returns:
+        tuple[xr.DataArray, model, xr.Dataset | None]: (time, depth) labels, fitted model and per-cluster summary
+            (None if not `summary`).
+    """
     
-    # Create clustering model
+    # Create clustering model (scikit-learn is imported at first use, for a fast app and scripts startup)
+    from sklearn.base import clone
+    from sklearn.cluster import KMeans
+    from sklearn.mixture import GaussianMixture
+
     if method == "KMeans":
         model = KMeans(n_clusters=n_clusters, random_state=random_state, n_init="auto")
     elif method == "GMM":
@@ -276,22 +523,37 @@ def cluster_roi(
     else:
         raise ValueError(f"Clustering method must be one of ['KMeans', 'GMM']. Current input: '{method}'")
 
+    roi_sv = apply_dropout_depths(roi_sv, dropout_depths).compute()
+
+    # Channels without any valid Sv in the ROI (e.g. ROI beyond their dropout depth) are left out, instead of
+    # invalidating every pixel
+    empty = roi_sv.isnull().all(("time", "depth")).values
+    if empty.all():
+        raise ValueError("No valid pixel to cluster in the ROI (Sv is NaN on all channels).")
+    if empty.any():
+        if features == "Delta Sv" and float(ref_frequency) in roi_sv.channel.values[empty]:
+            raise ValueError(f"No valid Sv on the reference channel ({ref_frequency} kHz) in the ROI, e.g. beyond its dropout depth.")
+        roi_sv = roi_sv.isel(channel=~empty)
+
     # Get the right variables (Sv or Delta Sv)
-    if features == "Sv":
-        data = roi_sv
-    
-    elif features == "Delta Sv":
-        data = compute_delta_sv(roi_sv, ref_frequency)
-        data = data.squeeze("reference_frequency", drop=True) # remove reference frequency dim for use in stack_pixels
-    
-    else:
-        raise ValueError(f"Clustering features must be one of ['Sv', 'Delta Sv']. Current input: '{features}'")
+    data = get_features(roi_sv, features, ref_frequency)
 
     # Stack pixels of data into clustering compatible format
     X = stack_pixels(data)
-
-    # Run clustering
-    labels = model.fit_predict(X.values)
+    values = X.values
+    n_pixels = values.shape[0]
+    if n_pixels == 0:
+        raise ValueError("No valid pixel to cluster in the ROI (Sv is NaN on at least one channel, e.g. beyond its dropout depth).")
+
+    # Run clustering, on a stratified subsample of pixels for large ROIs
+    if (fit_sample_size is not None) and (n_pixels > fit_sample_size):
+        sample_idx = stratified_sample(X, fit_sample_size, random_state=random_state)
+        model.fit(values[sample_idx])
+        labels = model.predict(values)
+        n_fit = len(sample_idx)
+    else:
+        labels = model.fit_predict(values)
+        n_fit = n_pixels
 
     # Create label DataArray
     labels_pixel = xr.DataArray(
@@ -302,5 +564,213 @@ def cluster_roi(
 
     # Unstack to (time, depth)
     labels_da = labels_pixel.unstack("pixel")
-    
-    return labels_da, model
\ No newline at end of file
+    labels_da.attrs.update({"n_pixels": n_pixels, "n_fit_pixels": n_fit, "channels": roi_sv.channel.values.tolist()})
+
+    # Compare with a fit on all pixels
+    if report_stability and (n_fit < n_pixels):
+        full_labels = clone(model).fit_predict(values)
+        labels_da.attrs["label_stability"] = label_stability(labels, full_labels)
+
+    cluster_summary = None
+    if summary:
+        # Same valid pixels, in the same order, as the clustered features
+        sv_values = values if features == "Sv" else stack_pixels(roi_sv).values
+        cluster_summary = summarize_clusters(sv_values, labels, n_clusters, roi_sv.channel.values, ref_frequency)
+
+    return labels_da, model, cluster_summary
+
+
+@instrumented("echotypes.predict_roi_labels")
+def predict_roi_labels(
+    sv: xr.DataArray,
+    shape: dict,
+    model,
+    features: str,
+    frequencies=[38, 70, 120, 200],
+    ref_frequency: float = 38.,
+    dropout_depths: dict | None = None,
+    block_pixels: int = 1_000_000,
+    progress=None,
+) -> np.ndarray:
+    """Full resolution labels of an ROI with a fitted clustering model, e.g. fitted on a pooled preview of the ROI
+    (see `get_roi_Sv` and `cluster_roi`).
+
+    The ROI is read and labelled by blocks of ESDUs of at most block_pixels pixels, so that memory stays bounded
+    by the labels array whatever the ROI size.
+
+    Args:
+        sv (xr.DataArray): full resolution Sv.
+        shape (dict): ROI shape, as returned by `get_shape`.
+        model: fitted model, with the features, frequencies and ref_frequency of its fit.
+        features (str): one of ['Sv', 'Delta Sv'].
+        frequencies (list, optional): Defaults to [38, 70, 120, 200].
+        ref_frequency (float, optional): reference channel for 'Delta Sv' features. Defaults to 38.
+        dropout_depths (dict | None, optional): see `get_roi_Sv`. Defaults to None.
+        block_pixels (int, optional): maximum number of pixels read at once. Defaults to 1_000_000.
+        progress (callable | None, optional): called with the fraction of ESDUs done after each block. Defaults to None.
+
+    Returns:
+        numpy.ndarray: int8 labels of shape (time, depth) over the ROI bbox, -1 outside the shape and for pixels
+            with NaN features.
+    """
+    xmin, xmax, ymin, ymax = shape["it_min"], shape["it_max"], shape["iz_min"], shape["iz_max"]
+    labels = np.full((xmax - xmin + 1, ymax - ymin + 1), -1, dtype=np.int8)
+    step = max(block_pixels // labels.shape[1], 1)
+
+    for t0 in range(xmin, xmax + 1, step):
+        t1 = min(t0 + step - 1, xmax)
+        roi_sv = get_roi_Sv(sv, dict(shape, it_min=t0, it_max=t1), frequencies, dropout_depths=dropout_depths)
+        data = get_features(roi_sv, features, ref_frequency).transpose("time", "depth", "channel")
+
+        values = data.values.reshape(-1, data.sizes["channel"])
+        valid = ~np.isnan(values).any(axis=1)
+        block = labels[t0 - xmin:t1 - xmin + 1].reshape(-1)    # view
+        if valid.any():
+            block[valid] = model.predict(values[valid])
+
+        if progress is not None:
+            progress((t1 - xmin + 1) / labels.shape[0])
+
+    return labels
+
+
+
+# Per-cluster statistics
+
+DELTA_SV_BIN_EDGES = np.arange(-50., 50. + 0.5, 0.5)    # ΔSv histograms bins (dB)
+
+
+def grouped_histograms(
+    values: np.ndarray,
+    labels: np.ndarray,
+    n_groups: int,
+    bin_edges: np.ndarray = DELTA_SV_BIN_EDGES,
+) -> np.ndarray:
+    """Histograms of each column of values, for each group, in a single `np.bincount` pass.
+
+    Bins are assumed to be regularly spaced. Values outside of the bins are ignored and the last bin
+    includes its right edge, as in `np.histogram`.
+
+    Args:
+        values (numpy.ndarray): array of shape (n_pixels, n_channels).
+        labels (numpy.ndarray): integer group of each pixel, in [0, n_groups).
+        n_groups (int): number of groups.
+        bin_edges (numpy.ndarray, optional): Defaults to DELTA_SV_BIN_EDGES.
+
+    Returns:
+        numpy.ndarray: counts of shape (n_groups, n_channels, n_bins).
+    """
+    n_pixels, n_channels = values.shape
+    n_bins = len(bin_edges) - 1
+
+    bins = np.floor((values - bin_edges[0]) / (bin_edges[1] - bin_edges[0])).astype(np.int64)
+    bins[values == bin_edges[-1]] = n_bins - 1
+    valid = (bins >= 0) & (bins < n_bins)
+
+    flat = (labels[:, None] * n_channels + np.arange(n_channels)) * n_bins + bins
+    counts = np.bincount(flat[valid], minlength=n_groups * n_channels * n_bins)
+
+    return counts.reshape(n_groups, n_channels, n_bins)
+
+
+def grouped_mean_sd(values: np.ndarray, labels: np.ndarray, n_groups: int):
+    """Mean and (population) standard deviation of each column of values, for each group.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: arrays of shape (n_groups, n_channels). NaN for empty groups.
+    """
+    counts = np.bincount(labels, minlength=n_groups).astype(np.float64)[:, None]
+    sums = np.stack([np.bincount(labels, weights=v, minlength=n_groups) for v in values.T], axis=1)
+    sums_sq = np.stack([np.bincount(labels, weights=v**2, minlength=n_groups) for v in values.T], axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+        sd = np.sqrt(np.maximum(sums_sq / counts - mean**2, 0))
+
+    return mean, sd
+
+
+def grouped_quantiles(values: np.ndarray, labels: np.ndarray, n_groups: int, q: np.ndarray) -> np.ndarray:
+    """Quantiles (linear interpolation, as `np.quantile`) of each column of values, for each group.
+
+    Pixels are ordered by group once, then the order statistics of each group are selected with
+    `np.partition` (linear time) for all columns at once.
+
+    Returns:
+        numpy.ndarray: array of shape (n_groups, n_channels, len(q)). NaN for empty groups.
+    """
+    counts = np.bincount(labels, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    grouped_values = np.ascontiguousarray(values[np.argsort(labels, kind="stable")].T)    # (n_channels, n_pixels)
+
+    quantiles = np.full((n_groups, values.shape[1], len(q)), np.nan)
+    for g in np.flatnonzero(counts):
+        pos = np.asarray(q) * (counts[g] - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, counts[g] - 1)
+        frac = pos - lo
+
+        part = np.partition(grouped_values[:, starts[g]:starts[g] + counts[g]], np.unique(np.concatenate([lo, hi])), axis=1)
+        quantiles[g] = part[:, lo] * (1 - frac) + part[:, hi] * frac
+
+    return quantiles
+
+
+def summarize_clusters(
+    sv_values: np.ndarray,
+    labels: np.ndarray,
+    n_clusters: int,
+    channels: np.ndarray,
+    ref_frequency: float,
+    q: tuple[float, ...] = (0.05, 0.25, 0.5, 0.75, 0.95),
+) -> xr.Dataset:
+    """Per-cluster summary of Sv and ΔSv, computed by grouped reductions over the pixel matrix.
+
+    Args:
+        sv_values (numpy.ndarray): Sv of the clustered pixels, shape (n_pixels, n_channels).
+        labels (numpy.ndarray): cluster of each pixel, in [0, n_clusters).
+        n_clusters (int): number of clusters.
+        channels (numpy.ndarray): channel frequencies of sv_values columns (kHz).
+        ref_frequency (float): reference channel for ΔSv.
+        q (tuple[float, ...], optional): quantiles. Defaults to (0.05, 0.25, 0.5, 0.75, 0.95).
+
+    Returns:
+        xr.Dataset: variables 'n_pixels' (cluster), 'sv_{mean,sd}' (cluster, channel), 'sv_quantiles'
+            (cluster, channel, quantile), 'delta_sv_{mean,sd}' (cluster, delta_channel), 'delta_sv_quantiles'
+            (cluster, delta_channel, quantile) and 'delta_sv_hist' (cluster, delta_channel, delta_sv_bin).
+    """
+    channels = np.asarray(channels)
+    labels = np.asarray(labels, dtype=np.int64)
+    ref_idx = int(np.flatnonzero(channels == ref_frequency)[0])
+    other_idx = [i for i in range(len(channels)) if i != ref_idx]
+
+    delta_sv_values = sv_values[:, other_idx] - sv_values[:, [ref_idx]]
+
+    sv_mean, sv_sd = grouped_mean_sd(sv_values, labels, n_clusters)
+    delta_sv_mean, delta_sv_sd = grouped_mean_sd(delta_sv_values, labels, n_clusters)
+
+    return xr.Dataset(
+        data_vars={
+            "n_pixels": ("cluster", np.bincount(labels, minlength=n_clusters)),
+            "sv_mean": (("cluster", "channel"), sv_mean),
+            "sv_sd": (("cluster", "channel"), sv_sd),
+            "sv_quantiles": (("cluster", "channel", "quantile"), grouped_quantiles(sv_values, labels, n_clusters, q)),
+            "delta_sv_mean": (("cluster", "delta_channel"), delta_sv_mean),
+            "delta_sv_sd": (("cluster", "delta_channel"), delta_sv_sd),
+            "delta_sv_quantiles": (("cluster", "delta_channel", "quantile"),
+                                   grouped_quantiles(delta_sv_values, labels, n_clusters, q)),
+            "delta_sv_hist": (("cluster", "delta_channel", "delta_sv_bin"),
+                              grouped_histograms(delta_sv_values, labels, n_clusters)),
+        },
+        coords={
+            "cluster": np.arange(n_clusters),
+            "channel": channels,
+            "delta_channel": channels[other_idx],
+            "quantile": np.asarray(q),
+            "delta_sv_bin": (DELTA_SV_BIN_EDGES[:-1] + DELTA_SV_BIN_EDGES[1:]) / 2,
+        },
+        attrs={
+            "ref_frequency": ref_frequency,
+            "delta_sv_bin_width": DELTA_SV_BIN_EDGES[1] - DELTA_SV_BIN_EDGES[0],
+        },
+    )
@@ -0,0 +1,76 @@
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, get_ident
+import hashlib
+import json
+import os
+import numpy as np
+
+
+# Full resolution labels of ROI clusterings computed on a pooled preview (ROIs above the pixel budget of the app).
+# Labels are computed in a background thread of the worker that clustered the preview, and saved as
+# labels_dir/<key>.npy (int8 (time, depth) over the ROI bbox, -1 outside the ROI), so that every worker of a
+# multi-process server sees them once they are ready. The key is a hash of the ROI and clustering parameters.
+
+def get_labels_key(**params) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class LabelPropagator:
+    def __init__(self, labels_dir: Path, max_workers: int = 1):
+        self.labels_dir = Path(labels_dir)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="escore-labels")
+        self._jobs = {}     # key -> fraction done, or the exception of a failed job (jobs of this worker)
+        self._lock = Lock()
+
+    def path(self, key: str) -> Path:
+        return self.labels_dir / f"{key}.npy"
+
+    def submit(self, key: str, func, *args, **kwargs):
+        """Compute and save the labels returned by func(*args, progress=..., **kwargs), unless they are saved
+        or being computed by this worker already.
+        """
+        with self._lock:
+            if self.path(key).is_file() or isinstance(self._jobs.get(key), float):
+                return
+            self._jobs[key] = 0.
+        self._executor.submit(self._run, key, func, args, kwargs)
+
+    def _progress(self, key: str, fraction: float):
+        with self._lock:
+            self._jobs[key] = fraction
+
+    def _run(self, key, func, args, kwargs):
+        try:
+            labels = func(*args, progress=lambda fraction: self._progress(key, fraction), **kwargs)
+
+            # Write to a file unique to the process and thread, then rename (atomic for readers of other workers)
+            self.labels_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.labels_dir / f"{key}.{os.getpid()}-{get_ident()}.tmp.npy"
+            np.save(tmp_path, labels)
+            os.replace(tmp_path, self.path(key))
+            with self._lock:
+                del self._jobs[key]
+        except Exception as e:
+            with self._lock:
+                self._jobs[key] = e
+
+    def status(self, key: str) -> tuple[str, float | str | None]:
+        """One of ('ready', None), ('running', fraction done), ('failed', error message) or ('pending', None)
+        (not saved yet, running in another worker or not submitted).
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+        if isinstance(job, Exception):
+            return "failed", str(job)
+        if self.path(key).is_file():
+            return "ready", None
+        if job is not None:
+            return "running", job
+        return "pending", None
+
+    def load(self, key: str) -> np.ndarray | None:
+        return np.load(self.path(key)) if self.path(key).is_file() else None
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,116 @@
+from flask import Response, request, jsonify, abort
+
+from escore.registry import ROIRegistry
+
+
+# Leaflet viewer of the tiles, in pixel coordinates (CRS.Simple).
+# Map zoom z shows pyramid level (max_zoom - z): pan/zoom are only exact for a pyramid factor of 2 on both axes.
+viewer_html = """<!DOCTYPE html>
+<html>
+<head>
+  <title>Echogram viewer</title>
+  <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+  <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+  <style>html, body, #map {{ height: 100%; margin: 0; background: #000; }}</style>
+</head>
+<body>
+<div id="map"></div>
+<script>
+  const maxZoom = {max_zoom};
+  const map = L.map("map", {{crs: L.CRS.Simple, minZoom: 0, maxZoom: maxZoom}});
+  const toLatLng = (p) => map.unproject([p[0], p[1]], maxZoom);
+  const bounds = L.latLngBounds(toLatLng([0, 0]), toLatLng([{n_time}, {n_depth}]));
+
+  L.tileLayer("{url_prefix}/{{z}}/{{x}}/{{y}}.png" + window.location.search, {{
+    tileSize: {tile_size}, zoomReverse: true, maxZoom: maxZoom, bounds: bounds, noWrap: true
+  }}).addTo(map);
+  map.fitBounds(bounds);
+
+  fetch("{url_prefix}/rois.json").then(r => r.json()).then(shapes => shapes.forEach(s => {{
+    const points = s.points.map(toLatLng);
+    const layer = (points.length == 2) ? L.rectangle(points) : L.polygon(points);
+    layer.setStyle({{color: "red", weight: 1, fill: false}}).bindTooltip(s.id).addTo(map);
+  }}));
+</script>
+</body>
+</html>
+"""
+
+
+def parse_tile_args(args, survey_channels) -> tuple[float, float, float | list[float], str]:
+    """(vmin, vmax, channels, cmap) of the query parameters of a tile request.
+
+    Raises:
+        ValueError: on values that can't be parsed, channels that are not in survey_channels, or an unknown
+            colormap ('RGB' needs 3 channels, matplotlib colormaps a single one).
+    """
+    vmin, vmax = float(args.get("vmin", -90.)), float(args.get("vmax", -50.))
+    if not vmin < vmax:
+        raise ValueError(f"vmin must be lower than vmax. Current input: {vmin}, {vmax}")
+
+    channels = [float(c) for c in args.get("channels", "38,70,120").split(",")]
+    missing = [c for c in channels if c not in survey_channels]
+    if missing:
+        raise ValueError(f"Channels {missing} are not in the survey channels {list(survey_channels)}")
+
+    echogram_cmap = args.get("cmap", "RGB")
+    if echogram_cmap == "RGB":
+        if len(channels) != 3:
+            raise ValueError(f"The RGB colormap needs 3 channels. Current input: {channels}")
+        return vmin, vmax, channels, echogram_cmap
+
+    from matplotlib import colormaps     # imported at first use (slow import)
+    if echogram_cmap not in colormaps:
+        raise ValueError(f"Unknown colormap '{echogram_cmap}'")
+    if len(channels) != 1:
+        raise ValueError(f"Colormap '{echogram_cmap}' needs a single channel. Current input: {channels}")
+    return vmin, vmax, channels[0], echogram_cmap
+
+
+def register_tile_routes(server, renderer, registry_path, root_path, url_prefix="/tiles"):
+    """Add the tile endpoints to the Flask server of a Dash app.
+
+    - `{url_prefix}/<level>/<t_tile>/<z_tile>.png`: tile PNG. Query parameters `vmin`, `vmax` (dB),
+      `channels` (comma separated kHz) and `cmap` default to -90, -50, 38,70,120 and RGB. Invalid values
+      return 400 (see `parse_tile_args`), tiles outside the pyramid 404.
+    - `{url_prefix}/rois.json`: valid ROI shapes of the registry, in full resolution indices.
+    - `{url_prefix}/viewer`: pan/zoom viewer of the whole survey with ROI overlays.
+    """
+
+    survey_channels = [float(c) for c in renderer.pyramid.levels[0].channel.values]
+
+    @server.route(f"{url_prefix}/<int:level>/<int:t_tile>/<int:z_tile>.png")
+    def get_tile(level, t_tile, z_tile):
+        if level >= len(renderer.pyramid):
+            abort(404)
+        n_t, n_z = renderer.n_tiles(level)
+        if (t_tile >= n_t) or (z_tile >= n_z):
+            abort(404)
+
+        try:
+            vmin, vmax, channels, echogram_cmap = parse_tile_args(request.args, survey_channels)
+        except ValueError as e:
+            abort(400, description=str(e))
+
+        png = renderer.get(level, t_tile, z_tile, vmin, vmax, channels, echogram_cmap)
+
+        response = Response(png, mimetype="image/png")
+        response.headers["Cache-Control"] = "public, max-age=3600"
+        return response
+
+    @server.route(f"{url_prefix}/rois.json")
+    def get_rois():
+        with ROIRegistry(db_path=registry_path, root_path=root_path) as registry:
+            shapes = registry.fetch_valid()
+        return jsonify(shapes)
+
+    @server.route(f"{url_prefix}/viewer")
+    def get_viewer():
+        sv = renderer.pyramid.levels[0]
+        return viewer_html.format(
+            max_zoom=len(renderer.pyramid) - 1,
+            n_time=sv.sizes["time"],
+            n_depth=sv.sizes["depth"],
+            tile_size=renderer.tile_size,
+            url_prefix=url_prefix,
+        )
@@ -0,0 +1,51 @@
+from pathlib import Path
+import os
+
+from escore.config import load_config
+from escore.instrument import configure_from_config
+from escore.io import load_survey_ds
+from escore.registry import ROIRegistry
+from escore.pyramid import SvPyramid, get_pyramid_dir
+from escore.tiles import get_tiles_dir
+from escore.display import get_display_dir, open_display_cubes
+from .app import create_app
+
+
+# WSGI entry point of the echo-types app, for multi-process servers:
+#   ESCORE_CONFIG=scripts/config.yml gunicorn -c scripts/gunicorn.conf.py "escore.apps.echotypes.wsgi:create_server()"
+# Each worker builds its own app after fork (no preload): the survey files, pyramid levels and registry are opened
+# per worker, as HDF5 file handles can't be shared across a fork. Display cubes are memory-mapped, so their pages
+# are shared by all workers through the page cache. Tiles are cached in memory per worker, and on disk in
+# interim_dir/<ei>/tiles for all workers.
+
+def build_app(config: dict, root_path: Path):
+    """Echo-types app of the session of a global config, with a lazily opened survey."""
+    ei = config["session"]["ei"]
+    registry_path = Path(config["paths"]["interim_dir"]) / ei / config["session"]["name"] / "roi_registry.db"
+
+    with ROIRegistry(db_path=registry_path, root_path=root_path) as registry:
+        roi_ids = registry.list_ids()
+
+    sv = load_survey_ds(survey=ei, config=config)["Sv"]
+
+    return create_app(sv, registry_path, root_path, roi_ids,
+                      app_config=config.get("echotypes_app", {}),
+                      pyramid=SvPyramid(sv, get_pyramid_dir(config, ei)),
+                      tile_cache_dir=get_tiles_dir(config, ei),
+                      display_cubes=open_display_cubes(get_display_dir(config, ei)))
+
+
+def create_server(config_path: str | Path | None = None, root_path: str | Path | None = None):
+    """WSGI application (Flask server of the Dash app), built in the calling worker process.
+
+    Args:
+        config_path (str | Path | None, optional): global config. Defaults to the ESCORE_CONFIG environment
+            variable, or scripts/config.yml.
+        root_path (str | Path | None, optional): root of the relative paths of the config. Defaults to the
+            ESCORE_ROOT environment variable, or the current directory.
+    """
+    config = load_config(config_path or os.environ.get("ESCORE_CONFIG", "scripts/config.yml"))
+    configure_from_config(config)    # optional timing instrumentation (statistics are per worker)
+
+    root_path = Path(root_path or os.environ.get("ESCORE_ROOT", ".")).resolve()
+    return build_app(config, root_path).server
@@ -1,14 +1,19 @@
 from pathlib import Path
 import numpy as np
 from PIL import Image
-import matplotlib.pyplot as plt
-from tqdm import tqdm
+import dask
+import io
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from dataclasses import dataclass, asdict
 from pathlib import Path
 import json
 
-from escore.io import load_survey_ds
+from escore.io import load_survey_ds, apply_dropout_depths, DEFAULT_DROPOUT_DEPTHS
+from escore.instrument import instrumented, stage
+from escore.execution import ExecutionConfig
 
 # Sv to Image tools
 
@@ -28,6 +33,7 @@ def sv_array2image(a:np.ndarray, vmin:float=-90., vmax:float=-50., echogram_cmap
         img = Image.fromarray(np.uint8(a*255))
     elif (len(a.shape)==2) and (echogram_cmap != 'RGB'):
         a = a.T
+        import matplotlib.pyplot as plt     # imported at first use (slow import)
         cmap = plt.get_cmap(echogram_cmap)
         img = Image.fromarray(np.uint8(cmap(a)*255))
     else:
@@ -36,19 +42,207 @@ def sv_array2image(a:np.ndarray, vmin:float=-90., vmax:float=-50., echogram_cmap
     return img
 
 
+IMAGE_FORMATS = ["png", "webp", "raw"]
+
+
+def sv_array2display(a:np.ndarray, vmin:float=-90., vmax:float=-50.):
+    """uint8 display values of a Sv array, as in `sv_array2image` but without colormap and in (time, depth) order.
+
+    Returns:
+        np.ndarray: shape (time, depth, channel) for a (channel, time, depth) array, (time, depth) for a (time, depth) array.
+    """
+    a = (a - vmin) / (vmax - vmin)
+    a = np.clip(a, 0, 1)
+    a = np.nan_to_num(a, nan=0)
+    if len(a.shape) == 3:
+        a = a.transpose(1, 2, 0)
+    return np.uint8(a*255)
+
+
+def image_save_kwargs(image_format:str="png", compress_level:int=None, fast_encode:bool=False) -> dict:
+    """PIL save options of a frame image format.
+
+    - png: zlib `compress_level` in [0, 9] (PIL default: 6). `fast_encode` uses level 1.
+    - webp: lossless, `compress_level` in [0, 6] is the encoder method (effort). `fast_encode` uses method 0.
+    """
+    if image_format == "png":
+        level = 1 if fast_encode else compress_level
+        return {"format": "png"} if level is None else {"format": "png", "compress_level": level}
+    if image_format == "webp":
+        kwargs = {"format": "webp", "lossless": True}
+        if fast_encode:
+            kwargs.update(method=0, quality=0)
+        elif compress_level is not None:
+            kwargs.update(method=min(compress_level, 6))
+        return kwargs
+    raise ValueError(f"Image format must be one of ['png', 'webp']. Current input: '{image_format}'")
+
+
+def frame_image_name(ei, t0, t1, z_min_idx, z_max_idx, vmin, vmax, ext="png"):
+    return f"{ei}_T{t0}-{t1}_Z{z_min_idx}-{z_max_idx}_Sv{vmin}-{vmax}.{ext}"
+
+
+def raw_store_name(ei, z_min_idx, z_max_idx, vmin, vmax):
+    return f"{ei}_Z{z_min_idx}-{z_max_idx}_Sv{vmin}-{vmax}.npy"
+
+
+def create_raw_store(path:Path, n_time:int, n_depth:int, n_channels:int|None=None) -> np.memmap:
+    """Memory-mapped uint8 array of display values (see `sv_array2display`), saved as a .npy file.
+
+    Shape is (time, depth, channel), or (time, depth) when n_channels is None: frames are contiguous blocks.
+    """
+    shape = (n_time, n_depth) if n_channels is None else (n_time, n_depth, n_channels)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=shape)
+
+
 def slice_time(sv, frame_size):
     n = len(sv.time)
     return list(range(0, n, frame_size)) + [n]
 
 
-def plot_survey_RGB(sv, frame_size, z_min_idx, z_max_idx, vmin, vmax, channels, echogram_cmap, ei_save_path, ei):
+def encode_frame(sv_array, vmin, vmax, echogram_cmap, image_format="png", save_kwargs=None):
+    """Encoded frame: image file bytes, or uint8 display values for the raw format."""
+    if image_format == "raw":
+        return sv_array2display(sv_array, vmin, vmax)
+
+    img = sv_array2image(sv_array, vmin, vmax, echogram_cmap)
+    buffer = io.BytesIO()
+    img.save(buffer, **(save_kwargs or {"format": image_format}))
+    return buffer.getvalue()
+
+
+def write_frame(frame, path, t0):
+    """Write an encoded frame to its image file, or to the raw store at ESDU t0."""
+    if isinstance(frame, bytes):
+        path.write_bytes(frame)
+    else:
+        store = np.load(path, mmap_mode="r+")
+        store[t0:t0+len(frame)] = frame
+        store.flush()
+    return path
+
+
+def save_frame(sv_array, vmin, vmax, echogram_cmap, path, t0, image_format="png", save_kwargs=None):
+    return write_frame(encode_frame(sv_array, vmin, vmax, echogram_cmap, image_format, save_kwargs), path, t0)
+
+
+def plot_frames_batched(sv, frames, z_min_idx, z_max_idx, vmin, vmax, channels, echogram_cmap, ei, frame_path, image_format, save_kwargs, frames_per_batch, pbar):
+    """Frames are processed in batches: the reading, conversion and writing of all the frames of a batch
+    form a single task graph, computed on the active dask scheduler (see `escore.execution`).
+    """
+    for b in range(0, len(frames), frames_per_batch):
+        batch = frames[b:b+frames_per_batch]
+        tasks = []
+        for t0, t1 in batch:
+            # Lazy frame: dask arrays passed to delayed functions are computed in the same graph
+            sv_frame = sv.isel(time=slice(t0, t1), depth=slice(z_min_idx, z_max_idx)).sel(channel=channels).data
+            tasks.append(dask.delayed(save_frame)(sv_frame, vmin, vmax, echogram_cmap, frame_path(t0, t1), t0, image_format, save_kwargs))
+
+        with stage("builder.frame_batch", ei=ei, t0=batch[0][0], t1=batch[-1][1]):
+            dask.compute(*tasks)
+        pbar.update(len(batch))
+
+
+def plot_frames_pipelined(sv, frames, z_min_idx, z_max_idx, vmin, vmax, channels, echogram_cmap, ei, frame_path, image_format, save_kwargs, max_inflight_frames, n_encoders, pbar):
+    """Frames go through a reader thread, a pool of encoder threads and a writer thread, so that netCDF reads,
+    PNG encoding and file writes overlap. At most `max_inflight_frames` frames are held in memory between
+    their read and their write.
+    """
+    slots = threading.Semaphore(max_inflight_frames)
+    read_queue, write_queue = queue.Queue(), queue.Queue()
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            for t0, t1 in frames:
+                slots.acquire()
+                if stop.is_set():
+                    break
+                with stage("builder.read_frame", ei=ei, t0=t0, t1=t1):
+                    sv_array = sv.isel(time=slice(t0, t1), depth=slice(z_min_idx, z_max_idx)).sel(channel=channels).values
+                read_queue.put((t0, t1, sv_array))
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            read_queue.put(None)
+
+    def writer():
+        while (item := write_queue.get()) is not None:
+            path, t0, future = item
+            try:
+                frame = future.result()
+                with stage("builder.write_frame", ei=ei, t0=t0):
+                    write_frame(frame, path, t0)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                slots.release()
+                pbar.update(1)
+
+    reader_thread = threading.Thread(target=reader, daemon=True)
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    reader_thread.start()
+    writer_thread.start()
+
+    # PIL and zlib release the GIL while encoding: encoder threads run in parallel
+    with ThreadPoolExecutor(max_workers=n_encoders) as pool:
+        while (item := read_queue.get()) is not None:
+            t0, t1, sv_array = item
+            future = pool.submit(encode_frame, sv_array, vmin, vmax, echogram_cmap, image_format, save_kwargs)
+            write_queue.put((frame_path(t0, t1), t0, future))
+        write_queue.put(None)
+        writer_thread.join()
+    reader_thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def plot_survey_RGB(sv, frame_size, z_min_idx, z_max_idx, vmin, vmax, channels, echogram_cmap, ei_save_path, ei,
+                    execution_config: ExecutionConfig=None, image_format="png", compress_level=None, fast_encode=False):
+    """Save the frames of a survey as images.
+
+    With the default execution config, frames are computed in batched task graphs (`plot_frames_batched`). With
+    `execution_config.prefetch_frames > 0`, they go through a prefetching pipeline (`plot_frames_pipelined`).
+
+    Frames are saved as PNG or lossless WebP files (see `image_save_kwargs`), or with `image_format="raw"`, written
+    in a single memory-mapped uint8 array of the whole survey (see `create_raw_store`).
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Image format must be one of {IMAGE_FORMATS}. Current input: '{image_format}'")
+
+    execution_config = execution_config or ExecutionConfig()
     ei_save_path.mkdir(parents=True, exist_ok=True)
     slicing = slice_time(sv, frame_size)
-    for i in tqdm(range(len(slicing)-1), desc=f"{ei} frames"):
-        t0, t1 = slicing[i], slicing[i+1]
-        sv_array = sv2array(sv, time_idx_slice=slice(t0, t1), depth_idx_slice=slice(z_min_idx, z_max_idx), channels=channels)
-        img = sv_array2image(sv_array, vmin, vmax, echogram_cmap)
-        img.save(ei_save_path / f"{ei}_T{t0}-{t1}_Z{z_min_idx}-{z_max_idx}_Sv{vmin}-{vmax}.png")
+    frames = list(zip(slicing[:-1], slicing[1:]))
+    channels = channels if (type(channels)==int) else list(channels)
+
+    if image_format == "raw":
+        save_kwargs = None
+        store_path = ei_save_path / raw_store_name(ei, z_min_idx, z_max_idx, vmin, vmax)
+        n_depth = len(range(sv.sizes["depth"])[z_min_idx:z_max_idx])
+        create_raw_store(store_path, sv.sizes["time"], n_depth, None if type(channels)==int else len(channels))
+        frame_path = lambda t0, t1: store_path
+    else:
+        save_kwargs = image_save_kwargs(image_format, compress_level, fast_encode)
+        frame_path = lambda t0, t1: ei_save_path / frame_image_name(ei, t0, t1, z_min_idx, z_max_idx, vmin, vmax, ext=image_format)
+
+    args = (sv, frames, z_min_idx, z_max_idx, vmin, vmax, channels, echogram_cmap, ei, frame_path, image_format, save_kwargs)
+
+    from tqdm import tqdm     # imported at first use (slow import)
+
+    with tqdm(total=len(frames), desc=f"{ei} frames") as pbar:
+        if execution_config.prefetch_frames > 0:
+            # Memory cap on the frames held between read and write
+            max_inflight_frames = execution_config.prefetch_frames
+            if execution_config.max_inflight_mb is not None:
+                frame_nbytes = sv.isel(time=slice(0, frame_size), depth=slice(z_min_idx, z_max_idx)).sel(channel=channels).nbytes
+                max_inflight_frames = min(max_inflight_frames, max(1, int(execution_config.max_inflight_mb * 1e6 // frame_nbytes)))
+            plot_frames_pipelined(*args, max_inflight_frames=max_inflight_frames, n_encoders=execution_config.n_encoders, pbar=pbar)
+        else:
+            plot_frames_batched(*args, frames_per_batch=execution_config.frames_per_batch, pbar=pbar)
 
 
 
@@ -64,7 +258,18 @@ class DatasetConfig:
     z_max_idx : int
     frequencies: int | tuple[int, int, int] = (38, 70, 120)
     echogram_cmap: str = "RGB"
-    correct_120: bool = False # whether to correct the depth treshold for the 120 kHz channel
+    correct_120: bool = False # whether to correct the depth treshold for the 120 kHz channel (its default dropout depth, if dropout_depths is not set)
+    dropout_depths: tuple[tuple[float, float], ...] | None = None # (channel, depth in m) pairs beyond which Sv is masked (see `apply_dropout_depths`), or a {channel: depth} dict
+    image_format: str = "png" # one of IMAGE_FORMATS
+    compress_level: int | None = None # png: zlib level [0, 9], webp: method [0, 6]. None: PIL default
+    fast_encode: bool = False # fastest encoder settings, overrides compress_level
+
+    def __post_init__(self):
+        # Hashable fields, also accepted as lists / dict (e.g. from the config file)
+        if isinstance(self.frequencies, list):
+            object.__setattr__(self, "frequencies", tuple(self.frequencies))
+        if isinstance(self.dropout_depths, dict):
+            object.__setattr__(self, "dropout_depths", tuple((float(c), d) for c, d in self.dropout_depths.items()))
 
     def name(self) -> str:
         freqs = [self.frequencies] if type(self.frequencies) == int else self.frequencies
@@ -74,9 +279,19 @@ class DatasetConfig:
             freqs +
             f'TF{self.time_frame_size}_' +
             f'Z{self.z_min_idx}-{self.z_max_idx}_' +
-            f'Sv{self.vmin}-{self.vmax}dB'
+            f'Sv{self.vmin}-{self.vmax}dB' +
+            ('' if self.image_format == 'png' else f'_{self.image_format}') +
+            # Masked channels (dropout_depths, or correct_120) give another dataset: the name of unmasked ones is unchanged
+            ('' if not self.get_dropout_depths() else '_DO' + '_'.join(f'{int(float(c))}-{int(d)}' for c, d in self.get_dropout_depths().items()))
         )
 
+    def get_dropout_depths(self) -> dict | None:
+        if self.dropout_depths:
+            return dict(self.dropout_depths)
+        if self.correct_120:
+            return {120.: DEFAULT_DROPOUT_DEPTHS[120.]}
+        return None
+
     def save_metadata(self, path:Path):
         with open(path / "dataset_config.json", "w") as f:
             json.dump(asdict(self), f, indent=2)
@@ -92,10 +307,12 @@ class DatasetConfig:
     """
 
 # Dataset builder
+@instrumented("builder.build_dataset")
 def build_dataset(dataset_config: DatasetConfig,
                   global_config: dict,
                   ei_list: list[str]=None,
-                  root_path: Path=None):
+                  root_path: Path=None,
+                  execution_config: ExecutionConfig=None):
     """Prints an image dataset from a DatasetConfig object.
 
     Args:
@@ -103,6 +320,7 @@ def build_dataset(dataset_config: DatasetConfig,
         global_config (dict): Global configuration file for the Escore projects. Used loop through data, and passed to laod_survey_ds.
         ei_list (list[str], optional): Overrides global_config['image_dataset']['ei_list']. Defaults to None.
         root_path (Path, optional): Overrides global_config['paths']['echogram_images_dir']. Defaults to None.
+        execution_config (ExecutionConfig, optional): batching or prefetching of the frames (see `plot_survey_RGB`). Defaults to None.
     """
     
     if root_path is None:
@@ -118,6 +336,7 @@ def build_dataset(dataset_config: DatasetConfig,
 
     for ei in ei_list:
         sv = load_survey_ds(survey=ei, config=global_config)["Sv"]
+        sv = apply_dropout_depths(sv, dataset_config.get_dropout_depths())
         plot_survey_RGB(sv=sv, 
                         frame_size=dataset_config.time_frame_size, 
                         z_min_idx=dataset_config.z_min_idx,
@@ -127,7 +346,11 @@ def build_dataset(dataset_config: DatasetConfig,
                         channels=dataset_config.frequencies,
                         echogram_cmap=dataset_config.echogram_cmap,
                         ei_save_path=dataset_path/ei, 
-                        ei=ei)
+                        ei=ei,
+                        execution_config=execution_config,
+                        image_format=dataset_config.image_format,
+                        compress_level=dataset_config.compress_level,
+                        fast_encode=dataset_config.fast_encode)
 
 
 
@@ -0,0 +1,262 @@
+from pathlib import Path
+import sqlite3
+import argparse
+import json
+import numpy as np
+
+from escore.config import load_config
+
+
+# Survey metadata catalog
+# Per leg metadata of the `sv_files` / `surveys` config sections (time bounds, sizes, channels, attributes), stored
+# in interim_dir/catalog.db so that surveys can be listed, validated and planned without opening the netCDF files.
+# Legs are re-read only when their file fingerprint (size, modification time) changes.
+
+def get_catalog_path(config: dict) -> Path:
+    return Path(config["paths"]["interim_dir"]) / "catalog.db"
+
+
+# SQLite statements
+create_legs_sql = """
+    CREATE TABLE IF NOT EXISTS legs (
+        key TEXT PRIMARY KEY,           -- sv_files key
+        leg_id TEXT NOT NULL,
+        file TEXT NOT NULL,             -- relative to input_dir
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        title TEXT,
+        time_start TEXT NOT NULL,       -- ISO 8601, UTC
+        time_end TEXT NOT NULL,
+        n_time INTEGER NOT NULL,
+        n_depth INTEGER NOT NULL,
+        n_channel INTEGER NOT NULL,
+        channels TEXT NOT NULL,         -- JSON
+        attrs TEXT NOT NULL             -- JSON
+    )
+    """
+
+create_survey_legs_sql = """
+    CREATE TABLE IF NOT EXISTS survey_legs (
+        survey TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        PRIMARY KEY (survey, position)
+    )
+    """
+
+upsert_leg_sql = """
+    INSERT OR REPLACE INTO legs
+    (key, leg_id, file, size, mtime_ns, title, time_start, time_end, n_time, n_depth, n_channel, channels, attrs)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+leg_columns = ("key", "leg_id", "file", "size", "mtime_ns", "title", "time_start", "time_end",
+               "n_time", "n_depth", "n_channel", "channels", "attrs")
+
+
+# sqlite3 helper functions
+def open_db(db_path: Path):
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute(create_legs_sql)
+    conn.execute(create_survey_legs_sql)
+    conn.commit()
+    return conn
+
+
+def file_fingerprint(file_path: Path) -> tuple[int, int]:
+    stat = Path(file_path).stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_leg_metadata(file_path: Path) -> dict:
+    """Metadata of a leg file. Only the time coordinate is read."""
+    import xarray as xr     # imported at first use: listing and validating the catalog don't need it
+
+    with xr.open_dataset(file_path) as ds:
+        times = ds.indexes["time"]
+        return {
+            "title": ds.attrs.get("title"),
+            "time_start": str(np.datetime64(times.min(), "ms")),
+            "time_end": str(np.datetime64(times.max(), "ms")),
+            "n_time": ds.sizes["time"],
+            "n_depth": ds.sizes["depth"],
+            "n_channel": ds.sizes["channel"],
+            "channels": json.dumps([float(c) for c in ds["channel"].values]),
+            "attrs": json.dumps(ds.attrs, default=str),
+        }
+
+
+def refresh_catalog(conn, config: dict) -> dict:
+    """Update the catalog from the config sections, reading only new or changed files.
+
+    Returns:
+        dict: keys of the 'added', 'updated', 'unchanged' and 'missing' (file not found) legs.
+    """
+    input_dir = Path(config["paths"]["input_dir"])
+    status = {"added": [], "updated": [], "unchanged": [], "missing": []}
+
+    with conn:
+        cur = conn.cursor()
+        for key, sv_file in config["sv_files"].items():
+            file_path = input_dir / sv_file["file"]
+            if not file_path.is_file():
+                cur.execute("DELETE FROM legs WHERE key = ?", (key,))
+                status["missing"].append(key)
+                continue
+
+            size, mtime_ns = file_fingerprint(file_path)
+            cur.execute("SELECT leg_id, file, size, mtime_ns FROM legs WHERE key = ?", (key,))
+            row = cur.fetchone()
+            if row == (sv_file["leg_id"], sv_file["file"], size, mtime_ns):
+                status["unchanged"].append(key)
+                continue
+
+            meta = read_leg_metadata(file_path)
+            cur.execute(upsert_leg_sql, (key, sv_file["leg_id"], sv_file["file"], size, mtime_ns, meta["title"],
+                                         meta["time_start"], meta["time_end"], meta["n_time"], meta["n_depth"],
+                                         meta["n_channel"], meta["channels"], meta["attrs"]))
+            status["added" if row is None else "updated"].append(key)
+
+        # Legs removed from the config
+        keys = list(config["sv_files"])
+        placeholders = ",".join("?" for _ in keys)
+        cur.execute(f"DELETE FROM legs WHERE key NOT IN ({placeholders})", keys)
+
+        # Surveys are cheap to rebuild from the config
+        cur.execute("DELETE FROM survey_legs")
+        cur.executemany("INSERT INTO survey_legs (survey, position, key) VALUES (?, ?, ?)",
+                        [(survey, i, key) for survey, keys in config["surveys"].items() for i, key in enumerate(keys)])
+
+    return status
+
+
+def leg_row_to_dict(row):
+    leg = dict(zip(leg_columns, row))
+    leg["channels"] = json.loads(leg["channels"])
+    leg["attrs"] = json.loads(leg["attrs"])
+    return leg
+
+
+def fetch_survey_legs(conn, survey: str) -> list[dict]:
+    """Catalogued legs of a survey, sorted by start time."""
+    cur = conn.cursor()
+    columns = ", ".join(f"legs.{c}" for c in leg_columns)
+    cur.execute(f"""SELECT {columns} FROM survey_legs JOIN legs ON survey_legs.key = legs.key
+                    WHERE survey_legs.survey = ? ORDER BY legs.time_start""", (survey,))
+    return [leg_row_to_dict(row) for row in cur.fetchall()]
+
+
+def list_surveys(conn) -> list[dict]:
+    """Summary of each survey: number of legs, time bounds and sizes."""
+    cur = conn.cursor()
+    cur.execute("""SELECT survey_legs.survey, COUNT(legs.key), MIN(legs.time_start), MAX(legs.time_end),
+                          SUM(legs.n_time), MAX(legs.n_depth), MAX(legs.n_channel)
+                   FROM survey_legs LEFT JOIN legs ON survey_legs.key = legs.key
+                   GROUP BY survey_legs.survey ORDER BY survey_legs.survey""")
+    keys = "survey", "n_legs", "time_start", "time_end", "n_time", "n_depth", "n_channel"
+    return [dict(zip(keys, row)) for row in cur.fetchall()]
+
+
+def validate_surveys(conn, config: dict, surveys: list[str] | None = None) -> list[str]:
+    """Problems of the config for the given surveys (all by default), empty if none.
+
+    Checks that the legs of each survey are declared in `sv_files`, that their files exist and that they share
+    the same depth axis and channels.
+    """
+    errors = []
+    cur = conn.cursor()
+    for survey in surveys if surveys is not None else config["surveys"]:
+        if survey not in config["surveys"]:
+            errors.append(f"Survey '{survey}' is not declared in 'surveys'")
+            continue
+
+        for key in config["surveys"][survey]:
+            if key not in config["sv_files"]:
+                errors.append(f"Survey '{survey}': leg '{key}' is not declared in 'sv_files'")
+                continue
+            cur.execute("SELECT 1 FROM legs WHERE key = ?", (key,))
+            if cur.fetchone() is None:
+                errors.append(f"Survey '{survey}': file of leg '{key}' not found ({config['sv_files'][key]['file']})")
+
+        legs = fetch_survey_legs(conn, survey)
+        if len({(leg["n_depth"], tuple(leg["channels"])) for leg in legs}) > 1:
+            errors.append(f"Survey '{survey}': legs have different depth axes or channels")
+
+    return errors
+
+
+def print_survey_infos(conn, survey: str, tz="UTC"):
+    """Same summary as `escore.io.print_file_infos`, from the catalog."""
+    legs = fetch_survey_legs(conn, survey)
+    if not legs:
+        print(f"* {survey}: no catalogued leg")
+        return
+    attrs = legs[0]["attrs"]
+
+    print(f"* Title:\t{legs[0]['title']}")
+    print(f"* N legs:\t{len(legs)}")
+
+    for leg in legs:
+        start, end = (np.datetime64(leg[k]).item().strftime('%d %b %Y, %H:%M') for k in ("time_start", "time_end"))
+        print(f"* Dates ({leg['leg_id']}):\t{start} - {end} ({tz})")
+
+    n_time, n_depth, n_channel = sum(leg["n_time"] for leg in legs), legs[0]["n_depth"], legs[0]["n_channel"]
+    print(f"* Resolution:\t{attrs.get('data_ping_axis_interval_value')} {attrs.get('data_ping_axis_interval_type')} x {attrs.get('data_range_axis_interval_value')} {attrs.get('data_range_axis_interval_type')}")
+    print(f"* Dimensions:\t({n_time}, {n_depth}, {n_channel}) - (time, depth, channel)")
+    print(f"* N pixels:\t{n_time * n_depth}")
+
+
+class SurveyCatalog:
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self.conn = open_db(self.db_path)
+
+    @classmethod
+    def from_config(cls, config: dict, refresh: bool = True):
+        """Catalog of interim_dir, refreshed from the config sections."""
+        catalog = cls(get_catalog_path(config))
+        if refresh:
+            catalog.refresh(config)
+        return catalog
+
+    def refresh(self, config: dict) -> dict:
+        return refresh_catalog(self.conn, config)
+
+    def legs(self, survey: str) -> list[dict]:
+        return fetch_survey_legs(self.conn, survey)
+
+    def surveys(self) -> list[dict]:
+        return list_surveys(self.conn)
+
+    def validate(self, config: dict, surveys: list[str] | None = None) -> list[str]:
+        return validate_surveys(self.conn, config, surveys)
+
+    def print_infos(self, survey: str, tz="UTC"):
+        print_survey_infos(self.conn, survey, tz)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the survey catalog and list the surveys of a config")
+    parser.add_argument("--config", default="scripts/config.yml", help="Path to config file")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+
+    with SurveyCatalog.from_config(config) as catalog:
+        for survey in config["surveys"]:
+            print()
+            catalog.print_infos(survey)
+
+        errors = catalog.validate(config)
+        if errors:
+            print("\nConfig problems:", *[f"\n * {e}" for e in errors])
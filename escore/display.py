@@ -0,0 +1,102 @@
+from pathlib import Path
+import json
+import numpy as np
+
+from escore.builder import plot_survey_RGB, raw_store_name
+from escore.execution import ExecutionConfig
+
+
+# Display cubes
+# uint8 display values of a whole survey for one channel selection and contrast setting (vmin, vmax), stored as
+# a memory-mapped .npy array of shape (time, depth, channel), or (time, depth) for a single channel.
+# Built once from Sv (same values as the image datasets, see `sv_array2display`), they are sliced by the echo-types
+# app and the ROI plots without reading, decompressing and normalizing Sv again.
+# Cubes are stored in a survey folder of interim_dir, next to the pyramid.
+
+DEFAULT_DISPLAY_CUBES = [{"frequencies": [38., 70., 120.], "vmin": -90., "vmax": -50.}]
+
+
+def get_display_dir(config: dict, ei: str) -> Path:
+    return Path(config["paths"]["interim_dir"]) / ei / "display"
+
+
+def get_display_cube_configs(config: dict) -> list[dict]:
+    """Display cubes to build, from the optional `display_cubes` section of a global config (opt-in)."""
+    section = config.get("display_cubes", {})
+    if not section.get("enabled", False):
+        return []
+    return section.get("cubes", DEFAULT_DISPLAY_CUBES)
+
+
+def display_cube_name(channels, vmin: float, vmax: float) -> str:
+    freqs = [channels] if np.isscalar(channels) else channels
+    return "_".join(str(int(f)) for f in freqs) + f"kHz_Sv{float(vmin)}-{float(vmax)}dB"
+
+
+def build_display_cube(
+    sv,
+    display_dir: Path,
+    ei: str,
+    vmin: float = -90.,
+    vmax: float = -50.,
+    channels=(38., 70., 120.),
+    frame_size: int = 10_000,
+    execution_config: ExecutionConfig = None,
+) -> Path:
+    """Write the display cube of sv for a channel selection and contrast setting, in a sub-folder of display_dir.
+
+    Returns:
+        Path: folder of the cube, to be opened with `DisplayCube`.
+    """
+    vmin, vmax = float(vmin), float(vmax)
+    cube_dir = Path(display_dir) / display_cube_name(channels, vmin, vmax)
+
+    # Full depth range
+    plot_survey_RGB(sv, frame_size, 0, None, vmin, vmax, channels, "RGB", cube_dir, ei,
+                    execution_config=execution_config, image_format="raw")
+
+    with open(cube_dir / "display_cube.json", "w") as f:
+        json.dump({
+            "file": raw_store_name(ei, 0, None, vmin, vmax),
+            "vmin": vmin,
+            "vmax": vmax,
+            "channels": [float(channels)] if np.isscalar(channels) else [float(c) for c in channels],
+            "shape": [sv.sizes["time"], sv.sizes["depth"]],
+        }, f, indent=2)
+
+    return cube_dir
+
+
+class DisplayCube:
+    """Read access to a display cube.
+    """
+    def __init__(self, cube_dir: Path):
+        with open(Path(cube_dir) / "display_cube.json", "r") as f:
+            meta = json.load(f)
+        self.vmin, self.vmax, self.channels = meta["vmin"], meta["vmax"], meta["channels"]
+        self.values = np.load(Path(cube_dir) / meta["file"], mmap_mode="r")
+
+    def matches(self, vmin: float, vmax: float, channels) -> bool:
+        channels = [channels] if np.isscalar(channels) else list(channels)
+        return (float(vmin), float(vmax)) == (self.vmin, self.vmax) and [float(c) for c in channels] == self.channels
+
+    def window(self, xmin: int, xmax: int, ymin: int, ymax: int) -> np.ndarray:
+        """Image of a (xmin, xmax, ymin, ymax) window in full resolution indices (bounds included).
+
+        Returns:
+            np.ndarray: uint8 array of shape (depth, time, channel) or (depth, time), a view of the memory map.
+        """
+        return self.values[xmin:xmax+1, ymin:ymax+1].swapaxes(0, 1)
+
+
+def open_display_cubes(display_dir: Path) -> list[DisplayCube]:
+    """All the display cubes built in display_dir (empty if none)."""
+    return [DisplayCube(meta.parent) for meta in sorted(Path(display_dir).glob("*/display_cube.json"))]
+
+
+def find_display_cube(cubes: list[DisplayCube], vmin: float, vmax: float, channels) -> DisplayCube | None:
+    """Display cube of a channel selection and contrast setting, None if it wasn't built."""
+    for cube in cubes or []:
+        if cube.matches(vmin, vmax, channels):
+            return cube
+    return None
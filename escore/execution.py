@@ -0,0 +1,60 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+import dask
+
+
+# Execution backend of the dask computations of the pipeline (image dataset building, pyramid building).
+# Surveys are opened lazily with `xr.open_dataset(chunks=...)`: every compute runs on the dask scheduler
+# active in the current `execution_context`.
+
+SCHEDULERS = ["threads", "processes", "synchronous", "distributed"]
+
+
+@dataclass(frozen=True)
+class ExecutionConfig:
+    scheduler: str = "threads"              # one of SCHEDULERS
+    n_workers: int | None = None            # None: dask default (number of cores)
+    threads_per_worker: int | None = None   # distributed only
+    memory_limit: str | None = None         # distributed only, per worker (e.g. "4GB")
+    frames_per_batch: int = 8               # image dataset frames computed in a single task graph
+    prefetch_frames: int = 0                # > 0: pipelined image builder, with up to prefetch_frames frames in flight
+    n_encoders: int = 2                     # pipelined builder: number of PNG encoder threads
+    max_inflight_mb: float | None = None    # pipelined builder: memory cap on the frames in flight
+
+    def __post_init__(self):
+        if self.scheduler not in SCHEDULERS:
+            raise ValueError(f"Scheduler must be one of {SCHEDULERS}. Current input: '{self.scheduler}'")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """ExecutionConfig from the optional `execution` section of a global config."""
+        return cls(**config.get("execution", {}))
+
+
+@contextmanager
+def execution_context(execution_config: ExecutionConfig | None = None):
+    """Run the dask computations of the block on the configured scheduler.
+
+    The 'distributed' scheduler starts a local cluster of `n_workers` processes for the duration of the
+    block (requires the `distributed` package). Its dashboard address is printed.
+
+    Example:
+        with execution_context(ExecutionConfig.from_config(config)):
+            build_dataset(...)
+    """
+    cfg = execution_config or ExecutionConfig()
+
+    if cfg.scheduler != "distributed":
+        with dask.config.set(scheduler=cfg.scheduler, num_workers=cfg.n_workers):
+            yield
+        return
+
+    try:
+        from dask.distributed import Client, LocalCluster
+    except ImportError as e:
+        raise ImportError("The 'distributed' scheduler requires the dask distributed package (conda install distributed).") from e
+
+    cluster_kwargs = {k: v for k, v in asdict(cfg).items() if k in ("n_workers", "threads_per_worker", "memory_limit") and v is not None}
+    with LocalCluster(processes=True, **cluster_kwargs) as cluster, Client(cluster) as client:
+        print(f"Dask dashboard: {client.dashboard_link}")
+        yield
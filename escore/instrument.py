@@ -0,0 +1,227 @@
+from pathlib import Path
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+import cProfile
+import json
+import logging
+import os
+import time
+import tracemalloc
+
+
+# Opt-in timing instrumentation of the hot paths (survey loading, dataset building, registry updates, ROI
+# extraction, clustering, Dash callbacks).
+# Disabled by default: stages then cost a single flag check. Enable with `configure(enabled=True)`, the
+# `instrumentation` section of the config files, or the ESCORE_INSTRUMENT=1 environment variable.
+#
+# Each stage records its wall time, the bytes read by the process (Linux only) and, if memory tracking is on,
+# the peak of Python/numpy allocations above the memory in use at stage start. Records are logged as JSON
+# lines on the "escore.instrument" logger and aggregated per stage for `metrics_text` (Prometheus format).
+
+logger = logging.getLogger("escore.instrument")
+
+_settings = {
+    "enabled": os.environ.get("ESCORE_INSTRUMENT", "0") not in ("", "0", "false", "False"),
+    "memory": False,
+    "profile_dir": None,
+}
+_stats = {}             # stage name -> {"count", "wall_time_s", "read_bytes", "peak_memory_bytes"}
+_stats_lock = Lock()
+_local = local()        # per thread stack of open stages (Dash callbacks may run in threads)
+
+
+def configure(enabled: bool = True, memory: bool = False, log_path: Path | None = None, profile_dir: Path | None = None):
+    """Set up instrumentation.
+
+    Args:
+        enabled (bool, optional): record stages. Defaults to True.
+        memory (bool, optional): track peak memory with tracemalloc (slows allocations down). Defaults to False.
+        log_path (Path | None, optional): append JSON records to this file. Defaults to None (records are only
+            sent to the "escore.instrument" logger).
+        profile_dir (Path | None, optional): dump a cProfile .prof file per call of profiled functions
+            (see `instrumented(profile=True)`). Defaults to None (no profiling).
+    """
+    _settings["enabled"] = enabled
+    _settings["memory"] = enabled and memory
+    _settings["profile_dir"] = Path(profile_dir) if (enabled and profile_dir is not None) else None
+
+    if _settings["memory"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if not _settings["memory"] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+    if _settings["profile_dir"] is not None:
+        _settings["profile_dir"].mkdir(parents=True, exist_ok=True)
+
+    # A single file handler, for the last configured path: configure may run several times in a process
+    # (an app build per worker, tests, reloads) and records must not be written once per call
+    log_path = Path(log_path).resolve() if (enabled and log_path is not None) else None
+    for handler in [h for h in logger.handlers if isinstance(h, logging.FileHandler)]:
+        if Path(handler.baseFilename) != log_path:
+            logger.removeHandler(handler)
+            handler.close()
+    if log_path is not None and not any(isinstance(h, logging.FileHandler) for h in logger.handlers):
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    if enabled:
+        logger.setLevel(logging.INFO)
+
+
+def configure_from_config(config: dict):
+    """Set up instrumentation from the optional `instrumentation` section of a global config."""
+    section = config.get("instrumentation")
+    if section is None:
+        return
+    configure(enabled=section.get("enabled", True),
+              memory=section.get("memory", False),
+              log_path=section.get("log_path"),
+              profile_dir=section.get("profile_dir"))
+
+
+def is_enabled() -> bool:
+    return _settings["enabled"]
+
+
+def read_bytes() -> int | None:
+    """Bytes read by the process so far (including page cache hits), None if not available."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """Context manager recording a stage of work. Extra keyword fields are added to the JSON record.
+
+    Example:
+        with stage("get_roi_Sv", roi_id=roi_id):
+            roi_sv = get_roi_Sv(sv, shape, frequencies)
+    """
+    if not _settings["enabled"]:
+        yield
+        return
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+
+    # Peaks of nested stages are propagated to their parent, since tracemalloc has a single peak counter
+    frame = {"child_peak": 0}
+    memory = _settings["memory"] and tracemalloc.is_tracing()
+    if memory:
+        frame["start_memory"] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    stack.append(frame)
+
+    bytes_0 = read_bytes()
+    t0 = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        wall_time = time.perf_counter() - t0
+        bytes_1 = read_bytes()
+        stack.pop()
+
+        record = {"stage": name, "wall_time_s": round(wall_time, 6)}
+        if bytes_0 is not None and bytes_1 is not None:
+            record["read_bytes"] = bytes_1 - bytes_0
+        if memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame["child_peak"])
+            record["peak_memory_bytes"] = max(peak - frame["start_memory"], 0)
+            if stack:
+                stack[-1]["child_peak"] = max(stack[-1]["child_peak"], peak)
+        if error is not None:
+            record["error"] = error
+        record.update(fields)
+
+        _record(record)
+
+
+def _record(record: dict):
+    with _stats_lock:
+        s = _stats.setdefault(record["stage"], {"count": 0, "wall_time_s": 0., "read_bytes": 0, "peak_memory_bytes": 0})
+        s["count"] += 1
+        s["wall_time_s"] += record["wall_time_s"]
+        s["read_bytes"] += record.get("read_bytes", 0)
+        s["peak_memory_bytes"] = max(s["peak_memory_bytes"], record.get("peak_memory_bytes", 0))
+
+    logger.info(json.dumps(record, default=str))
+
+
+def instrumented(name: str | None = None, profile: bool = False):
+    """Decorator recording each call of a function as a stage (see `stage`).
+
+    Args:
+        name (str | None, optional): stage name. Defaults to the function's qualified name.
+        profile (bool, optional): also run the call under cProfile when a profile_dir is configured,
+            written as <profile_dir>/<name>_<time_ns>.prof (open with snakeviz or pstats). Defaults to False.
+    """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _settings["enabled"]:
+                return func(*args, **kwargs)
+
+            with stage(stage_name):
+                profile_dir = _settings["profile_dir"]
+                if not profile or profile_dir is None:
+                    return func(*args, **kwargs)
+
+                profiler = cProfile.Profile()
+                try:
+                    return profiler.runcall(func, *args, **kwargs)
+                finally:
+                    profiler.dump_stats(profile_dir / f"{stage_name}_{time.time_ns()}.prof")
+
+        return wrapper
+    return decorator
+
+
+def get_stats() -> dict:
+    """Aggregated statistics per stage: number of calls, total wall time and bytes read, max peak memory."""
+    with _stats_lock:
+        return {k: dict(v) for k, v in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def metrics_text() -> str:
+    """Aggregated statistics of this process in the Prometheus text exposition format.
+
+    Statistics are per process: with several server workers (gunicorn), each worker counts the calls it served
+    and a scrape returns the statistics of the worker that answered. Series are labelled with the process id
+    (`worker`) so that they can be told apart and summed over workers, e.g. `sum by (stage) (...)`.
+    """
+    metrics = [
+        ("escore_stage_calls_total", "counter", "Number of calls of the stage", "count"),
+        ("escore_stage_wall_time_seconds_total", "counter", "Total wall time of the stage", "wall_time_s"),
+        ("escore_stage_read_bytes_total", "counter", "Total bytes read by the process during the stage", "read_bytes"),
+        ("escore_stage_peak_memory_bytes", "gauge", "Max peak of traced memory during the stage", "peak_memory_bytes"),
+    ]
+    stats = get_stats()
+    worker = os.getpid()
+
+    lines = []
+    for metric, kind, help_text, key in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for stage_name, s in sorted(stats.items()):
+            lines.append(f'{metric}{{stage="{stage_name}",worker="{worker}"}} {s[key]}')
+    return "\n".join(lines) + "\n"
+
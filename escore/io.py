@@ -1,34 +1,173 @@
 from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 from datetime import datetime
+import json
 import numpy as np
 import xarray as xr
 
+from escore.instrument import instrumented
+
 
 # Import function allowing to import and combine legs as a single `xarray.Dataset`
-def load_survey_ds(survey, config, chunks={"time": 1000, "depth": 100}):
-    leg_list = []
-    
-    for key in config["surveys"][survey]:
-        leg_id = config["sv_files"][key]["leg_id"]
+# Legs are concatenated in the order of their time bounds, so that no sort of the (lazy) dataset is needed.
+# If legs overlap in time or are not sorted, the time sort permutation is computed once and persisted in
+# interim_dir/<survey>/time_order.npz, until the files change.
+@instrumented("io.load_survey_ds")
+def load_survey_ds(survey, config, chunks={"time": 1000, "depth": 100}, max_workers: int | None = None):
+    files = list(zip(survey_files(survey, config), [config["sv_files"][key]["leg_id"] for key in config["surveys"][survey]]))
 
-        file_path = Path(config["paths"]["input_dir"]) / config["sv_files"][key]["file"]
+    # Legs are opened concurrently (metadata and coordinates decoding), as `open_mfdataset(parallel=True)`
+    with ThreadPoolExecutor(max_workers=max_workers or min(len(files), 8)) as executor:
+        leg_list = list(executor.map(lambda f: open_leg(*f, chunks=chunks), files))
 
-        file_ds = xr.open_dataset(file_path, chunks=chunks)
+    if not all('time' in leg.indexes for leg in leg_list):
+        return xr.concat(leg_list, dim='time', data_vars='all')
 
-        # Add a 'leg' variable to each dataset
-        file_ds = file_ds.assign_coords(leg=(('time',), [leg_id]*file_ds.sizes['time']))
+    # Concatenate legs by start time
+    leg_list = sorted(leg_list, key=lambda leg: leg.indexes['time'][0])
+    combined = xr.concat(leg_list, dim='time', data_vars='all')
 
-        leg_list.append(file_ds)
+    if not legs_in_time_order([leg.indexes['time'] for leg in leg_list]):
+        combined = combined.isel(time=get_time_order(survey, config, combined.indexes['time']))
 
-    # Concatenate and sort by time to ensure order
-    combined = xr.concat(leg_list, dim='time', data_vars='all')
-    
-    if 'time' in combined:
-        ds = combined.sortby('time')
-    else:
-        ds = combined
+    cache_time_index(time_index_key(survey, config), TimeIndex(combined.indexes['time']))
+    return combined
+
+
+def open_leg(file_path, leg_id, chunks={"time": 1000, "depth": 100}) -> xr.Dataset:
+    """Lazy dataset of a leg file, with a 'leg' coordinate."""
+    file_ds = xr.open_dataset(file_path, chunks=chunks)
+
+    # Add a 'leg' variable to each dataset
+    return file_ds.assign_coords(leg=(('time',), np.full(file_ds.sizes['time'], leg_id)))
+
+
+def legs_in_time_order(leg_times: list) -> bool:
+    """True if each leg is sorted in time and ends before the start of the next leg."""
+    for i, times in enumerate(leg_times):
+        if not times.is_monotonic_increasing:
+            return False
+        if i > 0 and leg_times[i-1][-1] >= times[0]:
+            return False
+    return True
+
+
+def survey_files(survey, config) -> list[Path]:
+    return [Path(config["paths"]["input_dir"]) / config["sv_files"][key]["file"] for key in config["surveys"][survey]]
+
+
+def survey_files_signature(survey, config) -> str:
+    """Names, sizes and modification times of the files of a survey."""
+    return json.dumps([[f.name, f.stat().st_size, f.stat().st_mtime_ns] for f in survey_files(survey, config)])
+
+
+def get_time_order(survey, config, times) -> np.ndarray:
+    """Permutation sorting the concatenated times of a survey (stable, as `sortby`), persisted in interim_dir."""
+    interim_dir = config["paths"].get("interim_dir")
+    order_path = Path(interim_dir) / survey / "time_order.npz" if interim_dir else None
+    signature = survey_files_signature(survey, config)
+
+    if order_path is not None and order_path.exists():
+        with np.load(order_path) as cached:
+            if str(cached["signature"]) == signature and len(cached["order"]) == len(times):
+                return cached["order"]
+
+    order = np.argsort(np.asarray(times), kind="stable")
+    if order_path is not None:
+        order_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(order_path, order=order, signature=np.array(signature))
+    return order
+
+
+# Time index
+# Sorted times of a loaded survey, for datetime -> ESDU index lookups without going through xarray/pandas indexing
+class TimeIndex:
+    def __init__(self, times):
+        self.times = np.asarray(times, dtype="datetime64[ns]")
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_idx(self, times, side: str = "left"):
+        """Index of the first ESDU at or after each time (side="left"), or strictly after it (side="right")."""
+        return np.searchsorted(self.times, np.asarray(times, dtype="datetime64[ns]"), side=side)
+
+    def get_nearest_idx(self, times):
+        """Index of the nearest ESDU of each time."""
+        times = np.asarray(times, dtype="datetime64[ns]")
+        if len(self.times) == 1:
+            return np.zeros(times.shape, dtype=np.int64)
+        idx = np.clip(np.searchsorted(self.times, times), 1, len(self.times) - 1)
+        before, after = self.times[idx - 1], self.times[idx]
+        return np.where(times - before <= after - times, idx - 1, idx)
+
+    def get_slice(self, start=None, end=None) -> slice:
+        """ESDU index slice of the [start, end] time range (bounds included), to be used with `isel`."""
+        i0 = None if start is None else int(self.get_idx(start, side="left"))
+        i1 = None if end is None else int(self.get_idx(end, side="right"))
+        return slice(i0, i1)
+
+
+# Time indexes of the last loaded surveys (LRU), keyed by their files and file signatures: a survey loaded from
+# other or modified files gets a new index
+TIME_INDEX_CACHE_SIZE = 8
+_time_indexes = OrderedDict()
+_time_indexes_lock = Lock()
+
+
+def time_index_key(survey, config) -> tuple[str, str]:
+    return survey, json.dumps([str(f.resolve()) for f in survey_files(survey, config)]) + survey_files_signature(survey, config)
+
+
+def cache_time_index(key, time_index: TimeIndex):
+    with _time_indexes_lock:
+        _time_indexes[key] = time_index
+        _time_indexes.move_to_end(key)
+        while len(_time_indexes) > TIME_INDEX_CACHE_SIZE:
+            _time_indexes.popitem(last=False)
+
+
+def get_time_index(survey, config) -> TimeIndex:
+    """Cached time index of a survey, loaded with config if it wasn't loaded yet or if its files changed."""
+    key = time_index_key(survey, config)
+    with _time_indexes_lock:
+        if key in _time_indexes:
+            _time_indexes.move_to_end(key)
+            return _time_indexes[key]
+    load_survey_ds(survey, config)
+    with _time_indexes_lock:
+        return _time_indexes[key]
+
+
+# Channels dropout depths
+# Depth (m) beyond which the Sv of a channel is not valid (range limit of the transducer). Sv beyond the dropout
+# depth of its channel is replaced by NaN lazily, without reading the file chunks that lie entirely beyond it.
+DEFAULT_DROPOUT_DEPTHS = {38.: 800, 70.: 500, 120.: 300, 200.: 150}
+
+
+def apply_dropout_depths(sv: xr.DataArray, dropout_depths: dict | None) -> xr.DataArray:
+    """Mask the Sv of each channel beyond its dropout depth (channels missing from dropout_depths are kept whole).
+
+    Each channel is cut at its dropout depth index and completed with NaN chunks that do not depend on the file,
+    so that reads of sv, or of any window of it, skip the depths beyond the dropout depth.
+    """
+    if not dropout_depths:
+        return sv
+    dropout_depths = {float(c): d for c, d in dropout_depths.items()}
+
+    channels = []
+    for c in sv["channel"].values:
+        sv_c = sv.sel(channel=[c])
+        depth = dropout_depths.get(float(c))
+        k = len(sv_c["depth"]) if depth is None else int(np.searchsorted(sv_c["depth"].values, depth, side="right"))
+        if k < len(sv_c["depth"]):
+            beyond = xr.full_like(sv_c.isel(depth=slice(k, None)), np.nan)
+            sv_c = xr.concat([sv_c.isel(depth=slice(0, k)), beyond], dim="depth")
+        channels.append(sv_c)
 
-    return ds
+    return xr.concat(channels, dim="channel").transpose(*sv.dims)
 
 
 # Get basic information on the survey
@@ -0,0 +1,210 @@
+from pathlib import Path
+import json
+import numpy as np
+import pandas as pd
+import dask
+
+from escore.apps.echotypes.processing import get_windows, get_mask, extract_patches
+from escore.instrument import instrumented
+
+
+# Fixed-size ROI patch datasets, for ML training
+# All valid ROIs of a registry are exported as fixed-size windows centered on them (`get_window(window_shape=...)`
+# semantics), in shards of NPY files that can be memory-mapped:
+#   shard_<k>_sv.npy        float32 (n, C, W, H)      Sv in dB, NaN outside the survey
+#   shard_<k>_delta_sv.npy  float32 (n, C-1, W, H)    ΔSv to the reference channel (optional)
+#   shard_<k>_mask.npy      bool    (n, W, H)         pixels of the ROI shape
+#   index.csv                                         one row per ROI: id, label, shard, offset, bbox, window...
+#   metadata.json                                     window shape, channels, arrays, shards
+# ROIs are sorted by time so that the patches of a shard are read from a few contiguous slices of the survey.
+
+def get_patches_dir(config: dict) -> Path:
+    return Path(config["paths"]["interim_dir"]) / config["session"]["ei"] / config["session"]["name"] / "patches"
+
+
+def shard_file(k: int, array: str) -> str:
+    return f"shard_{k:05d}_{array}.npy"
+
+
+def window_mask(shape: dict, window: np.ndarray) -> np.ndarray:
+    """Mask of an ROI shape on a window, shape (W, H). Parts of the shape outside the window are cropped."""
+    xmin, xmax, ymin, ymax = window
+    bbox = shape["it_min"], shape["it_max"], shape["iz_min"], shape["iz_max"]
+    shape_mask = get_mask(window=bbox, points=shape["points"])
+
+    mask = np.zeros((xmax - xmin + 1, ymax - ymin + 1), dtype=bool)
+    x0, x1 = max(bbox[0], xmin), min(bbox[1], xmax) + 1
+    y0, y1 = max(bbox[2], ymin), min(bbox[3], ymax) + 1
+    if (x1 > x0) and (y1 > y0):
+        mask[x0 - xmin:x1 - xmin, y0 - ymin:y1 - ymin] = shape_mask[x0 - bbox[0]:x1 - bbox[0], y0 - bbox[2]:y1 - bbox[2]]
+    return mask
+
+
+def write_shard(sv, shapes, windows, out_dir, k, channels, ref_frequency, delta_sv, offset=(0, 0)):
+    """Extract and write the arrays of one shard.
+
+    sv may be the (time, depth) slice of the survey covering the windows of the shard, starting at the survey
+    indices `offset`: windows and shapes stay in survey indices.
+    """
+    patches = extract_patches(sv, windows - [offset[0], offset[0], offset[1], offset[1]], channels=channels)
+    np.save(out_dir / shard_file(k, "sv"), patches)
+
+    if delta_sv:
+        ref_idx = list(channels).index(ref_frequency)
+        others = [i for i in range(len(channels)) if i != ref_idx]
+        np.save(out_dir / shard_file(k, "delta_sv"), patches[:, others] - patches[:, [ref_idx]])
+
+    np.save(out_dir / shard_file(k, "mask"), np.stack([window_mask(s, w) for s, w in zip(shapes, windows)]))
+    return k
+
+
+@instrumented("patches.export_patches")
+def export_patches(
+    sv,
+    shapes: list[dict],
+    out_dir: Path,
+    window_shape: tuple[int, int] = (256, 128),
+    channels=(38., 70., 120., 200.),
+    ref_frequency: float = 38.,
+    delta_sv: bool = True,
+    shard_size: int = 256,
+    shards_per_batch: int = 4,
+) -> pd.DataFrame:
+    """Export ROI shapes (e.g. `ROIRegistry.fetch_valid()`) as a sharded dataset of fixed-size patches.
+
+    Shards are extracted in parallel on the active dask scheduler (see `escore.execution`), `shards_per_batch`
+    at a time.
+
+    Args:
+        sv (xr.DataArray): survey Sv.
+        shapes (list[dict]): ROI shapes, with their 'label' if any.
+        out_dir (Path): output directory.
+        window_shape (tuple[int, int], optional): (ESDU, depth samples) size of the patches. Defaults to (256, 128).
+        channels (tuple, optional): channels of the Sv patches. Defaults to (38., 70., 120., 200.).
+        ref_frequency (float, optional): reference channel of ΔSv. Defaults to 38.
+        delta_sv (bool, optional): also write ΔSv patches. Defaults to True.
+        shard_size (int, optional): number of patches per shard. Defaults to 256.
+        shards_per_batch (int, optional): number of shards computed together. Defaults to 4.
+
+    Returns:
+        pd.DataFrame: the index of the dataset.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    channels = [float(c) for c in channels]
+    array_shape = (sv.sizes["time"], sv.sizes["depth"])
+
+    shapes = sorted(shapes, key=lambda s: (s["it_min"], s["id"]))
+    bboxes = np.array([[s["it_min"], s["it_max"], s["iz_min"], s["iz_max"]] for s in shapes], dtype=np.int64).reshape(-1, 4)
+    windows = get_windows(bboxes, array_shape, window_shape=window_shape)
+
+    # Index
+    index = pd.DataFrame({
+        "id": [s["id"] for s in shapes],
+        "label": [s.get("label") for s in shapes],
+        "shard": np.arange(len(shapes)) // shard_size,
+        "offset": np.arange(len(shapes)) % shard_size,
+        "it_min": bboxes[:, 0], "it_max": bboxes[:, 1], "iz_min": bboxes[:, 2], "iz_max": bboxes[:, 3],
+        "win_it_min": windows[:, 0], "win_it_max": windows[:, 1], "win_iz_min": windows[:, 2], "win_iz_max": windows[:, 3],
+        # ROI larger than the patch: its mask is cropped
+        "cropped": (bboxes[:, 0] < windows[:, 0]) | (bboxes[:, 1] > windows[:, 1]) | (bboxes[:, 2] < windows[:, 2]) | (bboxes[:, 3] > windows[:, 3]),
+    })
+
+    # Shards, extracted in parallel. Each task gets the lazy slice of sv covering its windows only (the arguments
+    # of a delayed function are computed in full before the call)
+    n_shards = int(index["shard"].max()) + 1 if len(index) else 0
+    tasks = []
+    for k in range(n_shards):
+        shard_windows = windows[k*shard_size:(k+1)*shard_size]
+        x0, y0 = max(int(shard_windows[:, 0].min()), 0), max(int(shard_windows[:, 2].min()), 0)
+        shard_sv = sv.sel(channel=channels).isel(time=slice(x0, int(shard_windows[:, 1].max()) + 1),
+                                                 depth=slice(y0, int(shard_windows[:, 3].max()) + 1))
+        tasks.append(dask.delayed(write_shard)(shard_sv, shapes[k*shard_size:(k+1)*shard_size], shard_windows,
+                                               out_dir, k, channels, ref_frequency, delta_sv, offset=(x0, y0)))
+
+    from tqdm import tqdm     # imported at first use (slow import)
+
+    with tqdm(total=n_shards, desc="Patch shards") as pbar:
+        for b in range(0, n_shards, shards_per_batch):
+            dask.compute(*tasks[b:b+shards_per_batch])
+            pbar.update(len(tasks[b:b+shards_per_batch]))
+
+    index.to_csv(out_dir / "index.csv", index=False)
+
+    arrays = {"sv": ["channel", "time", "depth"], "mask": ["time", "depth"]}
+    if delta_sv:
+        arrays["delta_sv"] = ["delta_channel", "time", "depth"]
+    with open(out_dir / "metadata.json", "w") as f:
+        json.dump({
+            "n_patches": len(index),
+            "n_shards": n_shards,
+            "shard_size": shard_size,
+            "window_shape": list(window_shape),
+            "channels": channels,
+            "ref_frequency": ref_frequency,
+            "delta_channels": [c for c in channels if c != ref_frequency] if delta_sv else [],
+            "arrays": arrays,
+            "labels": sorted({l for l in index["label"] if isinstance(l, str)}),
+        }, f, indent=2)
+
+    return index
+
+
+class PatchDataset:
+    """Read access to an exported patch dataset. Shards are memory-mapped when first accessed.
+
+    Example:
+        dataset = PatchDataset(get_patches_dir(config))
+        for batch in dataset.iter_batches(batch_size=64, shuffle=True):
+            x, mask, labels = batch["sv"], batch["mask"], batch["label"]
+    """
+    def __init__(self, patches_dir: Path, arrays=("sv", "mask")):
+        self.patches_dir = Path(patches_dir)
+        self.index = pd.read_csv(self.patches_dir / "index.csv")
+        with open(self.patches_dir / "metadata.json", "r") as f:
+            self.metadata = json.load(f)
+        self.arrays = list(arrays)
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def shard(self, k: int) -> dict:
+        if k not in self._shards:
+            self._shards[k] = {a: np.load(self.patches_dir / shard_file(k, a), mmap_mode="r") for a in self.arrays}
+        return self._shards[k]
+
+    def __getitem__(self, i: int) -> dict:
+        row = self.index.iloc[i]
+        item = {a: np.asarray(v[row["offset"]]) for a, v in self.shard(row["shard"]).items()}
+        item.update(id=row["id"], label=row["label"])
+        return item
+
+    def iter_batches(self, batch_size: int = 64, shuffle: bool = False, seed: int | None = None):
+        """Batches of stacked arrays, with the 'id' and 'label' of their patches.
+
+        With shuffle, the order of the shards and of the patches within a shard are shuffled, so that
+        reads stay local to one memory-mapped shard at a time.
+        """
+        rng = np.random.default_rng(seed)
+        shards = self.index["shard"].unique()
+        if shuffle:
+            shards = rng.permutation(shards)
+
+        pending = []
+        for k in shards:
+            offsets = self.index.index[self.index["shard"] == k].to_numpy()
+            if shuffle:
+                offsets = rng.permutation(offsets)
+            pending.extend(offsets)
+            while len(pending) >= batch_size:
+                yield self.get_batch(pending[:batch_size])
+                pending = pending[batch_size:]
+        if pending:
+            yield self.get_batch(pending)
+
+    def get_batch(self, rows) -> dict:
+        rows = self.index.iloc[list(rows)]
+        batch = {a: np.stack([self.shard(k)[a][o] for k, o in zip(rows["shard"], rows["offset"])]) for a in self.arrays}
+        batch.update(id=rows["id"].to_numpy(), label=rows["label"].to_numpy())
+        return batch
@@ -0,0 +1,149 @@
+from pathlib import Path
+import json
+import numpy as np
+import xarray as xr
+import dask
+
+
+# Multi-resolution echogram pyramid
+# Level 0 is the survey Sv itself, level k is pooled by factor**k over time and depth.
+# Levels k >= 1 are stored as netCDF files in a survey folder of interim_dir, next to the session folders.
+
+def get_pyramid_dir(config: dict, ei: str) -> Path:
+    return Path(config["paths"]["interim_dir"]) / ei / "pyramid"
+
+
+def pool_sv(sv: xr.DataArray, factor: int | tuple[int, int] = 2, how: str = "mean") -> xr.DataArray:
+    """Downsample Sv over time and depth.
+
+    Mean pooling is done in the linear domain (sv = 10**(Sv/10)), so that a pooled pixel is the mean
+    backscattering of the pixels it covers. Max pooling is identical in both domains.
+
+    Args:
+        sv (xr.DataArray): Sv in dB, with 'time' and 'depth' dimensions.
+        factor (int | tuple[int, int], optional): pooling factor on (time, depth). Defaults to 2.
+        how (str, optional): one of ['mean', 'max']. Defaults to "mean".
+
+    Returns:
+        xr.DataArray: pooled Sv in dB. Coordinates are those of the first pixel of each block.
+    """
+    ft, fz = (factor, factor) if isinstance(factor, int) else factor
+
+    # Keep dimension coordinates only (e.g. the 'leg' labels can't be pooled)
+    sv = sv.reset_coords(drop=True)
+    windows = dict(time=ft, depth=fz, boundary="pad", coord_func="min")
+
+    if how == "mean":
+        sv_lin = 10 ** (sv / 10)
+        pooled = 10 * np.log10(sv_lin.coarsen(**windows).mean())
+    elif how == "max":
+        pooled = sv.coarsen(**windows).max()
+    else:
+        raise ValueError(f"Pooling method must be one of ['mean', 'max']. Current input: '{how}'")
+
+    return pooled.rename(sv.name)
+
+
+def build_pyramid(
+    sv: xr.DataArray,
+    pyramid_dir: Path,
+    factor: int | tuple[int, int] = 2,
+    how: str = "mean",
+    min_size: int = 1000,
+    n_levels: int | None = None,
+    chunks={"time": 1000, "depth": 100},
+) -> list[Path]:
+    """Write the levels of a pyramid of sv in pyramid_dir.
+
+    Each level is computed from the previous one (read back from disk) so that the full resolution
+    data is read only once.
+
+    Args:
+        sv (xr.DataArray): full resolution Sv (level 0).
+        pyramid_dir (Path): output directory.
+        factor (int | tuple[int, int], optional): pooling factor on (time, depth) between two consecutive levels. Defaults to 2.
+        how (str, optional): one of ['mean', 'max']. Defaults to "mean".
+        min_size (int, optional): stop when the time dimension of a level would fall below. Defaults to 1000.
+        n_levels (int | None, optional): maximum number of levels, level 0 excluded. Defaults to None.
+        chunks (dict, optional): chunks used to read levels back. Defaults to {"time": 1000, "depth": 100}.
+
+    Returns:
+        list[Path]: paths of the level files, level 1 first.
+    """
+    ft, fz = (factor, factor) if isinstance(factor, int) else factor
+    pyramid_dir = Path(pyramid_dir)
+    pyramid_dir.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    level, current = 0, sv
+    while (current.sizes["time"] // ft >= min_size) and (n_levels is None or level < n_levels):
+        level += 1
+        pooled = pool_sv(current, factor=(ft, fz), how=how)
+        pooled.attrs.update({"level": level, "time_factor": ft**level, "depth_factor": fz**level, "pooling": how})
+
+        path = pyramid_dir / f"level_{level}.nc"
+        # netCDF write locks can't be shared with worker processes: write on threads in that case
+        scheduler = "threads" if dask.config.get("scheduler", None) == "processes" else dask.config.get("scheduler", None)
+        with dask.config.set(scheduler=scheduler):
+            pooled.to_dataset(name="Sv").to_netcdf(path)
+        paths.append(path)
+
+        current = xr.open_dataset(path, chunks=chunks)["Sv"]
+
+    with open(pyramid_dir / "pyramid.json", "w") as f:
+        json.dump({
+            "factor": [ft, fz],
+            "pooling": how,
+            "n_levels": level,
+            "shape": [sv.sizes["time"], sv.sizes["depth"]],
+        }, f, indent=2)
+
+    return paths
+
+
+class SvPyramid:
+    """Read access to a survey Sv and its pyramid levels.
+    """
+    def __init__(self, sv: xr.DataArray, pyramid_dir: Path | None = None, chunks={"time": 1000, "depth": 100}):
+        self.levels = [sv]
+        self.factor = (1, 1)
+
+        if pyramid_dir is not None and (Path(pyramid_dir) / "pyramid.json").is_file():
+            with open(Path(pyramid_dir) / "pyramid.json", "r") as f:
+                meta = json.load(f)
+            self.factor = tuple(meta["factor"])
+            for level in range(1, meta["n_levels"] + 1):
+                self.levels.append(xr.open_dataset(Path(pyramid_dir) / f"level_{level}.nc", chunks=chunks)["Sv"])
+
+    def __len__(self):
+        return len(self.levels)
+
+    def scale(self, level: int) -> tuple[int, int]:
+        return self.factor[0] ** level, self.factor[1] ** level
+
+    def select_level(self, n_time: int, n_depth: int, display_shape: tuple[int, int]) -> int:
+        """Coarsest level at which a (n_time, n_depth) window still has at least display_shape pixels on both axes.
+        """
+        level = 0
+        while level + 1 < len(self.levels):
+            st, sz = self.scale(level + 1)
+            if (n_time // st < display_shape[0]) or (n_depth // sz < display_shape[1]):
+                break
+            level += 1
+        return level
+
+    def get_window(self, window: tuple[int, int, int, int], display_shape: tuple[int, int] | None = None):
+        """Slice a (xmin, xmax, ymin, ymax) window, given in full resolution indices (bounds included).
+
+        Returns:
+            tuple[xr.DataArray, tuple[int, int]]: Sv window at the selected level, and the (time, depth) scale of this level.
+        """
+        xmin, xmax, ymin, ymax = window
+        level = 0
+        if display_shape is not None:
+            level = self.select_level(xmax - xmin + 1, ymax - ymin + 1, display_shape)
+
+        st, sz = self.scale(level)
+        sv_window = self.levels[level].isel(time=slice(xmin // st, xmax // st + 1),
+                                            depth=slice(ymin // sz, ymax // sz + 1))
+        return sv_window, (st, sz)
@@ -5,6 +5,8 @@ import json
 import hashlib
 import re
 
+from escore.instrument import instrumented
+
 
 # Track shapes ids in the LABELME JSON files
 def add_shape_ids(json_dir: Path, session_id: str, start_id: int = 0):
@@ -84,7 +86,8 @@ create_roi_registry_sql = """
         shape_type TEXT NOT NULL,
         created TEXTE NOT NULL,
         modified TEXT NOT NULL,
-        status TEXT NOT NULL
+        status TEXT NOT NULL,
+        label TEXT                    -- labelme label of the shape
     )
     """
 
@@ -105,6 +108,12 @@ update_roi_sql = """
 def open_db(db_path: Path):
     conn = sqlite3.connect(db_path)
     conn.execute(create_roi_registry_sql)
+
+    # Registries created before labels were tracked
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(roi_registry)")]
+    if "label" not in columns:
+        conn.execute("ALTER TABLE roi_registry ADD COLUMN label TEXT")
+
     conn.commit()
     return conn
 
@@ -144,6 +153,11 @@ def set_unchanged(conn, shape_id):
     cur.execute("UPDATE roi_registry SET status = ? WHERE id = ?", ("unchanged", shape_id))
 
 
+def set_label(conn, shape_id, label):
+    cur = conn.cursor()
+    cur.execute("UPDATE roi_registry SET label = ? WHERE id = ?", (label, shape_id))
+
+
 def set_deleted(conn, json_dir):
     cur = conn.cursor()
 
@@ -181,7 +195,10 @@ def update_shapes_from_json(conn, json_file, root_path, now):
         else:
             set_unchanged(conn, shape_id) # Unchanged
 
+        set_label(conn, shape_id, shape.get("label")) # Labels can change without geometry changes
 
+
+@instrumented("registry.update_registry")
 def update_registry(json_dir, conn, root_path):
     now = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
 
@@ -269,6 +286,12 @@ def list_valid_ROI_ids(conn):
     return [id for (id,) in cur.fetchall()]
 
 
+def fetch_valid_ROIs(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT id, points, it_min, it_max, iz_min, iz_max, status, label FROM roi_registry WHERE status != 'deleted'")
+    return [registry_row_to_shape(row) for row in cur.fetchall()]
+
+
 class ROIRegistry:
     def __init__(self, db_path: Path, root_path: Path):
         self.db_path = db_path
@@ -305,11 +328,14 @@ class ROIRegistry:
 
     def list_ids(self):
         return(list_valid_ROI_ids(self.conn))
+
+    def fetch_valid(self):
+        return fetch_valid_ROIs(self.conn)
     
 
 def registry_row_to_shape(row):
     shape = {}
-    keys = "id", "points", "it_min", "it_max", "iz_min", "iz_max", "status"
+    keys = "id", "points", "it_min", "it_max", "iz_min", "iz_max", "status", "label"
     for i in range(len(row)):
         shape[keys[i]] = row[i]
     shape["points"] = json.loads(shape["points"])
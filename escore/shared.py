@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+from threading import Lock
+import json
+import sys
+import uuid
+import numpy as np
+
+
+# Shared-memory survey windows
+# Arrays (Sv windows, display cubes...) are loaded once by a `SharedRegionManager`, in the parent process, into
+# `multiprocessing.shared_memory` blocks. Worker processes attach them by name and get zero-copy read-only numpy
+# views, so that N workers use ~1x the memory of a window instead of reading and decompressing it N times.
+# Each block starts with a fixed size JSON header (shape, dtype), so that a name is enough to attach it.
+#
+# Example:
+#     with SharedRegionManager(max_bytes=2e9) as manager:
+#         name = manager.share_window(sv, (0, 9999, 0, 743), channels=[38., 70., 120.])
+#         pool.map(partial(work, name), tasks)          # in workers: with attach(name) as shared: shared.array...
+#         manager.release(name)
+#
+# Ownership: the manager that created a block is its only owner, it alone unlinks it (on eviction or close), and
+# only its process tracks it for cleanup at exit. Attaching processes never track nor unlink blocks: with
+# Python >= 3.13 they attach with `track=False`; before, attaching registers the block to the resource tracker,
+# so `SharedArray` always unregisters it right away. Otherwise the tracker of an unrelated process would unlink
+# the block at its exit, while the manager and other workers still use it.
+#
+# Views of an attached array (`shared.array` and anything sliced from it without a copy) must not outlive the `with`
+# block: they hold an export of the mapping, so closing it while they are referenced raises `BufferError`.
+# Copy what must be kept (`shared.array[...].copy()`, or a reduction).
+
+HEADER_SIZE = 256
+
+
+def write_header(buf, shape, dtype):
+    header = json.dumps({"shape": list(shape), "dtype": np.dtype(dtype).str}).encode()
+    if len(header) > HEADER_SIZE:
+        raise ValueError(f"Array header is larger than {HEADER_SIZE} bytes: {header}")
+    buf[:HEADER_SIZE] = header.ljust(HEADER_SIZE, b" ")
+
+
+def read_header(buf) -> tuple[tuple, np.dtype]:
+    header = json.loads(bytes(buf[:HEADER_SIZE]).decode())
+    return tuple(header["shape"]), np.dtype(header["dtype"])
+
+
+class SharedArray:
+    """Read-only numpy view of a shared-memory block, attached by name (see `attach`)."""
+    def __init__(self, name: str):
+        # Attached blocks are not tracked, only the manager owns them (see module comment)
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+
+        shape, dtype = read_header(self.shm.buf)
+        # frombuffer views export the buffer of the mapping: it can't be closed under them (see module comment)
+        self.array = np.frombuffer(self.shm.buf, dtype=dtype, count=int(np.prod(shape)), offset=HEADER_SIZE)
+        self.array = self.array.reshape(shape)
+        self.array.flags.writeable = False
+
+    def close(self):
+        self.array = None
+        try:
+            self.shm.close()
+        except BufferError as e:
+            raise BufferError(f"Views of shared array '{self.shm.name}' are still referenced, "
+                              "they must not outlive its `with` block") from e
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def attach(name: str) -> SharedArray:
+    """Attach a shared array by name, in any process. Use as a context manager, its read-only view is `array`:
+
+        with attach(name) as shared:
+            total = np.nansum(shared.array)
+
+    Views of it must not outlive the block, closing raises `BufferError` while they are referenced.
+    """
+    return SharedArray(name)
+
+
+class SharedRegionManager:
+    """Owner of shared-memory arrays, with reference counting and LRU eviction.
+
+    `share_*` methods return the name of a block and take a reference on it, `release` drops one. Blocks without
+    references stay cached (a new request of the same key doesn't reload it) until they are evicted to keep the
+    total size under max_bytes, or until the manager is closed.
+    """
+    def __init__(self, max_bytes: float | None = None):
+        self.max_bytes = max_bytes
+        self._regions = OrderedDict()    # key -> {"shm", "refs", "nbytes"}
+        self._names = {}                 # name -> key
+        self._lock = Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(r["nbytes"] for r in self._regions.values())
+
+    def share(self, key, loader) -> str:
+        """Name of the block of key, created with the array returned by loader() if not shared yet."""
+        with self._lock:
+            if key in self._regions:
+                region = self._regions[key]
+                region["refs"] += 1
+                self._regions.move_to_end(key)
+                return region["shm"].name
+
+        array = np.ascontiguousarray(loader())
+
+        with self._lock:
+            if key in self._regions:    # loaded concurrently
+                region = self._regions[key]
+                region["refs"] += 1
+                return region["shm"].name
+
+            self._evict(array.nbytes)
+            shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + max(array.nbytes, 1),
+                                             name=f"escore_{uuid.uuid4().hex[:16]}")
+            write_header(shm.buf, array.shape, array.dtype)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=HEADER_SIZE)[...] = array
+
+            self._regions[key] = {"shm": shm, "refs": 1, "nbytes": array.nbytes}
+            self._names[shm.name] = key
+            return shm.name
+
+    def share_array(self, key, array: np.ndarray) -> str:
+        return self.share(key, lambda: array)
+
+    def share_window(self, sv, window: tuple[int, int, int, int], channels=(38., 70., 120.)) -> str:
+        """Sv (channel, time, depth) of a (xmin, xmax, ymin, ymax) window of indices (bounds included).
+
+        Windows are keyed by the dask name of sv, so that the same window of the same survey is read once.
+        """
+        xmin, xmax, ymin, ymax = (int(v) for v in window)
+        channels = [float(c) for c in channels]
+        key = ("window", getattr(sv.data, "name", id(sv)), xmin, xmax, ymin, ymax, tuple(channels))
+        return self.share(key, lambda: sv.isel(time=slice(xmin, xmax + 1), depth=slice(ymin, ymax + 1))
+                                         .sel(channel=channels).transpose("channel", "time", "depth").values)
+
+    def share_display_cube(self, cube) -> str:
+        """uint8 values of a `DisplayCube` (time, depth[, channel])."""
+        key = ("display_cube", cube.vmin, cube.vmax, tuple(cube.channels), cube.values.shape)
+        return self.share(key, lambda: cube.values)
+
+    def release(self, name: str):
+        with self._lock:
+            region = self._regions[self._names[name]]
+            if region["refs"] == 0:
+                raise ValueError(f"Shared array '{name}' has no reference to release")
+            region["refs"] -= 1
+
+    def refs(self, name: str) -> int:
+        return self._regions[self._names[name]]["refs"]
+
+    def _evict(self, incoming_bytes: int):
+        """Unlink least recently used blocks without references until incoming_bytes fit under max_bytes."""
+        if self.max_bytes is None:
+            return
+        for key in list(self._regions):
+            if self.nbytes + incoming_bytes <= self.max_bytes:
+                break
+            if self._regions[key]["refs"] == 0:
+                self._unlink(key)
+
+    def _unlink(self, key):
+        region = self._regions.pop(key)
+        del self._names[region["shm"].name]
+        region["shm"].close()
+        # The registration of the block may have been dropped by a view attached in a process sharing the tracker
+        # (Python < 3.13): registering again (no-op otherwise) keeps it balanced with the unregister of unlink
+        resource_tracker.register(region["shm"]._name, "shared_memory")
+        region["shm"].unlink()
+
+    def close(self):
+        """Unlink all blocks. Workers must have closed their views."""
+        with self._lock:
+            for key in list(self._regions):
+                self._unlink(key)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,252 @@
+from pathlib import Path
+from dataclasses import dataclass, field, asdict
+import json
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask.array as da
+from dask import delayed
+
+from escore.builder import frame_image_name
+
+
+# Synthetic multi-frequency Sv surveys, for scale and performance testing without the real data.
+# Files have the same layout as the survey netCDF files: Sv(channel, time, depth) in dB, with the
+# data_ping_axis_* / data_range_axis_* attributes read by `print_file_infos`.
+
+PRODUCTION_N_TIME = 400_000     # number of ESDUs of a production survey (order of magnitude of Amazomix)
+
+
+@dataclass(frozen=True)
+class EchotypeLayer:
+    """Scattering layer planted in a synthetic survey.
+
+    The layer is centered on `depth_m`, with a diel vertical migration of `migration_m` (deepest at noon),
+    and is present on a fraction `presence` of the ESDUs (in patches of ~`patch_size` ESDUs).
+    """
+    name: str
+    sv_db: tuple[float, ...]            # Sv of the layer per channel (dB)
+    depth_m: float
+    thickness_m: float
+    migration_m: float = 0.
+    presence: float = 1.
+    patch_size: int = 500
+
+
+DEFAULT_LAYERS = (
+    EchotypeLayer("fish_schools", sv_db=(-58., -61., -64., -67.), depth_m=40., thickness_m=20., presence=0.3, patch_size=200),
+    EchotypeLayer("mesopelagic", sv_db=(-72., -72., -73., -75.), depth_m=250., thickness_m=40., presence=0.8),
+    EchotypeLayer("zooplankton_dsl", sv_db=(-80., -76., -72., -68.), depth_m=450., thickness_m=60., migration_m=350.),
+)
+
+
+@dataclass(frozen=True)
+class SyntheticSurveyConfig:
+    n_time: int = 10_000
+    n_depth: int = 744
+    n_legs: int = 1
+    channels: tuple[float, ...] = (38., 70., 120., 200.)
+    start: str = "2021-08-28T00:00:00"
+    ping_interval_s: float = 6.
+    depth_step_m: float = 1.
+    chunks: tuple[int, int] = (1000, 100)           # netCDF (time, depth) chunk sizes; blocks of chunks[0] ESDUs are generated at once
+    nan_fraction: float = 0.01
+    background_sv_db: float = -90.
+    noise_sv_db_1m: float = -170.                   # noise at 1 m, increasing with range as 20 log(r) + 2 alpha r
+    absorption_db_m: tuple[float, ...] = (0.010, 0.020, 0.035, 0.050)
+    speckle_sd_db: float = 3.
+    layers: tuple[EchotypeLayer, ...] = field(default=DEFAULT_LAYERS)
+    title: str = "Synthetic survey"
+    seed: int = 0
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        d = dict(d)
+        if "scale" in d:
+            d["n_time"] = int(d.pop("scale") * PRODUCTION_N_TIME)
+        if "layers" in d:
+            d["layers"] = tuple(EchotypeLayer(**{**l, "sv_db": tuple(l["sv_db"])}) for l in d["layers"])
+        for key in ("channels", "chunks", "absorption_db_m"):
+            if key in d:
+                d[key] = tuple(d[key])
+        return cls(**d)
+
+    def time_axis(self):
+        return pd.date_range(self.start, periods=self.n_time, freq=pd.Timedelta(seconds=self.ping_interval_s))
+
+    def depth_axis(self):
+        return (np.arange(self.n_depth) + 0.5) * self.depth_step_m
+
+
+# Sv generation
+
+def layer_mask(layer: EchotypeLayer, layer_idx: int, seconds: np.ndarray, t_idx: np.ndarray, depth: np.ndarray, seed: int):
+    """Boolean (time, depth) mask of the pixels of a layer."""
+    hour = (seconds / 3600) % 24
+    center = layer.depth_m - layer.migration_m / 2 * np.cos(2 * np.pi * hour / 24)   # in depth_m +/- migration_m/2
+
+    present = np.ones(len(t_idx), dtype=bool)
+    if layer.presence < 1:
+        # Deterministic patches: a patch is present if its hashed value is below `presence`
+        patch = t_idx // layer.patch_size
+        present = ((patch * 2654435761 + (seed + 1) * 97 + layer_idx * 7919) % 10007) / 10007 < layer.presence
+
+    in_layer = np.abs(depth[None, :] - center[:, None]) <= layer.thickness_m / 2
+    return in_layer & present[:, None]
+
+
+def synthetic_sv_block(cfg: SyntheticSurveyConfig, t_start: int, t_stop: int) -> np.ndarray:
+    """Sv (dB) of ESDUs [t_start, t_stop), array of shape (n_channels, t_stop - t_start, n_depth).
+
+    Blocks are independent and reproducible: the random generator is seeded by (seed, t_start).
+    """
+    rng = np.random.default_rng([cfg.seed, t_start])
+    t_idx = np.arange(t_start, t_stop)
+    seconds = t_idx * cfg.ping_interval_s
+    depth = cfg.depth_axis()
+    n_c, n_t, n_z = len(cfg.channels), t_stop - t_start, cfg.n_depth
+
+    # Background and range dependent noise, in linear domain
+    alpha = np.asarray(cfg.absorption_db_m[:n_c])[:, None]
+    noise_db = cfg.noise_sv_db_1m + 20 * np.log10(depth)[None, :] + 2 * alpha * depth[None, :]       # (c, z)
+    sv_lin = np.broadcast_to(10 ** (cfg.background_sv_db / 10) + 10 ** (noise_db / 10), (n_t, n_c, n_z)).transpose(1, 0, 2).copy()
+
+    # Planted layers
+    for i, layer in enumerate(cfg.layers):
+        mask = layer_mask(layer, i, seconds, t_idx, depth, cfg.seed)
+        sv_lin += mask[None, :, :] * (10 ** (np.asarray(layer.sv_db[:n_c]) / 10))[:, None, None]
+
+    sv = 10 * np.log10(sv_lin) + rng.normal(0., cfg.speckle_sd_db, size=(n_c, n_t, n_z))
+
+    # Missing values (same pixels on all channels)
+    if cfg.nan_fraction > 0:
+        sv[:, rng.random((n_t, n_z)) < cfg.nan_fraction] = np.nan
+
+    return sv.astype(np.float32)
+
+
+def synthetic_sv(cfg: SyntheticSurveyConfig, t_start: int = 0, t_stop: int | None = None) -> da.Array:
+    """Lazy Sv of ESDUs [t_start, t_stop), generated block by block (cfg.chunks[0] ESDUs per block)."""
+    t_stop = cfg.n_time if t_stop is None else t_stop
+    bounds = list(range(t_start, t_stop, cfg.chunks[0])) + [t_stop]
+
+    blocks = [
+        da.from_delayed(
+            delayed(synthetic_sv_block)(cfg, t0, t1),
+            shape=(len(cfg.channels), t1 - t0, cfg.n_depth),
+            dtype=np.float32,
+        )
+        for t0, t1 in zip(bounds[:-1], bounds[1:])
+    ]
+    return da.concatenate(blocks, axis=1)
+
+
+# Writers
+
+def write_synthetic_survey(cfg: SyntheticSurveyConfig, input_dir: Path, survey: str) -> dict:
+    """Write a synthetic survey as one netCDF file per leg in input_dir.
+
+    Returns:
+        dict: 'sv_files' and 'surveys' config sections describing the written files, to be merged
+            into a global config (paths relative to input_dir).
+    """
+    input_dir = Path(input_dir)
+    input_dir.mkdir(parents=True, exist_ok=True)
+
+    time, depth = cfg.time_axis(), cfg.depth_axis()
+    bounds = np.linspace(0, cfg.n_time, cfg.n_legs + 1).astype(int)
+    sections = {"sv_files": {}, "surveys": {survey: []}}
+
+    for i, (t0, t1) in enumerate(zip(bounds[:-1], bounds[1:])):
+        ds = xr.Dataset(
+            {"Sv": (("channel", "time", "depth"), synthetic_sv(cfg, t0, t1))},
+            coords={"channel": list(cfg.channels), "time": time[t0:t1], "depth": depth},
+            attrs={
+                "title": cfg.title,
+                "data_ping_axis_interval_value": cfg.ping_interval_s,
+                "data_ping_axis_interval_type": "seconds",
+                "data_range_axis_interval_value": cfg.depth_step_m,
+                "data_range_axis_interval_type": "meters",
+                "synthetic_config": json.dumps(asdict(cfg)),
+            },
+        )
+        ds["Sv"].attrs.update({"units": "dB re 1 m-1", "long_name": "Volume backscattering strength"})
+
+        key = f"{survey}_leg{i + 1}"
+        file = f"{key}.nc"
+        ds.to_netcdf(
+            input_dir / file,
+            encoding={"Sv": {"chunksizes": (1, min(cfg.chunks[0], t1 - t0), min(cfg.chunks[1], cfg.n_depth))}},
+        )
+
+        sections["sv_files"][key] = {"leg_id": f"leg{i + 1}", "file": file}
+        sections["surveys"][survey].append(key)
+
+    return sections
+
+
+def write_labelme_rois(
+    cfg: SyntheticSurveyConfig,
+    json_dir: Path,
+    ei: str,
+    n_rois: int = 20,
+    roi_width: int = 300,
+    time_frame_size: int = 10_000,
+    z_min_idx: int = 0,
+    z_max_idx: int = -1,
+    vmin: float = -90.,
+    vmax: float = -50.,
+):
+    """Write labelme JSON files with rectangle ROIs around the planted layers.
+
+    Files follow the image dataset naming (one JSON per frame image, see `frame_image_name`) so that
+    they can be used as a labelling session of 01_label_ROIs.py. Each shape's label is the layer name.
+    """
+    json_dir = Path(json_dir)
+    json_dir.mkdir(parents=True, exist_ok=True)
+
+    rng = np.random.default_rng(cfg.seed)
+    depth = cfg.depth_axis()
+    frames = {}
+
+    for n in range(n_rois):
+        i = n % len(cfg.layers)
+        layer = cfg.layers[i]
+
+        # Time window where the layer is present
+        for _ in range(100):
+            t0 = int(rng.integers(0, max(cfg.n_time - roi_width, 1)))
+            t_idx = np.arange(t0, min(t0 + roi_width, cfg.n_time))
+            mask = layer_mask(layer, i, t_idx * cfg.ping_interval_s, t_idx, depth, cfg.seed)
+            if mask.any(axis=1).mean() > 0.9:
+                break
+        else:
+            continue
+
+        z_idx = np.flatnonzero(mask.any(axis=0))
+        frame_t0 = t0 // time_frame_size * time_frame_size
+        frame_t1 = min(frame_t0 + time_frame_size, cfg.n_time)
+        x0, x1 = t0 - frame_t0, min(t_idx[-1] - frame_t0, frame_t1 - frame_t0 - 1)
+
+        frames.setdefault((frame_t0, frame_t1), []).append({
+            "label": layer.name,
+            "points": [[float(x0), float(z_idx[0])], [float(x1), float(z_idx[-1])]],
+            "group_id": None,
+            "description": "",
+            "shape_type": "rectangle",
+            "flags": {},
+        })
+
+    n_depth_img = len(range(cfg.n_depth)[z_min_idx:z_max_idx])
+    for (frame_t0, frame_t1), shapes in frames.items():
+        image = frame_image_name(ei, frame_t0, frame_t1, z_min_idx, z_max_idx, vmin, vmax)
+        with open(json_dir / Path(image).with_suffix(".json"), "w") as f:
+            json.dump({
+                "version": "5.2.1",
+                "flags": {},
+                "shapes": shapes,
+                "imagePath": f"../{image}",
+                "imageData": None,
+                "imageHeight": n_depth_img,
+                "imageWidth": frame_t1 - frame_t0,
+            }, f, indent=2)
@@ -0,0 +1,29 @@
+from pathlib import Path
+import pytest
+
+from escore import synthetic
+from escore.io import load_survey_ds
+
+
+SURVEY = "test_survey"
+
+
+@pytest.fixture(scope="session")
+def survey_config(tmp_path_factory) -> dict:
+    """Global config of a small synthetic survey (2 legs, 2000 ESDUs x 300 depth samples)."""
+    data_dir = tmp_path_factory.mktemp("survey")
+    cfg = synthetic.SyntheticSurveyConfig(n_time=2000, n_depth=300, n_legs=2, chunks=(500, 100), seed=0)
+
+    return {
+        "paths": {
+            "input_dir": str(data_dir / "input"),
+            "echogram_images_dir": str(data_dir / "echogram_images"),
+            "interim_dir": str(data_dir / "interim"),
+        },
+        **synthetic.write_synthetic_survey(cfg, data_dir / "input", SURVEY),
+    }
+
+
+@pytest.fixture(scope="session")
+def sv(survey_config):
+    return load_survey_ds(SURVEY, survey_config)["Sv"]
@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import plotly.graph_objects as go
+import pytest
+from dash import no_update
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+
+from escore.registry import ROIRegistry, add_new_roi
+from escore.apps.echotypes import callbacks
+from escore.apps.echotypes.app import create_app
+
+
+DEEP_ROI = {"id": "deep_roi", "shape_type": "polygon", "points": [[300, 200], [600, 200], [600, 290], [300, 290]]}
+RGB = dict(db_range=[-90, -50], mask_alpha_in=0., mask_alpha_out=0.5, type="ROI mask in context", win_esdu=400, win_depth=300)
+CLUSTERING = dict(n_clusters=3, frequencies=[38, 70, 120, 200], method="KMeans", features="Delta Sv", dropout_depths=[None] * 4)
+
+
+def get_update_roi_views(sv, tmp_path, app_config=None):
+    """Undecorated roi views callback of an app on the test survey, with DEEP_ROI in its registry."""
+    with ROIRegistry(db_path=tmp_path / "roi_registry.db", root_path=tmp_path) as registry:
+        with registry.conn:
+            add_new_roi(registry.conn, DEEP_ROI, "frame.png", 0, datetime.today().strftime('%Y-%m-%d %H:%M:%S'))
+
+    app = create_app(sv, tmp_path / "roi_registry.db", tmp_path, [DEEP_ROI["id"]], app_config=app_config)
+    context_value.set(AttributeDict(triggered_inputs=[]))     # initial call: all views
+    key = next(k for k in app.callback_map if k.strip(".").startswith("rgb-plot-fig"))
+    return app.callback_map[key]["callback"].__wrapped__
+
+
+@pytest.fixture
+def update_roi_views(sv, tmp_path):
+    return get_update_roi_views(sv, tmp_path)
+
+
+def test_deep_roi_leaves_out_dropped_channel(update_roi_views):
+    # 200 kHz beyond its dropout depth on the whole ROI
+    outputs = update_roi_views(DEEP_ROI["id"], RGB, dict(CLUSTERING, dropout_depths=[None, None, None, 150]), 1, None)
+    assert all(outputs[k] is not no_update for k in ["rgb_fig", "clustering_fig", "labels", "summary", "valid_fig"])
+    assert outputs["summary"]["coords"]["channel"]["data"] == [38., 70., 120.]
+    assert "200 kHz" in outputs["clustering_status"]
+
+
+def test_deep_roi_without_clustering_keeps_rgb_view(update_roi_views):
+    # No valid Sv on the reference channel: nothing to cluster
+    outputs = update_roi_views(DEEP_ROI["id"], RGB, dict(CLUSTERING, dropout_depths=[150, None, None, 150]), 1, None)
+    assert isinstance(outputs["rgb_fig"], go.Figure)
+    assert all(outputs[k] is no_update for k in ["clustering_fig", "labels", "summary", "valid_fig"])
+    assert "reference channel" in outputs["clustering_status"]
+
+
+def test_failed_clustering_keeps_rgb_view(update_roi_views, monkeypatch):
+    def cluster_roi(*args, **kwargs):
+        raise RuntimeError("out of memory")
+    monkeypatch.setattr(callbacks, "cluster_roi", cluster_roi)
+
+    outputs = update_roi_views(DEEP_ROI["id"], RGB, CLUSTERING, 1, None)
+    assert isinstance(outputs["rgb_fig"], go.Figure)
+    assert all(outputs[k] is no_update for k in ["clustering_fig", "labels", "summary", "valid_fig"])
+    assert outputs["clustering_status"] == "Clustering failed: out of memory"
+
+    # Display inputs don't retry it
+    calls = []
+    monkeypatch.setattr(callbacks, "cluster_roi", lambda *args, **kwargs: calls.append(1))
+    context_value.set(AttributeDict(triggered_inputs=[{"prop_id": "db-slider.value", "value": [-80, -50]}]))
+    outputs = update_roi_views(DEEP_ROI["id"], dict(RGB, db_range=[-80, -50]), CLUSTERING, 1, None)
+    assert not calls and outputs["rgb_fig"] is not no_update
+    assert all(outputs[k] is no_update for k in ["clustering_fig", "labels", "summary", "valid_fig", "clustering_status"])
+
+
+def test_label_stability_status(sv, tmp_path):
+    update_roi_views = get_update_roi_views(sv, tmp_path, {"fit_sample_size": 1000, "report_stability": True})
+    outputs = update_roi_views(DEEP_ROI["id"], RGB, dict(CLUSTERING, dropout_depths=[None, None, None, 150]), 1, None)
+    assert "Fitted on 1000 of" in outputs["clustering_status"] and "adjusted Rand index" in outputs["clustering_status"]
@@ -0,0 +1,54 @@
+import io
+
+import pytest
+
+from escore.builder import DatasetConfig, plot_survey_RGB, sv2array, sv_array2image, slice_time
+from escore.execution import ExecutionConfig
+
+
+FRAME_SIZE = 300
+Z_MIN, Z_MAX = 10, 250
+VMIN, VMAX = -90., -50.
+
+
+def baseline_frames(sv, channels, echogram_cmap):
+    """Frame files of the original frame by frame builder: {file name: PNG bytes}."""
+    slicing = slice_time(sv, FRAME_SIZE)
+    frames = {}
+    for t0, t1 in zip(slicing[:-1], slicing[1:]):
+        sv_array = sv2array(sv, time_idx_slice=slice(t0, t1), depth_idx_slice=slice(Z_MIN, Z_MAX), channels=channels)
+        buffer = io.BytesIO()
+        sv_array2image(sv_array, VMIN, VMAX, echogram_cmap).save(buffer, format="png")
+        frames[f"ei_T{t0}-{t1}_Z{Z_MIN}-{Z_MAX}_Sv{VMIN}-{VMAX}.png"] = buffer.getvalue()
+    return frames
+
+
+@pytest.mark.parametrize("execution_config", [
+    ExecutionConfig(),                                  # batched
+    ExecutionConfig(frames_per_batch=3),                # batched, last batch incomplete
+    ExecutionConfig(prefetch_frames=2, n_encoders=2),   # pipelined
+])
+@pytest.mark.parametrize("channels, echogram_cmap", [((38., 70., 120.), "RGB"), (38, "viridis")])
+def test_frames_match_baseline(sv, tmp_path, execution_config, channels, echogram_cmap):
+    plot_survey_RGB(sv, FRAME_SIZE, Z_MIN, Z_MAX, VMIN, VMAX, channels, echogram_cmap, tmp_path, "ei",
+                    execution_config=execution_config)
+
+    expected = baseline_frames(sv, channels, echogram_cmap)
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(expected)
+    for name, data in expected.items():
+        assert (tmp_path / name).read_bytes() == data, name
+
+
+def test_dataset_config_name_and_hash():
+    config = DatasetConfig(10000, -90., -50., 0, -1, frequencies=[38., 70., 120.])
+    assert config.name() == "RGB_38_70_120kHz_TF10000_Z0--1_Sv-90.0--50.0dB"
+    assert config.get_dropout_depths() is None
+
+    # correct_120 masks 120 kHz beyond its default dropout depth: another dataset
+    corrected = DatasetConfig(10000, -90., -50., 0, -1, frequencies=[38., 70., 120.], correct_120=True)
+    assert corrected.name() == config.name() + "_DO120-300" and corrected.get_dropout_depths() == {120.: 300}
+
+    dropout = DatasetConfig(10000, -90., -50., 0, -1, frequencies=[38., 70., 120.], dropout_depths={120: 300, 200.: 150})
+    assert dropout.dropout_depths == ((120., 300), (200., 150))
+    assert dropout.name() == config.name() + "_DO120-300_200-150"
+    assert len({config, corrected, dropout, DatasetConfig(10000, -90., -50., 0, -1, frequencies=(38., 70., 120.))}) == 3
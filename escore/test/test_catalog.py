@@ -0,0 +1,109 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from escore import catalog as catalog_module
+from escore.catalog import SurveyCatalog
+from escore.test.conftest import SURVEY
+
+
+@pytest.fixture
+def config(survey_config, tmp_path) -> dict:
+    """Copy of the test survey config, with its own leg files and interim_dir."""
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    for sv_file in survey_config["sv_files"].values():
+        shutil.copy(Path(survey_config["paths"]["input_dir"]) / sv_file["file"], input_dir)
+    return {
+        "paths": {"input_dir": str(input_dir), "interim_dir": str(tmp_path / "interim")},
+        "sv_files": {k: dict(v) for k, v in survey_config["sv_files"].items()},
+        "surveys": {k: list(v) for k, v in survey_config["surveys"].items()},
+    }
+
+
+def add_leg(config, key, ds):
+    """Write ds as a new leg of the test survey."""
+    ds.to_netcdf(Path(config["paths"]["input_dir"]) / f"{key}.nc")
+    config["sv_files"][key] = {"leg_id": key, "file": f"{key}.nc"}
+    config["surveys"][SURVEY].append(key)
+
+
+def test_refresh_catalog(config, sv, monkeypatch):
+    leg1, leg2 = config["surveys"][SURVEY]
+    with SurveyCatalog.from_config(config, refresh=False) as catalog:
+        assert catalog.refresh(config) == {"added": [leg1, leg2], "updated": [], "unchanged": [], "missing": []}
+        legs = catalog.legs(SURVEY)
+        assert [leg["key"] for leg in legs] == [leg1, leg2]
+        assert sum(leg["n_time"] for leg in legs) == sv.sizes["time"]
+        assert legs[0]["channels"] == [float(c) for c in sv["channel"].values] and legs[0]["n_depth"] == sv.sizes["depth"]
+        assert legs[0]["time_start"] == str(np.datetime64(sv["time"].values[0], "ms"))
+        assert legs[1]["time_end"] == str(np.datetime64(sv["time"].values[-1], "ms"))
+
+        # Files are re-read only when their fingerprint changes
+        read_leg_metadata = catalog_module.read_leg_metadata
+        def no_read(file_path):
+            raise AssertionError(f"{file_path} read again")
+        monkeypatch.setattr(catalog_module, "read_leg_metadata", no_read)
+        assert catalog.refresh(config)["unchanged"] == [leg1, leg2]
+
+        leg2_path = Path(config["paths"]["input_dir"]) / config["sv_files"][leg2]["file"]
+        os.utime(leg2_path, ns=(leg2_path.stat().st_atime_ns, leg2_path.stat().st_mtime_ns + 10**9))
+        with pytest.raises(AssertionError, match="read again"):
+            catalog.refresh(config)
+        monkeypatch.setattr(catalog_module, "read_leg_metadata", read_leg_metadata)
+        assert catalog.refresh(config) == {"added": [], "updated": [leg2], "unchanged": [leg1], "missing": []}
+
+        # Missing file, and leg removed from the config
+        leg2_path.unlink()
+        assert catalog.refresh(config)["missing"] == [leg2]
+        assert [leg["key"] for leg in catalog.legs(SURVEY)] == [leg1]
+
+        shutil.copy(Path(config["paths"]["input_dir"]) / config["sv_files"][leg1]["file"], leg2_path)
+        catalog.refresh(config)
+        del config["sv_files"][leg2]
+        config["surveys"][SURVEY].remove(leg2)
+        catalog.refresh(config)
+        assert catalog.conn.execute("SELECT key FROM legs").fetchall() == [(leg1,)]
+
+
+def test_validate_surveys(config, sv):
+    with SurveyCatalog.from_config(config) as catalog:
+        assert catalog.validate(config) == []
+        assert catalog.validate(config, ["other_survey"]) == ["Survey 'other_survey' is not declared in 'surveys'"]
+
+    # Undeclared leg and missing file
+    config["surveys"][SURVEY] += ["undeclared_leg", "missing_leg"]
+    config["sv_files"]["missing_leg"] = {"leg_id": "leg3", "file": "missing.nc"}
+    with SurveyCatalog.from_config(config) as catalog:
+        assert catalog.validate(config) == [
+            f"Survey '{SURVEY}': leg 'undeclared_leg' is not declared in 'sv_files'",
+            f"Survey '{SURVEY}': file of leg 'missing_leg' not found (missing.nc)",
+        ]
+    config["surveys"][SURVEY] = config["surveys"][SURVEY][:2]
+
+    # Legs with another depth axis, or other channels
+    leg = sv.isel(time=slice(0, 10)).to_dataset().assign_coords(time=sv["time"].values[-1] + np.arange(1, 11) * np.timedelta64(1, "m"))
+    leg = leg.drop_vars("leg", errors="ignore")
+    for key, other in [("short_leg", leg.isel(depth=slice(0, 100))), ("two_channels", leg.isel(channel=slice(0, 2)))]:
+        config_other = {**config, "sv_files": dict(config["sv_files"]), "surveys": {SURVEY: list(config["surveys"][SURVEY])}}
+        add_leg(config_other, key, other.load())
+        with SurveyCatalog.from_config(config_other) as catalog:
+            assert catalog.validate(config_other) == [f"Survey '{SURVEY}': legs have different depth axes or channels"]
+
+
+def test_list_surveys(config, sv):
+    config["surveys"]["first_leg"] = config["surveys"][SURVEY][:1]
+    with SurveyCatalog.from_config(config) as catalog:
+        surveys = {s["survey"]: s for s in catalog.surveys()}
+
+    assert list(surveys) == ["first_leg", SURVEY]
+    assert surveys[SURVEY] == {
+        "survey": SURVEY, "n_legs": 2,
+        "time_start": str(np.datetime64(sv["time"].values[0], "ms")),
+        "time_end": str(np.datetime64(sv["time"].values[-1], "ms")),
+        "n_time": sv.sizes["time"], "n_depth": sv.sizes["depth"], "n_channel": sv.sizes["channel"],
+    }
+    assert surveys["first_leg"]["n_legs"] == 1 and surveys["first_leg"]["n_time"] < sv.sizes["time"]
@@ -0,0 +1,44 @@
+import json
+import os
+import logging
+
+from escore import instrument
+
+
+def test_configure_twice_writes_records_once(tmp_path):
+    log_path = tmp_path / "instrumentation.jsonl"
+    try:
+        instrument.configure(enabled=True, log_path=log_path)
+        instrument.configure(enabled=True, log_path=log_path)
+        file_handlers = [h for h in instrument.logger.handlers if isinstance(h, logging.FileHandler)]
+        assert len(file_handlers) == 1
+
+        with instrument.stage("test.stage"):
+            pass
+        for handler in file_handlers:
+            handler.flush()
+        records = [json.loads(line) for line in log_path.read_text().splitlines()]
+        assert [r["stage"] for r in records] == ["test.stage"]
+
+        # A new path replaces the previous handler
+        instrument.configure(enabled=True, log_path=tmp_path / "other.jsonl")
+        assert [h.baseFilename for h in instrument.logger.handlers if isinstance(h, logging.FileHandler)] == \
+            [str((tmp_path / "other.jsonl").resolve())]
+    finally:
+        instrument.configure(enabled=False)
+        instrument.reset_stats()
+
+    assert not [h for h in instrument.logger.handlers if isinstance(h, logging.FileHandler)]
+
+
+def test_metrics_text_worker_label():
+    try:
+        instrument.configure(enabled=True)
+        with instrument.stage("test.stage"):
+            pass
+        text = instrument.metrics_text()
+    finally:
+        instrument.configure(enabled=False)
+        instrument.reset_stats()
+
+    assert f'escore_stage_calls_total{{stage="test.stage",worker="{os.getpid()}"}} 1' in text
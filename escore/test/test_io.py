@@ -1,5 +1,111 @@
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import xarray as xr
+
 from escore.config import load_config
-from escore.io import load_survey_ds, print_file_infos
+from escore.io import (load_survey_ds, print_file_infos, apply_dropout_depths, legs_in_time_order, get_time_index,
+                       TimeIndex, open_leg)
+
+
+def write_legs(data_dir, leg_starts, n_time=50, n_depth=10, shuffle_leg=None):
+    """Config of a survey of legs of n_time ESDUs (1 min apart) starting at leg_starts (minutes)."""
+    rng = np.random.default_rng(0)
+    input_dir = data_dir / "input"
+    input_dir.mkdir(parents=True, exist_ok=True)
+    sv_files = {}
+    for i, start in enumerate(leg_starts):
+        # Offset of 30 s between legs: overlapping legs have no duplicate times
+        times = pd.Timestamp("2021-09-01") + pd.to_timedelta(start * 60 + 30 * i + 60 * np.arange(n_time), unit="s")
+        if i == shuffle_leg:
+            times = times[rng.permutation(n_time)]
+        xr.Dataset(
+            {"Sv": (("channel", "time", "depth"), rng.normal(-70, 5, (2, n_time, n_depth)).astype(np.float32))},
+            coords={"channel": [38., 70.], "time": times, "depth": np.arange(n_depth) + 0.5},
+        ).to_netcdf(input_dir / f"leg{i}.nc")
+        sv_files[f"leg{i}"] = {"leg_id": f"leg{i}", "file": f"leg{i}.nc"}
+
+    return {
+        "paths": {"input_dir": str(input_dir), "interim_dir": str(data_dir / "interim")},
+        "sv_files": sv_files,
+        "surveys": {"survey": list(sv_files)},
+    }
+
+
+def sorted_survey(config):
+    """Reference: legs concatenated and sorted by xarray."""
+    legs = [open_leg(Path(config["paths"]["input_dir"]) / f["file"], f["leg_id"]) for f in config["sv_files"].values()]
+    return xr.concat(legs, dim="time", data_vars="all").sortby("time")
+
+
+def test_legs_in_time_order():
+    times = lambda start, n=5: pd.date_range("2021-09-01", periods=n, freq="min") + pd.Timedelta(minutes=start)
+    assert legs_in_time_order([times(0), times(10), times(20)])
+    assert not legs_in_time_order([times(0), times(3)])                     # overlap
+    assert not legs_in_time_order([times(0), times(4, 1)])                 # same time
+    assert not legs_in_time_order([times(0)[::-1], times(10)])              # unsorted leg
+
+
+def test_load_survey_ds_sorts_overlapping_legs(tmp_path):
+    # Config order: leg1 starts before leg0, leg2 overlaps leg1, and leg0 is not sorted
+    config = write_legs(tmp_path, [100, 0, 30], shuffle_leg=0)
+    ds = load_survey_ds("survey", config)
+    expected = sorted_survey(config)
+    xr.testing.assert_identical(ds["Sv"].reset_coords(drop=True), expected["Sv"].reset_coords(drop=True))
+    np.testing.assert_array_equal(ds["leg"], expected["leg"])
+
+    # The sort permutation is persisted, and recomputed when the files change
+    order_path = tmp_path / "interim" / "survey" / "time_order.npz"
+    with np.load(order_path) as cached:
+        signature = cached["signature"]
+    np.savez(order_path, order=np.arange(ds.sizes["time"]), signature=signature)
+    assert not load_survey_ds("survey", config).indexes["time"].is_monotonic_increasing     # cached order is used
+
+    leg_path = tmp_path / "input" / "leg0.nc"
+    os.utime(leg_path, ns=(leg_path.stat().st_atime_ns, leg_path.stat().st_mtime_ns + 10**9))
+    assert load_survey_ds("survey", config).indexes["time"].is_monotonic_increasing
+
+
+def test_load_survey_ds_legs_in_order(tmp_path):
+    config = write_legs(tmp_path, [100, 0, 200])
+    ds = load_survey_ds("survey", config)
+    xr.testing.assert_identical(ds["Sv"].reset_coords(drop=True), sorted_survey(config)["Sv"].reset_coords(drop=True))
+    assert not (tmp_path / "interim" / "survey" / "time_order.npz").exists()
+
+
+def test_time_index(tmp_path):
+    config = write_legs(tmp_path, [100, 0, 30])
+    times = load_survey_ds("survey", config).indexes["time"]
+    time_index = get_time_index("survey", config)
+    np.testing.assert_array_equal(time_index.times, times)
+
+    lookups = times[[0, 17, 60, -1]] + pd.Timedelta(seconds=10)
+    np.testing.assert_array_equal(time_index.get_idx(lookups), times.searchsorted(lookups))
+    np.testing.assert_array_equal(time_index.get_nearest_idx(lookups), times.get_indexer(lookups, method="nearest"))
+    i = time_index.get_slice(times[10], times[40])
+    assert (i.start, i.stop) == (10, 41)
+    assert time_index.get_slice(end=times[5]) == slice(None, 6)
+
+    # Same survey name, other files: another index
+    other = write_legs(tmp_path / "other", [0], n_time=20)
+    assert len(get_time_index("survey", other)) == 20 and get_time_index("survey", config) is time_index
+    assert isinstance(time_index, TimeIndex)
+
+
+def test_apply_dropout_depths(sv):
+    assert apply_dropout_depths(sv, None) is sv
+
+    masked = apply_dropout_depths(sv, {200: 150, 120.: 250.5})
+    assert masked.dims == sv.dims and masked.shape == sv.shape
+    np.testing.assert_array_equal(masked["depth"], sv["depth"])
+
+    for channel, depth in [(38., None), (70., None), (120., 250.5), (200., 150)]:
+        masked_c, sv_c = masked.sel(channel=channel), sv.sel(channel=channel)
+        beyond = (sv["depth"] > depth) if depth is not None else np.zeros(sv.sizes["depth"], dtype=bool)
+        assert masked_c.isel(depth=np.flatnonzero(beyond)).isnull().all()
+        np.testing.assert_array_equal(masked_c.isel(depth=np.flatnonzero(~beyond)), sv_c.isel(depth=np.flatnonzero(~beyond)))
+
 
 if __name__ == "__main__":
     
@@ -8,4 +114,4 @@ if __name__ == "__main__":
     for survey in config["surveys"]:
         ds = load_survey_ds(survey, config)
         print()
-        print_file_infos(ds)
\ No newline at end of file
+        print_file_infos(ds)
@@ -0,0 +1,52 @@
+import numpy as np
+
+from escore import patches
+from escore.patches import export_patches, PatchDataset, window_mask
+from escore.apps.echotypes.processing import get_window
+
+
+CHANNELS = [38., 70., 120., 200.]
+
+
+def make_shapes(n_time, n_depth, n_shapes=12, seed=0):
+    rng = np.random.default_rng(seed)
+    shapes = []
+    for i in range(n_shapes):
+        t0, z0 = int(rng.integers(0, n_time - 60)), int(rng.integers(0, n_depth - 40))
+        points = [[t0, z0], [t0 + 60, z0 + 5], [t0 + 50, z0 + 40], [t0 + 5, z0 + 30]]
+        shapes.append({"id": f"roi_{i:02d}", "label": ["a", "b"][i % 2], "points": points,
+                       "it_min": t0, "it_max": t0 + 60, "iz_min": z0, "iz_max": z0 + 40})
+    shapes[0] = dict(shapes[0], points=[[1990, 280], [1999, 299], [1995, 285]], it_min=1990, it_max=1999, iz_min=280, iz_max=299)
+    return shapes
+
+
+def test_export_patches(sv, tmp_path, monkeypatch):
+    # Record the size of the Sv passed to each shard task
+    shard_sizes = []
+    write_shard = patches.write_shard
+    def recording_write_shard(shard_sv, *args, **kwargs):
+        shard_sizes.append(shard_sv.shape)
+        return write_shard(shard_sv, *args, **kwargs)
+    monkeypatch.setattr(patches, "write_shard", recording_write_shard)
+
+    shapes = make_shapes(sv.sizes["time"], sv.sizes["depth"])
+    index = export_patches(sv, shapes, tmp_path, window_shape=(64, 48), channels=CHANNELS, shard_size=5)
+    assert len(index) == 12 and index["shard"].nunique() == 3
+    assert all(size[1] < sv.sizes["time"] for size in shard_sizes)
+
+    dataset = PatchDataset(tmp_path, arrays=("sv", "delta_sv", "mask"))
+    shapes = {s["id"]: s for s in shapes}
+    for i in range(len(dataset)):
+        item = dataset[i]
+        shape = shapes[item["id"]]
+        window = get_window((shape["it_min"], shape["it_max"], shape["iz_min"], shape["iz_max"]),
+                            (sv.sizes["time"], sv.sizes["depth"]), window_shape=(64, 48))
+        xmin, xmax, ymin, ymax = window
+        # Windows at the survey end may overlap it (NaN)
+        expected = np.full((len(CHANNELS), 64, 48), np.nan, dtype=np.float32)
+        values = sv.sel(channel=CHANNELS).transpose("channel", "time", "depth").values[:, xmin:xmax+1, ymin:ymax+1]
+        expected[:, :values.shape[1], :values.shape[2]] = values
+        np.testing.assert_array_equal(item["sv"], expected)
+        np.testing.assert_array_equal(item["delta_sv"], expected[1:] - expected[[0]])
+        np.testing.assert_array_equal(item["mask"], window_mask(shape, np.array(window)))
+        assert item["label"] == shape["label"]
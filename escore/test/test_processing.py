@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from escore.apps.echotypes.processing import (get_window, get_windows, get_roi_Sv, stack_pixels, stratified_sample, cluster_roi, summarize_clusters,
+                                              grouped_quantiles, grouped_histograms, DELTA_SV_BIN_EDGES)
+
+
+SHAPE = {"points": [[200, 20], [700, 40], [650, 180], [230, 150]], "it_min": 200, "it_max": 700, "iz_min": 20, "iz_max": 180}
+DEEP_SHAPE = {"points": [[300, 200], [600, 200], [600, 290], [300, 290]], "it_min": 300, "it_max": 600, "iz_min": 200, "iz_max": 290}
+
+
+def test_get_windows_matches_get_window():
+    rng = np.random.default_rng(0)
+    array_shape = (1000, 300)
+    xmin, ymin = rng.integers(-5, array_shape[0], 200), rng.integers(-5, array_shape[1], 200)
+    bboxes = np.stack([xmin, xmin + rng.integers(0, 80, 200), ymin, ymin + rng.integers(0, 40, 200)], axis=1)
+    bboxes[:4] = [[0, 10, 0, 5], [990, 1000, 295, 300], [0, 999, 0, 299], [500, 500, 150, 150]]   # edges, full array
+
+    for kwargs in [{"padding": 0}, {"padding": 20}, {"window_shape": (256, 128)}, {"window_shape": (255, 127)},
+                   {"window_shape": (1, 1)}, {"window_shape": (101, 64)}]:
+        expected = [get_window(tuple(int(b) for b in bbox), array_shape, **kwargs) for bbox in bboxes]
+        np.testing.assert_array_equal(get_windows(bboxes, array_shape, **kwargs), expected, err_msg=str(kwargs))
+
+
+def test_grouped_reductions_match_numpy():
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, 10, size=(5000, 3))
+    labels = rng.integers(0, 4, size=5000)
+    labels[labels == 2] = 3         # empty group
+    q = np.array([0.05, 0.5, 0.95])
+
+    quantiles = grouped_quantiles(values, labels, 4, q)
+    counts = grouped_histograms(values, labels, 4)
+    assert np.isnan(quantiles[2]).all() and counts[2].sum() == 0
+    for g in [0, 1, 3]:
+        np.testing.assert_allclose(quantiles[g], np.quantile(values[labels == g], q, axis=0).T)
+        for c in range(3):
+            np.testing.assert_array_equal(counts[g, c], np.histogram(values[labels == g, c], DELTA_SV_BIN_EDGES)[0])
+
+
+def test_summarize_clusters_matches_masked_roi(sv):
+    roi_sv = get_roi_Sv(sv, SHAPE, [38., 70., 120., 200.])
+    labels_da, _, summary = cluster_roi(roi_sv, "Delta Sv", "KMeans", 3, ref_frequency=38., random_state=0,
+                                        summary=True)
+    assert int(summary["n_pixels"].sum()) == labels_da.attrs["n_pixels"]
+
+    # Pixels of each cluster, selected on the ROI Sv
+    labels = labels_da.reindex_like(roi_sv.isel(channel=0, drop=True))
+    for k in range(3):
+        sv_k = roi_sv.where(labels == k).stack(pixel=("time", "depth")).dropna("pixel").transpose("pixel", "channel").values.astype(np.float64)
+        delta_sv_k = sv_k[:, 1:] - sv_k[:, [0]]
+        assert int(summary["n_pixels"][k]) == len(sv_k)
+        np.testing.assert_allclose(summary["sv_mean"][k], sv_k.mean(axis=0), rtol=1e-6)
+        np.testing.assert_allclose(summary["delta_sv_mean"][k], delta_sv_k.mean(axis=0), rtol=1e-6, atol=1e-6)
+        np.testing.assert_allclose(summary["delta_sv_sd"][k], delta_sv_k.std(axis=0), rtol=1e-5)
+        np.testing.assert_allclose(summary["delta_sv_quantiles"][k], np.quantile(delta_sv_k, summary["quantile"], axis=0).T, rtol=1e-5, atol=1e-6)
+        np.testing.assert_array_equal(summary["delta_sv_hist"][k].sum("delta_sv_bin"),
+                                      ((delta_sv_k >= -50.) & (delta_sv_k <= 50.)).sum(axis=0))
+
+
+def test_summarize_clusters_values():
+    sv_values = np.array([[-70., -75., -80.], [-70., -73., -76.], [-60., -60., -60.]])
+    summary = summarize_clusters(sv_values, np.array([0, 0, 1]), 2, np.array([38., 70., 120.]), 38.)
+
+    np.testing.assert_array_equal(summary["n_pixels"], [2, 1])
+    np.testing.assert_allclose(summary["sv_mean"].sel(cluster=0), [-70., -74., -78.])
+    np.testing.assert_allclose(summary["delta_sv_mean"].sel(cluster=0), [-4., -8.])
+    np.testing.assert_allclose(summary["delta_sv_sd"].sel(cluster=0), [1., 2.])
+    np.testing.assert_allclose(summary["delta_sv_mean"].sel(cluster=1), [0., 0.])
+
+
+def test_cluster_roi_leaves_out_empty_channels(sv):
+    # 200 kHz is NaN over the whole ROI, beyond its dropout depth
+    roi_sv = get_roi_Sv(sv, DEEP_SHAPE, [38., 70., 120., 200.], dropout_depths={200.: 150})
+    labels_da, _, summary = cluster_roi(roi_sv, "Delta Sv", "KMeans", 3, ref_frequency=38., random_state=0, summary=True)
+    assert labels_da.attrs["channels"] == [38., 70., 120.]
+    assert labels_da.notnull().sum() == roi_sv.sel(channel=[38., 70., 120.]).notnull().all("channel").sum()
+    np.testing.assert_array_equal(summary.channel, [38., 70., 120.])
+
+    # No valid Sv on the reference channel
+    roi_sv = get_roi_Sv(sv, DEEP_SHAPE, [38., 70., 120., 200.], dropout_depths={38.: 150})
+    with pytest.raises(ValueError, match="reference channel"):
+        cluster_roi(roi_sv, "Delta Sv", "KMeans", 3, ref_frequency=38.)
+
+
+def test_stratified_sample():
+    rng = np.random.default_rng(0)
+    values = rng.normal(-70, 5, size=(400, 150, 2))
+    values[:200, :75] = np.nan             # empty quarter, and sparse pixels
+    values[rng.random(values.shape[:2]) < 0.2] = np.nan
+    X = stack_pixels(xr.DataArray(values, dims=("time", "depth", "channel"),
+                                  coords={"time": np.arange(400), "depth": np.arange(150), "channel": [38., 70.]}))
+    n_pixels = X.sizes["pixel"]
+
+    sample = stratified_sample(X, 5000, strata=(10, 10), random_state=0)
+    assert len(sample) == 5000 and (np.diff(sample) > 0).all()
+    np.testing.assert_array_equal(sample, stratified_sample(X, 5000, strata=(10, 10), random_state=0))
+    assert not np.array_equal(sample, stratified_sample(X, 5000, strata=(10, 10), random_state=1))
+    np.testing.assert_array_equal(stratified_sample(X, n_pixels + 1), np.arange(n_pixels))
+
+    # Each (time, depth) block gets its share of the valid pixels (rounded)
+    time, depth = X["time"].values, X["depth"].values
+    stratum = (time * 10 // 400) * 10 + depth * 10 // 150
+    counts, sampled = np.bincount(stratum, minlength=100), np.bincount(stratum[sample], minlength=100)
+    assert np.abs(sampled - 5000 * counts / n_pixels).max() < 1
+    assert sampled.reshape(10, 10)[:5, :5].sum() == 0
+
+
+def test_cluster_roi_fit_sample_matches_full_fit(sv):
+    from sklearn.metrics import adjusted_rand_score
+
+    roi_sv = get_roi_Sv(sv, SHAPE, [38., 70., 120., 200.])
+    full, _, _ = cluster_roi(roi_sv, "Delta Sv", "KMeans", 3, ref_frequency=38., random_state=0)
+    sampled, _, _ = cluster_roi(roi_sv, "Delta Sv", "KMeans", 3, ref_frequency=38., random_state=0,
+                                fit_sample_size=5000, report_stability=True)
+
+    assert sampled.attrs["n_fit_pixels"] == 5000 and full.attrs["n_fit_pixels"] == full.attrs["n_pixels"] > 5000
+    valid = full.notnull().values
+    np.testing.assert_array_equal(valid, sampled.notnull().values)
+    stability = adjusted_rand_score(full.values[valid], sampled.values[valid])
+    assert stability > 0.9
+    assert sampled.attrs["label_stability"] == pytest.approx(stability)
+    assert "label_stability" not in full.attrs
@@ -0,0 +1,26 @@
+import numpy as np
+
+from escore.apps.echotypes.propagation import LabelPropagator, get_labels_key
+
+
+def test_label_propagator(tmp_path):
+    def labels(n, progress):
+        for i in range(n):
+            progress((i + 1) / n)
+        return np.arange(n, dtype=np.int8)
+
+    def fail(progress):
+        raise RuntimeError("no Sv")
+
+    propagator = LabelPropagator(tmp_path / "labels")
+    key, failed_key = get_labels_key(roi_id="a", n=10), get_labels_key(roi_id="b")
+    assert propagator.status(key) == ("pending", None) and propagator.load(key) is None
+
+    propagator.submit(key, labels, 10)
+    propagator.submit(failed_key, fail)
+    propagator.shutdown()
+
+    assert propagator.status(key) == ("ready", None)
+    np.testing.assert_array_equal(propagator.load(key), np.arange(10))
+    assert propagator.status(failed_key) == ("failed", "no Sv")
+    assert sorted(p.name for p in (tmp_path / "labels").iterdir()) == [f"{key}.npy"]
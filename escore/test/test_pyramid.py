@@ -0,0 +1,37 @@
+import json
+import numpy as np
+
+from escore.pyramid import build_pyramid, pool_sv, SvPyramid
+
+
+def test_build_pyramid_levels(sv, tmp_path):
+    paths = build_pyramid(sv, tmp_path, factor=2, min_size=400)
+
+    # 2000 -> 1000 -> 500 ESDUs, the next level would be under min_size
+    assert [p.name for p in paths] == ["level_1.nc", "level_2.nc"]
+    with open(tmp_path / "pyramid.json") as f:
+        meta = json.load(f)
+    assert meta["n_levels"] == 2 and meta["factor"] == [2, 2] and meta["shape"] == [2000, 300]
+
+    pyramid = SvPyramid(sv, tmp_path)
+    assert len(pyramid) == 3
+    assert pyramid.levels[2].sizes["time"] == 500 and pyramid.levels[2].sizes["depth"] == 75
+
+    # Each level is the mean pooling of the previous one
+    expected = pool_sv(pool_sv(sv.isel(time=slice(0, 400)), 2), 2)
+    np.testing.assert_allclose(pyramid.levels[2].isel(time=slice(0, 100)).values, expected.values, rtol=1e-5)
+
+
+def test_pyramid_get_window(sv, tmp_path):
+    build_pyramid(sv, tmp_path, factor=2, min_size=400)
+    pyramid = SvPyramid(sv, tmp_path)
+
+    window, scale = pyramid.get_window((100, 1099, 0, 299), display_shape=(400, 100))
+    assert scale == (2, 2)
+    assert window.sizes["time"] == 500 and window.sizes["depth"] == 150
+
+
+def test_pyramid_without_levels(sv, tmp_path):
+    pyramid = SvPyramid(sv, tmp_path / "missing")
+    window, scale = pyramid.get_window((0, 99, 0, 49), display_shape=(10, 10))
+    assert len(pyramid) == 1 and scale == (1, 1) and window.sizes["time"] == 100
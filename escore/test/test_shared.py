@@ -0,0 +1,84 @@
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from escore.shared import SharedRegionManager, attach
+
+
+ATTACH_SUM = "import sys, numpy as np; from escore.shared import attach\nwith attach(sys.argv[1]) as shared: print(float(np.nansum(shared.array)))"
+
+
+def test_shared_array_round_trip(sv):
+    with SharedRegionManager() as manager:
+        window = (100, 399, 10, 209)
+        name = manager.share_window(sv, window, channels=[38., 70., 120.])
+        assert manager.share_window(sv, window, channels=[38., 70., 120.]) == name and manager.refs(name) == 2
+        expected = sv.isel(time=slice(100, 400), depth=slice(10, 210)).sel(channel=[38., 70., 120.]).values
+
+        with attach(name) as shared:
+            np.testing.assert_array_equal(shared.array, expected)
+            assert not shared.array.flags.writeable
+
+        # An unrelated process attaches it, its exit must not unlink the block
+        for _ in range(2):
+            out = subprocess.run([sys.executable, "-c", ATTACH_SUM, name], capture_output=True, text=True, check=True)
+            assert float(out.stdout) == pytest.approx(float(np.nansum(expected)))
+            assert "leaked" not in out.stderr
+
+        with attach(name) as shared:
+            np.testing.assert_array_equal(shared.array, expected)
+
+        manager.release(name)
+        manager.release(name)
+        assert manager.refs(name) == 0
+        with pytest.raises(ValueError, match="no reference"):
+            manager.release(name)
+
+    with pytest.raises(FileNotFoundError):
+        attach(name)
+
+
+def test_views_must_not_outlive_attach():
+    with SharedRegionManager() as manager:
+        name = manager.share_array("a", np.arange(12.).reshape(3, 4))
+        shared = attach(name)
+        row = shared.array[1]
+        with pytest.raises(BufferError, match="still referenced"):
+            shared.close()
+        del row
+        shared.shm.close()
+        manager.release(name)
+
+
+def test_eviction():
+    loads = []
+
+    def loader(value):
+        return lambda: loads.append(value) or np.full(100, value, dtype=np.uint8)
+
+    with SharedRegionManager(max_bytes=250) as manager:
+        a = manager.share("a", loader(1))
+        b = manager.share("b", loader(2))
+        manager.release(b)
+        # Unreferenced blocks stay cached
+        assert manager.share("b", loader(2)) == b and loads == [1, 2]
+        manager.release(b)
+
+        # Least recently used unreferenced blocks are evicted to fit under max_bytes
+        c = manager.share("c", loader(3))
+        assert manager.nbytes == 200 and set(manager._names) == {a, c}
+        with pytest.raises(FileNotFoundError):
+            attach(b)
+
+        # Referenced blocks are never evicted: the manager goes over budget
+        d = manager.share("d", loader(4))
+        assert manager.nbytes == 300 and set(manager._names) == {a, c, d}
+        for name, value in ((a, 1), (c, 3), (d, 4)):
+            with attach(name) as shared:
+                assert (shared.array == value).all()
+
+        manager.release(a)
+        e = manager.share("e", loader(5))
+        assert manager.nbytes == 300 and set(manager._names) == {c, d, e}
@@ -0,0 +1,44 @@
+import pytest
+from flask import Flask
+
+from escore.pyramid import SvPyramid
+from escore.tiles import TileRenderer
+from escore.apps.echotypes.tiles import register_tile_routes
+
+
+@pytest.fixture(scope="module")
+def client(sv, tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("tiles")
+    server = Flask(__name__)
+    register_tile_routes(server, TileRenderer(SvPyramid(sv), tile_size=256), tmp_path / "registry.db", tmp_path)
+    return server.test_client()
+
+
+def test_get_tile(client):
+    response = client.get("/tiles/0/1/0.png")
+    assert response.status_code == 200 and response.mimetype == "image/png"
+    assert response.data[:8] == b"\x89PNG\r\n\x1a\n"
+
+    assert client.get("/tiles/0/0/0.png?channels=38&cmap=viridis&vmin=-80&vmax=-40").status_code == 200
+
+
+@pytest.mark.parametrize("url", [
+    "/tiles/1/0/0.png",             # no pyramid level 1
+    "/tiles/0/8/0.png",             # 2000 ESDUs: 8 tiles of 256
+    "/tiles/0/0/2.png",             # 300 depth samples: 2 tiles
+])
+def test_get_tile_not_found(client, url):
+    assert client.get(url).status_code == 404
+
+
+@pytest.mark.parametrize("query", [
+    "channels=abc",
+    "channels=38,70,333",           # not a survey channel
+    "channels=38,70",               # RGB needs 3 channels
+    "channels=38&cmap=not_a_cmap",
+    "channels=38,70,120&cmap=viridis",
+    "vmin=abc",
+    "vmin=-50&vmax=-90",
+])
+def test_get_tile_bad_request(client, query):
+    assert client.get(f"/tiles/0/0/0.png?{query}").status_code == 400
@@ -0,0 +1,98 @@
+from pathlib import Path
+import os
+from collections import OrderedDict
+from threading import Lock, get_ident
+import hashlib
+import io
+import numpy as np
+
+from escore.builder import sv_array2image
+from escore.pyramid import SvPyramid
+
+
+# Echogram tiles rendered on demand from the levels of an SvPyramid
+# Tile (level, t_tile, z_tile) covers indices [t_tile*tile_size, (t_tile+1)*tile_size) x [z_tile*tile_size, ...)
+# of pyramid level `level`. Tiles are cached in memory (LRU) and as PNG files in cache_dir.
+
+def get_tiles_dir(config: dict, ei: str) -> Path:
+    return Path(config["paths"]["interim_dir"]) / ei / "tiles"
+
+
+class TileRenderer:
+    def __init__(
+        self,
+        pyramid: SvPyramid,
+        cache_dir: Path | None = None,
+        tile_size: int = 256,
+        max_cached_tiles: int = 512,
+    ):
+        self.pyramid = pyramid
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.tile_size = tile_size
+        self.max_cached_tiles = max_cached_tiles
+
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+        # Tiles of a rebuilt pyramid must not be served from the disk cache
+        shapes = [tuple(level.shape) for level in pyramid.levels]
+        self.fingerprint = hashlib.sha256(str((pyramid.factor, shapes)).encode()).hexdigest()[:12]
+
+    def n_tiles(self, level: int) -> tuple[int, int]:
+        sv = self.pyramid.levels[level]
+        return -(-sv.sizes["time"] // self.tile_size), -(-sv.sizes["depth"] // self.tile_size)
+
+    def tile_key(self, level, t_tile, z_tile, vmin, vmax, channels, echogram_cmap):
+        channels = [channels] if np.isscalar(channels) else list(channels)
+        freqs = "_".join(str(int(c)) for c in channels)
+        return f"{self.fingerprint}_{echogram_cmap}_{freqs}kHz_Sv{vmin}-{vmax}_L{level}_T{t_tile}_Z{z_tile}"
+
+    def render(self, level, t_tile, z_tile, vmin=-90., vmax=-50., channels=(38, 70, 120), echogram_cmap="RGB") -> bytes:
+        """PNG bytes of a tile, with the same Sv to colour mapping as the image datasets (see `sv_array2image`).
+
+        Tiles on the bottom and right borders of the survey are padded with NaN (rendered black).
+        """
+        sv = self.pyramid.levels[level]
+        n = self.tile_size
+        t0, z0 = t_tile * n, z_tile * n
+
+        channels = channels if np.isscalar(channels) else list(channels)
+        sv_array = sv.isel(time=slice(t0, t0 + n), depth=slice(z0, z0 + n)).sel(channel=channels).values
+
+        # Pad border tiles to the full tile size
+        pad = [(0, 0)] * (sv_array.ndim - 2) + [(0, n - sv_array.shape[-2]), (0, n - sv_array.shape[-1])]
+        sv_array = np.pad(sv_array, pad, constant_values=np.nan)
+
+        img = sv_array2image(sv_array, vmin, vmax, echogram_cmap)
+        buffer = io.BytesIO()
+        img.save(buffer, format="png")
+        return buffer.getvalue()
+
+    def get(self, level, t_tile, z_tile, vmin=-90., vmax=-50., channels=(38, 70, 120), echogram_cmap="RGB") -> bytes:
+        """Cached tile: memory LRU first, then disk, then rendered.
+        """
+        key = self.tile_key(level, t_tile, z_tile, vmin, vmax, channels, echogram_cmap)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        path = self.cache_dir / f"{key}.png" if self.cache_dir is not None else None
+        if path is not None and path.is_file():
+            png = path.read_bytes()
+        else:
+            png = self.render(level, t_tile, z_tile, vmin, vmax, channels, echogram_cmap)
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(f".{os.getpid()}_{get_ident()}.tmp")   # unique per worker and thread
+                tmp_path.write_bytes(png)
+                tmp_path.replace(path)      # atomic: concurrent readers never see partial files
+
+        with self._lock:
+            self._cache[key] = png
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached_tiles:
+                self._cache.popitem(last=False)
+
+        return png
@@ -1,7 +1,5 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import xarray as xr
-import sqlite3
 
 
 def sv2array(sv:xr.DataArray, time_idx_slice=slice(0, 100), depth_idx_slice=slice(0, 100), channels:int|tuple[int, int, int]=(38, 70, 120)):
@@ -34,8 +32,11 @@ def get_mask_from_points(a, points, xmin, ymin):
     # Assume points represent a rectangle
 
 
-def plot_shape(sv, shape, outfile, padding=10, frequencies=[38, 70, 120]):
+def plot_shape(sv, shape, outfile, padding=10, frequencies=[38, 70, 120], display_cube=None):
     """Save the RGB echogram of an ROI shape.
+
+    The echogram is sliced from `display_cube` when given (a `DisplayCube` of sv for the same frequencies and
+    a (-90, -50) dB contrast), instead of being read and normalized from sv.
     """
     # Fetch shape points
     points = np.array(shape["points"])
@@ -47,12 +48,17 @@ def plot_shape(sv, shape, outfile, padding=10, frequencies=[38, 70, 120]):
     xmin, ymin = max(xmin, 0), max(ymin, 0)
     xmax, ymax = min(xmax, len(sv.time)), min(ymax, len(sv.depth))
 
-    # Slice sv using bbox
-    roi_sv = sv.isel(time=slice(xmin, xmax), depth=slice(ymin, ymax)).sel(channel=frequencies)
+    if display_cube is not None:
+        sv_array = display_cube.window(xmin, xmax-1, ymin, ymax-1)
+    else:
+        # Slice sv using bbox
+        roi_sv = sv.isel(time=slice(xmin, xmax), depth=slice(ymin, ymax)).sel(channel=frequencies)
+
+        # Turn into image format array
+        sv_array = roi_sv.values
+        sv_array = normalize_sv_array(sv_array, vmin=-90, vmax=-50)
 
-    # Turn into image format array
-    sv_array = roi_sv.values
-    sv_array = normalize_sv_array(sv_array, vmin=-90, vmax=-50)
+    import matplotlib.pyplot as plt     # imported at first use (slow import)
 
     fig, ax = plt.subplots(layout='constrained')
 
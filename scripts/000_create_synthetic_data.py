@@ -0,0 +1,55 @@
+"""
+Write a synthetic survey (netCDF files in paths.input_dir) described by the `synthetic` section of a config file,
+to test the whole pipeline at production scale without the real data.
+Optionally writes labelme ROIs around the planted layers, as a labelling session of the image dataset.
+"""
+
+from pathlib import Path
+import argparse
+import yaml
+
+from escore.config import load_config
+from escore.synthetic import SyntheticSurveyConfig, write_synthetic_survey, write_labelme_rois
+
+
+if __name__ == '__main__':
+
+    # Parse config argument
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="scripts/config_synthetic.yml", help="Path to config file")
+    parser.add_argument("--scale", type=float, default=None, help="Survey size, as a fraction of a production survey (overrides synthetic.n_time)")
+    args = parser.parse_args()
+
+    # Load config
+    config = load_config(args.config)
+    syn_config = dict(config["synthetic"])
+    survey = syn_config.pop("survey")
+    rois_config = syn_config.pop("rois", None)
+    if args.scale is not None:
+        syn_config.pop("n_time", None)
+        syn_config["scale"] = args.scale
+
+    cfg = SyntheticSurveyConfig.from_dict(syn_config)
+    print(f"Writing synthetic survey {survey}: {cfg.n_time} ESDUs x {cfg.n_depth} depth samples x {len(cfg.channels)} channels")
+
+    sections = write_synthetic_survey(cfg, input_dir=Path(config["paths"]["input_dir"]), survey=survey)
+
+    # ROIs, named after the frame images of the image dataset
+    if rois_config is not None:
+        img_config = config["image_dataset"]
+        json_dir = Path(config["session"]["images_dir"]) / ('ROI_' + config["session"]["name"])
+        write_labelme_rois(cfg, json_dir, ei=survey,
+                           n_rois=rois_config["n_rois"],
+                           roi_width=rois_config["roi_width"],
+                           time_frame_size=img_config["time_frame_size"],
+                           z_min_idx=img_config["z_min_idx"],
+                           z_max_idx=img_config["z_max_idx"],
+                           vmin=img_config["vmin"],
+                           vmax=img_config["vmax"])
+        print(f"ROIs written in {json_dir}")
+
+    # Config sections matching the written files
+    print(yaml.safe_dump(sections, sort_keys=False))
+
+else:
+    print("⚠ This file must be run directly, not imported as a module.")
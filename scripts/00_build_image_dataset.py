@@ -6,6 +6,12 @@ from pathlib import Path
 from escore.builder import DatasetConfig, build_dataset
 import argparse
 from escore.config import load_config
+from escore.instrument import configure_from_config
+from escore.io import load_survey_ds
+from escore.catalog import SurveyCatalog
+from escore.pyramid import build_pyramid, get_pyramid_dir
+from escore.execution import ExecutionConfig, execution_context
+from escore.display import build_display_cube, get_display_dir, get_display_cube_configs
 
 
 if __name__ == '__main__':
@@ -17,8 +23,15 @@ if __name__ == '__main__':
 
     # Load config
     config = load_config(args.config)
+    configure_from_config(config)    # optional timing instrumentation
     img_config = config["image_dataset"]
 
+    # Check the surveys to build with the metadata catalog (no data read)
+    with SurveyCatalog.from_config(config) as catalog:
+        errors = catalog.validate(config, img_config["ei_list"])
+    if errors:
+        raise ValueError("Invalid config:" + "".join(f"\n * {e}" for e in errors))
+
     # Set the DatasetConfig before building the Dataset
     dataset_config = DatasetConfig(time_frame_size=img_config["time_frame_size"],
                                     vmin=img_config["vmin"], 
@@ -26,15 +39,48 @@ if __name__ == '__main__':
                                     z_min_idx=img_config["z_min_idx"],
                                     z_max_idx=img_config["z_max_idx"], 
                                     frequencies=img_config["frequencies"], 
-                                    echogram_cmap=img_config["echogram_cmap"])
-
-    # Build Dataset
-    build_dataset(
-        dataset_config=dataset_config, 
-        global_config=config,
-        ei_list=img_config["ei_list"], 
-        root_path=Path(config["paths"]["echogram_images_dir"])
-    )
+                                    echogram_cmap=img_config["echogram_cmap"],
+                                    image_format=img_config.get("image_format", "png"),
+                                    compress_level=img_config.get("compress_level"),
+                                    fast_encode=img_config.get("fast_encode", False),
+                                    dropout_depths=img_config.get("dropout_depths"))
+
+    # Dask scheduler of the dataset and pyramid computations
+    execution_config = ExecutionConfig.from_config(config)
+
+    with execution_context(execution_config):
+        # Build Dataset
+        build_dataset(
+            dataset_config=dataset_config, 
+            global_config=config,
+            ei_list=img_config["ei_list"], 
+            root_path=Path(config["paths"]["echogram_images_dir"]),
+            execution_config=execution_config
+        )
+
+        # Build the multi-resolution Sv pyramid of each survey (opt-in, defaults of `build_pyramid`)
+        pyramid_config = config.get("pyramid", {})
+        if pyramid_config.get("enabled", False):
+            pyramid_options = {"factor": pyramid_config.get("factor"),
+                               "how": pyramid_config.get("pooling"),
+                               "min_size": pyramid_config.get("min_size")}
+            for ei in img_config["ei_list"]:
+                print(f"Building Sv pyramid of {ei}")
+                build_pyramid(sv=load_survey_ds(survey=ei, config=config)["Sv"],
+                              pyramid_dir=get_pyramid_dir(config, ei),
+                              **{k: v for k, v in pyramid_options.items() if v is not None})
+
+        # Display cubes of each survey, for the contrast settings of the echo-types app and ROI plots (opt-in)
+        for cube_config in get_display_cube_configs(config):
+            for ei in img_config["ei_list"]:
+                print(f"Building display cube of {ei} ({cube_config})")
+                build_display_cube(sv=load_survey_ds(survey=ei, config=config)["Sv"],
+                                   display_dir=get_display_dir(config, ei),
+                                   ei=ei,
+                                   vmin=cube_config["vmin"],
+                                   vmax=cube_config["vmax"],
+                                   channels=cube_config["frequencies"],
+                                   execution_config=execution_config)
     
 else:
     print("⚠ This file must be run directly, not imported as a module.")
\ No newline at end of file
@@ -6,9 +6,11 @@ import argparse
 from tqdm import tqdm
 
 from escore.config import load_config
+from escore.instrument import configure_from_config
 from escore.io import load_survey_ds
 from escore.registry import add_shape_ids, ROIRegistry
 from escore.visualize import plot_shape
+from escore.display import get_display_dir, open_display_cubes, find_display_cube
 
 
 def main(config):
@@ -64,13 +66,18 @@ def main(config):
     ds = load_survey_ds(survey=config["session"]["ei"], config=config)
     sv = ds["Sv"]
 
+    # ROI plots are sliced from the display cube of the survey, if built (00_build_image_dataset.py)
+    frequencies = config["session"]["roi_plots"]["frequencies"]
+    display_cube = find_display_cube(open_display_cubes(get_display_dir(config, config["session"]["ei"])), -90., -50., frequencies)
+
     print(f"\nPlotting {len(roi_shapes)} ROIs to - {plot_dir}")
     for shape in tqdm(roi_shapes, desc="ROIs"):
         outfile = plot_dir / f"{shape['id']}.png"
 
         plot_shape(sv, shape, outfile, 
                    padding=config["session"]["roi_plots"]["padding"],
-                   frequencies=config["session"]["roi_plots"]["frequencies"])
+                   frequencies=frequencies,
+                   display_cube=display_cube)
 
 
 if __name__ == '__main__':
@@ -84,6 +91,7 @@ if __name__ == '__main__':
 
     # Load config
     config = load_config(args.config)
+    configure_from_config(config)    # optional timing instrumentation
 
     # Execute main
     main(config)
@@ -2,32 +2,15 @@ from pathlib import Path
 import argparse
 
 from escore.config import load_config
-from escore.io import load_survey_ds
-from escore.registry import ROIRegistry
-from escore.apps.echotypes.app import create_app
+from escore.instrument import configure_from_config
+from escore.apps.echotypes.wsgi import build_app
 
 
 def main(config):
 
-    # Fetch config for paths
-    interim_dir = Path(config["paths"]["interim_dir"])
-    session_name = config["session"]["name"]
-    ei = config["session"]["ei"]
-
-    # Derive paths
-    work_dir = interim_dir / ei / session_name
-    registry_path = work_dir / "roi_registry.db"
-
-    # Fetch one ROI from registry
-    with ROIRegistry(db_path=registry_path, root_path=HERE) as registry:
-        roi_ids = registry.list_ids()
-
-    # Load sv
-    ds = load_survey_ds(survey=config["session"]["ei"], config=config)
-    sv = ds["Sv"]
-
-    # Create and run Dash app   
-    app = create_app(sv, registry_path, HERE, roi_ids)
+    # Create and run Dash app (single process development server, see escore.apps.echotypes.wsgi for multiple workers)
+    # The survey is opened lazily, with its multi-resolution pyramid and display cubes if built (00_build_image_dataset.py)
+    app = build_app(config, root_path=HERE)
     app.run(debug=True)
 
 
@@ -42,6 +25,7 @@ if __name__ == '__main__':
     
     # Load config
     config = load_config(args.config)
+    configure_from_config(config)    # optional timing instrumentation
 
     # Execute main
     main(config)
@@ -0,0 +1,64 @@
+"""
+Export the valid ROIs of the session registry as a sharded dataset of fixed-size Sv / ΔSv patches with their masks
+and labels, for ML training (see escore.patches).
+"""
+
+from pathlib import Path
+import argparse
+
+from escore.config import load_config
+from escore.instrument import configure_from_config
+from escore.io import load_survey_ds
+from escore.registry import ROIRegistry
+from escore.execution import ExecutionConfig, execution_context
+from escore.patches import export_patches, get_patches_dir
+
+
+def main(config):
+
+    # Fetch config for paths
+    interim_dir = Path(config["paths"]["interim_dir"])
+    session_name = config["session"]["name"]
+    ei = config["session"]["ei"]
+    patches_config = config.get("patches", {})     # optional, defaults of `export_patches`
+
+    # Derive paths
+    work_dir = interim_dir / ei / session_name
+    registry_path = work_dir / "roi_registry.db"
+    out_dir = get_patches_dir(config)
+
+    # Valid ROIs of the session
+    with ROIRegistry(db_path=registry_path, root_path=HERE) as registry:
+        shapes = registry.fetch_valid()
+
+    sv = load_survey_ds(survey=ei, config=config)["Sv"]
+
+    print(f"Exporting {len(shapes)} ROI patches to - {out_dir}")
+    with execution_context(ExecutionConfig.from_config(config)):
+        patches_options = {"window_shape": patches_config.get("window_shape"),
+                           "channels": patches_config.get("frequencies"),
+                           "ref_frequency": patches_config.get("ref_frequency"),
+                           "delta_sv": patches_config.get("delta_sv"),
+                           "shard_size": patches_config.get("shard_size")}
+        if patches_options["window_shape"] is not None:
+            patches_options["window_shape"] = tuple(patches_options["window_shape"])
+        index = export_patches(sv, shapes, out_dir, **{k: v for k, v in patches_options.items() if v is not None})
+
+    print(f"{len(index)} patches in {index['shard'].nunique()} shards, {int(index['cropped'].sum())} ROIs larger than the patches (cropped masks)")
+
+
+if __name__ == '__main__':
+
+    HERE = Path(__file__).resolve().parent.parent
+
+    # Parse config argument
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="scripts/config.yml", help="Path to config file")
+    args = parser.parse_args()
+
+    # Load config
+    config = load_config(args.config)
+    configure_from_config(config)    # optional timing instrumentation
+
+    # Execute main
+    main(config)
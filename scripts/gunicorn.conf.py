@@ -0,0 +1,19 @@
+"""
+gunicorn settings of the echo-types app, from the `echotypes_app.server` section of the config in ESCORE_CONFIG:
+
+    ESCORE_CONFIG=scripts/config.yml gunicorn -c scripts/gunicorn.conf.py "escore.apps.echotypes.wsgi:create_server()"
+"""
+import os
+
+from escore.config import load_config
+
+
+server_config = load_config(os.environ.get("ESCORE_CONFIG", "scripts/config.yml")).get("echotypes_app", {}).get("server", {})
+
+bind = server_config.get("bind", "127.0.0.1:8050")
+workers = server_config.get("workers", 4)
+threads = server_config.get("threads", 2)
+timeout = server_config.get("timeout", 120)
+
+# Apps are built in each worker after fork: HDF5 file handles of the survey can't be shared across processes
+preload_app = False